@@ -21,6 +21,7 @@ CREATE TABLE SesionesClientes (
     FechaInicio DATETIME DEFAULT GETDATE(),
     FechaCierre DATETIME NULL, -- A�adido para registrar el cierre de sesi�n
     IP NVARCHAR(50),
+    Token NVARCHAR(64) NULL, -- Identificador de la sesión incluido en el token firmado
     FOREIGN KEY (ClienteID) REFERENCES Clientes(ClienteID)
 );
 
@@ -35,13 +36,20 @@ CREATE TABLE Administradores (
 INSERT INTO Administradores (NombreUsuario, Contrasena)
 VALUES ('admin', 'admin');
 
+-- Sesiones sin fila en SesionesClientes (administradores) cerradas antes de vencer
+CREATE TABLE SesionesRevocadas (
+    Token NVARCHAR(64) PRIMARY KEY, -- Identificador de la sesión incluido en el token firmado
+    Expira DATETIME NOT NULL -- Desde aquí el token ya no es válido por sí solo y la fila se puede borrar
+);
+
 -- Tabla Productos
 CREATE TABLE Productos (
     ProductoID INT PRIMARY KEY IDENTITY(1,1),
     Nombre NVARCHAR(100) NOT NULL,
     Precio DECIMAL(10, 2) NOT NULL,
     Stock INT NOT NULL,
-    Imagen NVARCHAR(255) -- Columna para almacenar la ruta de la imagen
+    Imagen NVARCHAR(255), -- Columna para almacenar la ruta de la imagen
+    Version ROWVERSION -- Cambia en cada INSERT/UPDATE; la API la usa para detectar cambios del catálogo
 );
 
 -- Tabla AuditoriaCRUD
@@ -93,10 +101,108 @@ CREATE TABLE Ventas (
     FOREIGN KEY (PedidoID) REFERENCES Pedidos(PedidoID)
 );
 
+-- Totales acumulados de Ventas por producto, mantenidos por RegistrarPedido y CancelarPedido
+CREATE TABLE ResumenVentasProducto (
+    NombreProducto NVARCHAR(100) PRIMARY KEY,
+    TotalVendido INT NOT NULL DEFAULT 0,
+    TotalCompra DECIMAL(18, 2) NOT NULL DEFAULT 0
+);
+
+-- Reservas temporales de stock; el stock reservado ya está descontado de Productos
+CREATE TABLE ReservasStock (
+    ReservaID INT PRIMARY KEY IDENTITY(1,1),
+    ClienteID INT NOT NULL,
+    ProductoID INT NOT NULL,
+    Cantidad INT NOT NULL,
+    Expira DATETIME NOT NULL,
+    FOREIGN KEY (ClienteID) REFERENCES Clientes(ClienteID),
+    FOREIGN KEY (ProductoID) REFERENCES Productos(ProductoID)
+    ON DELETE CASCADE
+);
+
+-- Pedidos por día y producto para las gráficas (ProductoID 0 = producto eliminado)
+CREATE TABLE ResumenPedidosDia (
+    Fecha DATE NOT NULL,
+    ProductoID INT NOT NULL,
+    Pedidos INT NOT NULL DEFAULT 0,
+    Unidades INT NOT NULL DEFAULT 0,
+    Total DECIMAL(18, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (Fecha, ProductoID)
+);
+
 -- �ndices
 CREATE INDEX idx_Productos_nombres ON Productos(Nombre);
+CREATE INDEX idx_Productos_version ON Productos(Version);
 CREATE INDEX idx_Cliente_email ON Clientes(CorreoElectronico);
 CREATE INDEX idx_Pedidos_fechaPedido ON Pedidos(FechaCompra);
+CREATE UNIQUE INDEX idx_SesionesClientes_token ON SesionesClientes(Token) WHERE Token IS NOT NULL;
+CREATE INDEX idx_SesionesClientes_fechaInicio ON SesionesClientes(FechaInicio);
+CREATE INDEX idx_Ventas_fechaVenta ON Ventas(FechaVenta);
+CREATE INDEX idx_ReservasStock_expira ON ReservasStock(Expira);
+CREATE INDEX idx_SesionesRevocadas_expira ON SesionesRevocadas(Expira);
+GO
+
+-- Procedimiento Almacenado para Asentar un pedido cuyo stock ya se descontó
+-- (lo usan RegistrarPedido y ConfirmarReserva dentro de su propia transacción).
+-- Los datos del cliente y del producto que no se reciban se leen de sus tablas.
+DROP PROCEDURE IF EXISTS AsentarPedido;
+GO
+CREATE PROCEDURE AsentarPedido
+    @ClienteID INT,
+    @ProductoID INT,
+    @Cantidad INT,
+    @NombreUsuario NVARCHAR(50) = NULL,
+    @NombreProducto NVARCHAR(100) = NULL,
+    @Precio DECIMAL(10, 2) = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    -- Insertar el pedido
+    DECLARE @FechaCompra DATETIME = GETDATE();
+    INSERT INTO Pedidos (ClienteID, ProductoID, Cantidad, FechaCompra)
+    VALUES (@ClienteID, @ProductoID, @Cantidad, @FechaCompra);
+
+    -- Obtener el ID del nuevo pedido
+    DECLARE @NuevoPedidoID INT;
+    SELECT @NuevoPedidoID = SCOPE_IDENTITY();
+
+    -- Obtener detalles del cliente y producto
+    DECLARE @TotalCompra DECIMAL(10, 2);
+
+    IF @NombreUsuario IS NULL
+        SELECT @NombreUsuario = NombreUsuario FROM Clientes WHERE ClienteID = @ClienteID;
+    IF @NombreProducto IS NULL OR @Precio IS NULL
+        SELECT @NombreProducto = Nombre, @Precio = Precio FROM Productos WHERE ProductoID = @ProductoID;
+    SET @TotalCompra = @Cantidad * @Precio;
+
+    -- Insertar la venta
+    INSERT INTO Ventas (ClienteID, NombreUsuario, NombreProducto, Cantidad, TotalCompra, FechaVenta, PedidoID)
+    VALUES (@ClienteID, @NombreUsuario, @NombreProducto, @Cantidad, @TotalCompra, @FechaCompra, @NuevoPedidoID);
+
+    -- Acumular en el resumen de ventas (UPDLOCK/SERIALIZABLE evita dos INSERT del mismo producto)
+    UPDATE ResumenVentasProducto WITH (UPDLOCK, SERIALIZABLE)
+    SET TotalVendido = TotalVendido + @Cantidad,
+        TotalCompra = TotalCompra + @TotalCompra
+    WHERE NombreProducto = @NombreProducto;
+
+    IF @@ROWCOUNT = 0
+        INSERT INTO ResumenVentasProducto (NombreProducto, TotalVendido, TotalCompra)
+        VALUES (@NombreProducto, @Cantidad, @TotalCompra);
+
+    -- Acumular en el resumen diario de pedidos
+    UPDATE ResumenPedidosDia WITH (UPDLOCK, SERIALIZABLE)
+    SET Pedidos = Pedidos + 1,
+        Unidades = Unidades + @Cantidad,
+        Total = Total + @TotalCompra
+    WHERE Fecha = CAST(@FechaCompra AS DATE) AND ProductoID = @ProductoID;
+
+    IF @@ROWCOUNT = 0
+        INSERT INTO ResumenPedidosDia (Fecha, ProductoID, Pedidos, Unidades, Total)
+        VALUES (CAST(@FechaCompra AS DATE), @ProductoID, 1, @Cantidad, @TotalCompra);
+
+    SELECT @NuevoPedidoID AS PedidoID, @TotalCompra AS TotalCompra;
+END
 GO
 
 -- Procedimiento Almacenado para Registrar Pedido
@@ -105,52 +211,261 @@ GO
 CREATE PROCEDURE RegistrarPedido
     @ClienteID INT,
     @ProductoID INT,
-    @Cantidad INT
+    @Cantidad INT,
+    @NombreUsuario NVARCHAR(50) = NULL  -- La API lo envía desde la sesión para no leer Clientes
 AS
 BEGIN
     SET NOCOUNT ON;
+    SET XACT_ABORT ON;
     BEGIN TRY
         BEGIN TRANSACTION;
-        
-        DECLARE @StockActual INT;
-        SELECT @StockActual = Stock FROM Productos WHERE ProductoID = @ProductoID;
-        
-        IF @StockActual < @Cantidad
+
+        -- Descuento condicional y atómico: solo bloquea la fila del producto durante el UPDATE,
+        -- y dos compras simultáneas no pueden dejar el stock en negativo.
+        -- El mismo UPDATE devuelve el nombre y el precio, sin volver a leer la fila.
+        DECLARE @NombreProducto NVARCHAR(100), @Precio DECIMAL(10, 2);
+        UPDATE Productos
+        SET @NombreProducto = Nombre,
+            @Precio = Precio,
+            Stock = Stock - @Cantidad
+        WHERE ProductoID = @ProductoID AND Stock >= @Cantidad;
+
+        IF @@ROWCOUNT = 0
         BEGIN
+            IF NOT EXISTS (SELECT 1 FROM Productos WHERE ProductoID = @ProductoID)
+                THROW 50002, 'Producto no encontrado.', 1;
             THROW 50001, 'Stock insuficiente para realizar el pedido.', 1;
         END
 
-        -- Insertar el pedido
-        INSERT INTO Pedidos (ClienteID, ProductoID, Cantidad, FechaCompra)
-        VALUES (@ClienteID, @ProductoID, @Cantidad, GETDATE());
+        EXEC AsentarPedido @ClienteID = @ClienteID, @ProductoID = @ProductoID, @Cantidad = @Cantidad,
+            @NombreUsuario = @NombreUsuario, @NombreProducto = @NombreProducto, @Precio = @Precio;
 
-        -- Obtener el ID del nuevo pedido
-        DECLARE @NuevoPedidoID INT;
-        SELECT @NuevoPedidoID = SCOPE_IDENTITY();
+        COMMIT TRANSACTION;
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0
+            ROLLBACK TRANSACTION;
+        THROW;
+    END CATCH;
+END
+GO
+
+-- Procedimiento Almacenado para Reservar stock por un tiempo limitado (por ejemplo, mientras se arma un carrito).
+-- El stock se descuenta al reservar; ConfirmarReserva lo convierte en pedido y LiberarReservasVencidas lo devuelve.
+DROP PROCEDURE IF EXISTS ReservarStock;
+GO
+CREATE PROCEDURE ReservarStock
+    @ClienteID INT,
+    @ProductoID INT,
+    @Cantidad INT,
+    @Segundos INT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    BEGIN TRY
+        BEGIN TRANSACTION;
 
-        -- Actualizar el stock
         UPDATE Productos
         SET Stock = Stock - @Cantidad
-        WHERE ProductoID = @ProductoID;
+        WHERE ProductoID = @ProductoID AND Stock >= @Cantidad;
 
-        -- Obtener detalles del cliente y producto
-        DECLARE @NombreUsuario NVARCHAR(50);
-        DECLARE @NombreProducto NVARCHAR(100);
-        DECLARE @Precio DECIMAL(10, 2);
-        DECLARE @TotalCompra DECIMAL(10, 2);
+        IF @@ROWCOUNT = 0
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM Productos WHERE ProductoID = @ProductoID)
+                THROW 50002, 'Producto no encontrado.', 1;
+            THROW 50001, 'Stock insuficiente para realizar la reserva.', 1;
+        END
+
+        INSERT INTO ReservasStock (ClienteID, ProductoID, Cantidad, Expira)
+        OUTPUT inserted.ReservaID, inserted.ProductoID, inserted.Cantidad, inserted.Expira
+        VALUES (@ClienteID, @ProductoID, @Cantidad, DATEADD(SECOND, @Segundos, GETDATE()));
+
+        COMMIT TRANSACTION;
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0
+            ROLLBACK TRANSACTION;
+        THROW;
+    END CATCH;
+END
+GO
+
+-- Procedimiento Almacenado para Confirmar una reserva vigente como pedido
+DROP PROCEDURE IF EXISTS ConfirmarReserva;
+GO
+CREATE PROCEDURE ConfirmarReserva
+    @ReservaID INT,
+    @ClienteID INT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    BEGIN TRY
+        BEGIN TRANSACTION;
+
+        -- Tomar la reserva con un DELETE: si otra petición o el barrido ya la tomó, no se encuentra
+        DECLARE @Reserva TABLE (ProductoID INT, Cantidad INT);
+        DELETE FROM ReservasStock
+        OUTPUT deleted.ProductoID, deleted.Cantidad INTO @Reserva
+        WHERE ReservaID = @ReservaID AND ClienteID = @ClienteID AND Expira > GETDATE();
+
+        IF @@ROWCOUNT = 0
+            THROW 50003, 'La reserva no existe o ha vencido.', 1;
 
+        DECLARE @ProductoID INT, @Cantidad INT;
+        SELECT @ProductoID = ProductoID, @Cantidad = Cantidad FROM @Reserva;
+
+        EXEC AsentarPedido @ClienteID = @ClienteID, @ProductoID = @ProductoID, @Cantidad = @Cantidad;
+
+        COMMIT TRANSACTION;
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0
+            ROLLBACK TRANSACTION;
+        THROW;
+    END CATCH;
+END
+GO
+
+-- Procedimiento Almacenado para Liberar reservas y devolver su stock.
+-- Con @ReservaID libera esa reserva del cliente; sin él, un lote de reservas vencidas.
+DROP PROCEDURE IF EXISTS LiberarReservas;
+GO
+CREATE PROCEDURE LiberarReservas
+    @ReservaID INT = NULL,
+    @ClienteID INT = NULL,
+    @Lote INT = 500
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    BEGIN TRY
+        BEGIN TRANSACTION;
+
+        DECLARE @Liberadas TABLE (ProductoID INT, Cantidad INT);
+        IF @ReservaID IS NOT NULL
+            DELETE FROM ReservasStock
+            OUTPUT deleted.ProductoID, deleted.Cantidad INTO @Liberadas
+            WHERE ReservaID = @ReservaID AND ClienteID = @ClienteID;
+        ELSE
+            -- READPAST: varios workers pueden barrer a la vez sin esperarse entre sí
+            DELETE TOP (@Lote) FROM ReservasStock WITH (READPAST)
+            OUTPUT deleted.ProductoID, deleted.Cantidad INTO @Liberadas
+            WHERE Expira <= GETDATE();
+
+        UPDATE p
+        SET Stock = p.Stock + l.Cantidad
+        FROM Productos p
+        JOIN (SELECT ProductoID, SUM(Cantidad) AS Cantidad FROM @Liberadas GROUP BY ProductoID) l
+            ON p.ProductoID = l.ProductoID;
+
+        COMMIT TRANSACTION;
+
+        SELECT COUNT(*) AS Liberadas FROM @Liberadas;
+    END TRY
+    BEGIN CATCH
+        IF @@TRANCOUNT > 0
+            ROLLBACK TRANSACTION;
+        THROW;
+    END CATCH;
+END
+GO
+
+-- Procedimiento Almacenado para Registrar varios pedidos (un carrito) en una sola transacción.
+-- pymssql no admite parámetros con valores de tabla, así que las líneas llegan como JSON:
+-- [{"producto_id": 1, "cantidad": 2}, ...]
+DROP PROCEDURE IF EXISTS RegistrarPedidoCarrito;
+GO
+CREATE PROCEDURE RegistrarPedidoCarrito
+    @ClienteID INT,
+    @Lineas NVARCHAR(MAX)
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    BEGIN TRY
+        BEGIN TRANSACTION;
+
+        DECLARE @Carrito TABLE (ProductoID INT PRIMARY KEY, Cantidad INT NOT NULL);
+        INSERT INTO @Carrito (ProductoID, Cantidad)
+        SELECT ProductoID, SUM(Cantidad)
+        FROM OPENJSON(@Lineas) WITH (ProductoID INT '$.producto_id', Cantidad INT '$.cantidad')
+        GROUP BY ProductoID;
+
+        -- Descontar el stock de todas las líneas a la vez; solo se actualizan las que tienen stock suficiente
+        DECLARE @Productos TABLE (ProductoID INT PRIMARY KEY, Nombre NVARCHAR(100), Precio DECIMAL(10, 2));
+        UPDATE p
+        SET Stock = p.Stock - c.Cantidad
+        OUTPUT inserted.ProductoID, inserted.Nombre, inserted.Precio INTO @Productos
+        FROM Productos p
+        JOIN @Carrito c ON p.ProductoID = c.ProductoID
+        WHERE p.Stock >= c.Cantidad;
+
+        DECLARE @Actualizados INT = @@ROWCOUNT;
+        IF @Actualizados <> (SELECT COUNT(*) FROM @Carrito)
+        BEGIN
+            -- Un producto borrado después de validar el carrito no es falta de stock
+            IF EXISTS (SELECT 1 FROM @Carrito c WHERE NOT EXISTS (SELECT 1 FROM Productos p WHERE p.ProductoID = c.ProductoID))
+                THROW 50002, 'Producto no encontrado.', 1;
+            THROW 50001, 'Stock insuficiente para realizar el pedido.', 1;
+        END
+
+        -- Insertar los pedidos
+        DECLARE @FechaCompra DATETIME = GETDATE();
+        DECLARE @Pedidos TABLE (PedidoID INT PRIMARY KEY, ProductoID INT, Cantidad INT);
+        INSERT INTO Pedidos (ClienteID, ProductoID, Cantidad, FechaCompra)
+        OUTPUT inserted.PedidoID, inserted.ProductoID, inserted.Cantidad INTO @Pedidos
+        SELECT @ClienteID, ProductoID, Cantidad, @FechaCompra
+        FROM @Carrito;
+
+        -- Insertar las ventas
+        DECLARE @NombreUsuario NVARCHAR(50);
         SELECT @NombreUsuario = NombreUsuario FROM Clientes WHERE ClienteID = @ClienteID;
-        SELECT @NombreProducto = Nombre, @Precio = Precio FROM Productos WHERE ProductoID = @ProductoID;
-        SET @TotalCompra = @Cantidad * @Precio;
 
-        -- Insertar la venta
         INSERT INTO Ventas (ClienteID, NombreUsuario, NombreProducto, Cantidad, TotalCompra, FechaVenta, PedidoID)
-        VALUES (@ClienteID, @NombreUsuario, @NombreProducto, @Cantidad, @TotalCompra, GETDATE(), @NuevoPedidoID);
+        SELECT @ClienteID, @NombreUsuario, pr.Nombre, pe.Cantidad, pe.Cantidad * pr.Precio, @FechaCompra, pe.PedidoID
+        FROM @Pedidos pe
+        JOIN @Productos pr ON pe.ProductoID = pr.ProductoID;
+
+        -- Acumular en los resúmenes
+        MERGE ResumenVentasProducto WITH (HOLDLOCK) AS r
+        USING (
+            SELECT pr.Nombre AS NombreProducto, SUM(pe.Cantidad) AS Cantidad, SUM(pe.Cantidad * pr.Precio) AS Total
+            FROM @Pedidos pe
+            JOIN @Productos pr ON pe.ProductoID = pr.ProductoID
+            GROUP BY pr.Nombre
+        ) AS v
+        ON r.NombreProducto = v.NombreProducto
+        WHEN MATCHED THEN
+            UPDATE SET TotalVendido = r.TotalVendido + v.Cantidad, TotalCompra = r.TotalCompra + v.Total
+        WHEN NOT MATCHED THEN
+            INSERT (NombreProducto, TotalVendido, TotalCompra) VALUES (v.NombreProducto, v.Cantidad, v.Total);
+
+        MERGE ResumenPedidosDia WITH (HOLDLOCK) AS r
+        USING (
+            SELECT pe.ProductoID, pe.Cantidad, pe.Cantidad * pr.Precio AS Total
+            FROM @Pedidos pe
+            JOIN @Productos pr ON pe.ProductoID = pr.ProductoID
+        ) AS d
+        ON r.Fecha = CAST(@FechaCompra AS DATE) AND r.ProductoID = d.ProductoID
+        WHEN MATCHED THEN
+            UPDATE SET Pedidos = r.Pedidos + 1, Unidades = r.Unidades + d.Cantidad, Total = r.Total + d.Total
+        WHEN NOT MATCHED THEN
+            INSERT (Fecha, ProductoID, Pedidos, Unidades, Total)
+            VALUES (CAST(@FechaCompra AS DATE), d.ProductoID, 1, d.Cantidad, d.Total);
 
         COMMIT TRANSACTION;
+
+        -- Pedidos creados
+        SELECT pe.PedidoID, pe.ProductoID, pr.Nombre, pe.Cantidad, pe.Cantidad * pr.Precio AS TotalCompra
+        FROM @Pedidos pe
+        JOIN @Productos pr ON pe.ProductoID = pr.ProductoID
+        ORDER BY pe.PedidoID;
     END TRY
     BEGIN CATCH
-        ROLLBACK TRANSACTION;
+        IF @@TRANCOUNT > 0
+            ROLLBACK TRANSACTION;
         THROW;
     END CATCH;
 END
@@ -173,6 +488,26 @@ BEGIN
         FROM Pedidos
         WHERE PedidoID = @PedidoID;
 
+        -- Descontar del resumen las ventas que se eliminan
+        UPDATE r
+        SET TotalVendido = r.TotalVendido - v.Cantidad,
+            TotalCompra = r.TotalCompra - v.TotalCompra
+        FROM ResumenVentasProducto r
+        JOIN (
+            SELECT NombreProducto, SUM(Cantidad) AS Cantidad, SUM(TotalCompra) AS TotalCompra
+            FROM Ventas
+            WHERE PedidoID = @PedidoID
+            GROUP BY NombreProducto
+        ) v ON r.NombreProducto = v.NombreProducto;
+
+        UPDATE r
+        SET Pedidos = r.Pedidos - 1,
+            Unidades = r.Unidades - p.Cantidad,
+            Total = r.Total - ISNULL((SELECT SUM(v.TotalCompra) FROM Ventas v WHERE v.PedidoID = p.PedidoID), 0)
+        FROM ResumenPedidosDia r
+        JOIN Pedidos p ON r.Fecha = CAST(p.FechaCompra AS DATE) AND r.ProductoID = ISNULL(p.ProductoID, 0)
+        WHERE p.PedidoID = @PedidoID;
+
         -- Eliminar las ventas relacionadas con el pedido
         DELETE FROM Ventas
         WHERE PedidoID = @PedidoID;
@@ -190,7 +525,72 @@ BEGIN
 END
 GO
 
--- Trigger para Auditoria de Productos
+-- Procedimiento Almacenado para Reconciliar el resumen de ventas con la tabla Ventas
+DROP PROCEDURE IF EXISTS ReconciliarResumenVentas;
+GO
+CREATE PROCEDURE ReconciliarResumenVentas
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    MERGE ResumenVentasProducto WITH (HOLDLOCK) AS r
+    USING (
+        SELECT NombreProducto, SUM(Cantidad) AS TotalVendido, SUM(TotalCompra) AS TotalCompra
+        FROM Ventas
+        GROUP BY NombreProducto
+    ) AS v
+    ON r.NombreProducto = v.NombreProducto
+    WHEN MATCHED AND (r.TotalVendido <> v.TotalVendido OR r.TotalCompra <> v.TotalCompra) THEN
+        UPDATE SET TotalVendido = v.TotalVendido, TotalCompra = v.TotalCompra
+    WHEN NOT MATCHED BY TARGET THEN
+        INSERT (NombreProducto, TotalVendido, TotalCompra)
+        VALUES (v.NombreProducto, v.TotalVendido, v.TotalCompra)
+    WHEN NOT MATCHED BY SOURCE THEN
+        DELETE;
+
+    SELECT @@ROWCOUNT AS FilasCorregidas;
+END
+GO
+
+-- Procedimiento Almacenado para Reconciliar el resumen diario de pedidos con Pedidos y Ventas
+DROP PROCEDURE IF EXISTS ReconciliarResumenPedidosDia;
+GO
+CREATE PROCEDURE ReconciliarResumenPedidosDia
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    MERGE ResumenPedidosDia WITH (HOLDLOCK) AS r
+    USING (
+        SELECT CAST(p.FechaCompra AS DATE) AS Fecha, ISNULL(p.ProductoID, 0) AS ProductoID,
+               COUNT(*) AS Pedidos, SUM(p.Cantidad) AS Unidades, ISNULL(SUM(v.TotalCompra), 0) AS Total
+        FROM Pedidos p
+        LEFT JOIN (
+            SELECT PedidoID, SUM(TotalCompra) AS TotalCompra FROM Ventas GROUP BY PedidoID
+        ) v ON v.PedidoID = p.PedidoID
+        GROUP BY CAST(p.FechaCompra AS DATE), ISNULL(p.ProductoID, 0)
+    ) AS d
+    ON r.Fecha = d.Fecha AND r.ProductoID = d.ProductoID
+    WHEN MATCHED AND (r.Pedidos <> d.Pedidos OR r.Unidades <> d.Unidades OR r.Total <> d.Total) THEN
+        UPDATE SET Pedidos = d.Pedidos, Unidades = d.Unidades, Total = d.Total
+    WHEN NOT MATCHED BY TARGET THEN
+        INSERT (Fecha, ProductoID, Pedidos, Unidades, Total)
+        VALUES (d.Fecha, d.ProductoID, d.Pedidos, d.Unidades, d.Total)
+    WHEN NOT MATCHED BY SOURCE THEN
+        DELETE;
+
+    SELECT @@ROWCOUNT AS FilasCorregidas;
+END
+GO
+
+-- Carga inicial de los resúmenes a partir de los datos existentes
+EXEC ReconciliarResumenVentas;
+EXEC ReconciliarResumenPedidosDia;
+GO
+
+-- Trigger para Auditoria de Productos: una fila por cada producto afectado, en un solo INSERT
+DROP TRIGGER IF EXISTS DisparadorAuditoriaProductos;
+GO
 CREATE TRIGGER DisparadorAuditoriaProductos
 ON Productos
 AFTER INSERT, UPDATE, DELETE
@@ -198,29 +598,21 @@ AS
 BEGIN
     SET NOCOUNT ON;
 
-    DECLARE @Operacion NVARCHAR(10);
-    DECLARE @RegistroID INT;
-    DECLARE @Usuario NVARCHAR(50);
-
-    IF EXISTS (SELECT * FROM inserted) AND EXISTS (SELECT * FROM deleted)
-    BEGIN
-        SET @Operacion = 'UPDATE';
-        SELECT @RegistroID = ProductoID FROM inserted;
-    END
-    ELSE IF EXISTS (SELECT * FROM inserted)
-    BEGIN
-        SET @Operacion = 'INSERT';
-        SELECT @RegistroID = ProductoID FROM inserted;
-    END
-    ELSE IF EXISTS (SELECT * FROM deleted)
-    BEGIN
-        SET @Operacion = 'DELETE';
-        SELECT @RegistroID = ProductoID FROM deleted;
-    END
-
-    SET @Usuario = SYSTEM_USER; -- Esto asume que el nombre de usuario es el usuario del sistema ejecutando la operaci�n
+    -- Con inserted y deleted se distingue la operación de cada fila; si la sentencia
+    -- no afectó filas (por ejemplo, un UPDATE condicional sin stock) no se inserta nada
     INSERT INTO AuditoriaCRUD (TipoOperacion, Tabla, RegistroID, Usuario, Fecha)
-    VALUES (@Operacion, 'Productos', @RegistroID, @Usuario, GETDATE());
+    SELECT
+        CASE
+            WHEN i.ProductoID IS NOT NULL AND d.ProductoID IS NOT NULL THEN 'UPDATE'
+            WHEN i.ProductoID IS NOT NULL THEN 'INSERT'
+            ELSE 'DELETE'
+        END,
+        'Productos',
+        COALESCE(i.ProductoID, d.ProductoID),
+        SYSTEM_USER, -- Esto asume que el nombre de usuario es el usuario del sistema ejecutando la operación
+        GETDATE()
+    FROM inserted i
+    FULL OUTER JOIN deleted d ON i.ProductoID = d.ProductoID;
 END
 GO
 
@@ -0,0 +1,161 @@
+import os
+from datetime import date, datetime, timedelta
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()
+
+# Periodos como máximo en una serie (con granularity=day y un rango de siglos serían cientos de miles)
+ANALYTICS_MAX_PERIODS = int(os.getenv('ANALYTICS_MAX_PERIODS', '1000'))
+
+# Mapeo de los números de los meses a nombres en español
+meses_espanol = {
+    1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
+    5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
+    9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
+}
+
+
+def _siguiente_mes(fecha):
+    return date(fecha.year + 1, 1, 1) if fecha.month == 12 else date(fecha.year, fecha.month + 1, 1)
+
+
+def _restar_dias(fecha, dias):
+    try:
+        return fecha - timedelta(days=dias)
+    except OverflowError:
+        return date.min
+
+
+def _restar_meses(fecha, meses):
+    total = fecha.year * 12 + fecha.month - 1 - meses
+    return date(total // 12, total % 12 + 1, 1) if total >= 12 else date.min
+
+
+class Granularidad:
+    def __init__(self, sql, inicio, siguiente, retroceder, etiqueta):
+        self.sql = sql  # Expresión SQL del inicio del periodo a partir de Fecha
+        self.inicio = inicio  # Misma expresión en Python
+        self.siguiente = siguiente  # Inicio del periodo siguiente
+        self.retroceder = retroceder  # Inicio del periodo n lugares antes (sin bajar de date.min)
+        self.etiqueta = etiqueta  # Texto para el eje de la gráfica
+
+
+# Las semanas empiezan en lunes (1900-01-01 fue lunes)
+GRANULARIDADES = {
+    "day": Granularidad(
+        "Fecha",
+        lambda fecha: fecha,
+        lambda fecha: fecha + timedelta(days=1),
+        _restar_dias,
+        lambda fecha: fecha.strftime("%d/%m/%Y"),
+    ),
+    "week": Granularidad(
+        "DATEADD(DAY, -(DATEDIFF(DAY, '19000101', Fecha) % 7), Fecha)",
+        lambda fecha: fecha - timedelta(days=fecha.weekday()),
+        lambda fecha: fecha + timedelta(days=7),
+        lambda fecha, n: _restar_dias(fecha, 7 * n),
+        lambda fecha: f"Semana del {fecha.strftime('%d/%m/%Y')}",
+    ),
+    "month": Granularidad(
+        "DATEFROMPARTS(YEAR(Fecha), MONTH(Fecha), 1)",
+        lambda fecha: fecha.replace(day=1),
+        _siguiente_mes,
+        _restar_meses,
+        lambda fecha: f"{meses_espanol[fecha.month]} {fecha.year}",
+    ),
+    "year": Granularidad(
+        "DATEFROMPARTS(YEAR(Fecha), 1, 1)",
+        lambda fecha: fecha.replace(month=1, day=1),
+        lambda fecha: date(fecha.year + 1, 1, 1),
+        lambda fecha, n: date(max(fecha.year - n, 1), 1, 1),
+        lambda fecha: str(fecha.year),
+    ),
+}
+
+
+def elegir_granularidad(nombre):
+    granularidad = GRANULARIDADES.get(nombre)
+    if granularidad is None:
+        raise HTTPException(status_code=400, detail=f"Granularidad no válida: {nombre} (use {', '.join(GRANULARIDADES)})")
+    return granularidad
+
+
+def _periodos(granularidad, primero, ultimo):
+    # Inicios de periodo consecutivos entre primero y ultimo (incluidos)
+    periodos = []
+    periodo = primero
+    while periodo <= ultimo:
+        if len(periodos) >= ANALYTICS_MAX_PERIODS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"El rango pedido tiene más de {ANALYTICS_MAX_PERIODS} periodos; use un rango menor o una granularidad mayor"
+            )
+        periodos.append(periodo)
+        periodo = granularidad.siguiente(periodo)
+    return periodos
+
+
+def _como_fecha(valor):
+    # pymssql puede devolver DATE como date o como datetime
+    return valor.date() if isinstance(valor, datetime) else valor
+
+
+class AnaliticaPedidos:
+    """Series de pedidos por periodo leídas de ResumenPedidosDia.
+
+    El resumen diario por producto lo mantienen ``RegistrarPedido`` y las
+    cancelaciones; aquí solo se agrupa por semana, mes o año (una consulta
+    sobre la clave primaria Fecha, ProductoID) y se rellenan con ceros los
+    periodos sin pedidos para que el eje de la gráfica sea continuo.
+    """
+
+    def __init__(self, bd):
+        self._bd = bd
+
+    async def series(self, granularidad, desde=None, hasta=None):
+        """Devuelve ``(periodos, filas)``.
+
+        ``periodos`` es la lista ordenada de inicios de periodo entre
+        ``desde`` (incluido) y ``hasta`` (excluido); ``filas`` son tuplas
+        ``(periodo, producto_id, pedidos, unidades, total)``. Sin ``desde``
+        se leen solo los últimos ``ANALYTICS_MAX_PERIODS`` periodos hasta
+        ``hasta`` (u hoy); con ``desde``, un rango de más periodos responde
+        400 antes de consultar.
+        """
+        # El rango se acota antes de consultar: sin extremos la agregación recorrería toda la tabla
+        tope = granularidad.inicio((hasta or date.today() + timedelta(days=1)) - timedelta(days=1))
+        if desde is None:
+            minimo = granularidad.retroceder(tope, ANALYTICS_MAX_PERIODS - 1)
+        else:
+            _periodos(granularidad, granularidad.inicio(desde), tope)
+            minimo = desde
+
+        condiciones = ["Fecha >= %s"]
+        params = [minimo]
+        if hasta is not None:
+            condiciones.append("Fecha < %s")
+            params.append(hasta)
+        where = f"WHERE {' AND '.join(condiciones)}"
+        query = f"""
+        /* analitica.series */
+        SELECT {granularidad.sql} AS Periodo, ProductoID,
+               SUM(Pedidos) AS Pedidos, SUM(Unidades) AS Unidades, SUM(Total) AS Total
+        FROM ResumenPedidosDia
+        {where}
+        GROUP BY {granularidad.sql}, ProductoID
+        HAVING SUM(Pedidos) > 0
+        ORDER BY Periodo;
+        """
+        resultado = await self._bd.fetch(query, tuple(params), coalescer=True)
+        filas = [
+            (_como_fecha(fila['Periodo']), fila['ProductoID'], fila['Pedidos'], fila['Unidades'], fila['Total'])
+            for fila in resultado
+        ]
+
+        # Periodos consecutivos, incluidos los que no tienen pedidos
+        primero = granularidad.inicio(desde) if desde is not None else (filas[0][0] if filas else None)
+        ultimo = granularidad.inicio(hasta - timedelta(days=1)) if hasta is not None else (filas[-1][0] if filas else None)
+        periodos = _periodos(granularidad, primero, ultimo) if primero is not None and ultimo is not None else []
+        return periodos, filas
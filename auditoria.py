@@ -0,0 +1,121 @@
+import os
+import asyncio
+import logging
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuración del registro de auditoría
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '400'))  # Filas por INSERT
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', '1'))  # Segundos máximos que espera un evento
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', '10000'))  # Eventos en cola antes de frenar a quien registra
+
+# SQL Server admite como máximo 2100 parámetros por sentencia (5 por fila)
+_MAX_FILAS_INSERT = 2100 // 5
+
+
+class EscritorAuditoria:
+    """Escribe los eventos de AuditoriaCRUD por lotes desde una cola en memoria.
+
+    ``registrar()`` solo encola el evento (con su fecha); una tarea en
+    segundo plano los inserta con un INSERT de varias filas cuando junta
+    ``tamano_lote`` eventos o pasa ``intervalo`` segundos desde el primero
+    pendiente. Si la cola se llena, ``registrar()`` espera a que haya sitio
+    (contrapresión). ``cerrar()`` escribe lo pendiente antes de terminar.
+    """
+
+    def __init__(self, bd, tamano_lote=AUDIT_BATCH_SIZE, intervalo=AUDIT_FLUSH_INTERVAL,
+                 max_cola=AUDIT_QUEUE_SIZE):
+        self._bd = bd
+        self.tamano_lote = max(1, min(tamano_lote, _MAX_FILAS_INSERT))
+        self.intervalo = intervalo
+        self.max_cola = max_cola
+        self._cola = None
+        self._tarea = None
+        self._lote = []  # Eventos ya sacados de la cola que todavía no se están insertando
+        self._insercion = None
+
+    def iniciar(self):
+        self._cola = asyncio.Queue(maxsize=self.max_cola)
+        self._tarea = asyncio.create_task(self._escribir())
+
+    async def cerrar(self):
+        if self._tarea is None:
+            return
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None
+        # Lo que quedó a medio juntar o en la cola se escribe antes de cerrar el pool
+        try:
+            if self._insercion is not None and not self._insercion.done():
+                await self._insercion
+            lote, self._lote = self._lote, []
+            while lote or not self._cola.empty():
+                await self._insertar(self._sacar_lote(lote))
+                lote = []
+        except Exception as e:
+            logger.error(f"No se pudieron escribir los eventos de auditoría pendientes: {e}")
+        self._cola = None
+
+    async def registrar(self, tipo_operacion, tabla, registro_id, usuario):
+        evento = (tipo_operacion, tabla, registro_id, usuario, datetime.now())
+        if self._cola is None:
+            # Sin la tarea en marcha (por ejemplo, fuera del ciclo de vida de la app) se escribe directo
+            await self._insertar([evento])
+            return
+        await self._cola.put(evento)
+
+    @property
+    def pendientes(self):
+        return self._cola.qsize() if self._cola is not None else 0
+
+    def _sacar_lote(self, lote):
+        while len(lote) < self.tamano_lote and not self._cola.empty():
+            lote.append(self._cola.get_nowait())
+        return lote
+
+    async def _escribir(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = self._lote = [await self._cola.get()]
+            limite = loop.time() + self.intervalo
+            while len(lote) < self.tamano_lote:
+                self._sacar_lote(lote)
+                restante = limite - loop.time()
+                if len(lote) >= self.tamano_lote or restante <= 0:
+                    break
+                # asyncio.timeout y no wait_for: en Python 3.11 wait_for se traga la cancelación
+                # si get() termina en el mismo instante, y cerrar() quedaría esperando para siempre
+                try:
+                    async with asyncio.timeout(restante):
+                        lote.append(await self._cola.get())
+                except TimeoutError:
+                    break
+            self._lote = []
+            # Protegida para que cerrar() pueda esperarla en lugar de perder el lote
+            self._insercion = asyncio.ensure_future(self._insertar(lote))
+            try:
+                await asyncio.shield(self._insercion)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"No se pudieron escribir {len(lote)} eventos de auditoría: {e}")
+
+    async def _insertar(self, lote):
+        if not lote:
+            return
+        valores = ", ".join(["(%s, %s, %s, %s, %s)"] * len(lote))
+        query = f"""
+        /* auditoria.insertar_lote */
+        INSERT INTO AuditoriaCRUD (TipoOperacion, Tabla, RegistroID, Usuario, Fecha)
+        VALUES {valores};
+        """
+        params = tuple(valor for evento in lote for valor in evento)
+        await self._bd.execute(query, params)
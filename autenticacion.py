@@ -0,0 +1,84 @@
+from starlette.routing import Route
+
+from sesiones import token_de_scope
+
+PAGINA_LOGIN = "/CargaLogin.html"
+
+
+def publica(endpoint):
+    """Marca un endpoint como accesible sin sesión.
+
+    Se pone debajo del decorador de la ruta::
+
+        @app.get("/productos")
+        @publica
+        async def obtener_productos(...):
+    """
+    endpoint.publica = True
+    return endpoint
+
+
+class TablaRutas:
+    """Qué peticiones no necesitan sesión, compilado una vez a partir de las rutas de la app.
+
+    Las rutas sin parámetros quedan en un conjunto de (método, ruta); las
+    que tienen parámetros usan la expresión regular que ya compiló
+    Starlette; los prefijos (montajes como ``/imgs/``) se comparan con un
+    solo ``str.startswith``.
+    """
+
+    def __init__(self, rutas, prefijos_publicos=()):
+        self.exactas = set()
+        self.con_parametros = []
+        self.prefijos = tuple(prefijos_publicos)
+        for ruta in rutas:
+            if not isinstance(ruta, Route) or not getattr(ruta.endpoint, "publica", False):
+                continue
+            metodos = set(ruta.methods or ())
+            if "GET" in metodos:
+                metodos.add("HEAD")
+            if ruta.param_convertors:
+                self.con_parametros.append((frozenset(metodos), ruta.path_regex))
+            else:
+                self.exactas.update((metodo, ruta.path) for metodo in metodos)
+
+    def es_publica(self, metodo, ruta):
+        if (metodo, ruta) in self.exactas or ruta.startswith(self.prefijos):
+            return True
+        return any(metodo in metodos and patron.match(ruta) for metodos, patron in self.con_parametros)
+
+
+class MiddlewareAutenticacion:
+    """Resuelve la sesión de cada petición y redirige al login las que la necesitan y no la tienen.
+
+    Es un middleware ASGI puro: no crea un Request ni envuelve la
+    respuesta, solo deja la sesión en ``scope["state"]["sesion"]`` (lo que
+    lee ``request.state.sesion``). Las rutas públicas se declaran en los
+    propios endpoints con ``@publica``; la tabla se compila en la primera
+    petición, cuando la app ya tiene todas sus rutas. Las peticiones
+    OPTIONS pasan sin sesión para que CORSMiddleware responda el preflight.
+    """
+
+    def __init__(self, app, almacen, router, prefijos_publicos=()):
+        self.app = app
+        self._almacen = almacen
+        self._router = router
+        self._prefijos_publicos = prefijos_publicos
+        self._tabla = None
+        self._cabeceras_redireccion = [(b"location", PAGINA_LOGIN.encode()), (b"content-length", b"0")]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self._tabla is None:
+            self._tabla = TablaRutas(self._router.routes, self._prefijos_publicos)
+
+        sesion = await self._almacen.obtener(token_de_scope(scope))
+        scope.setdefault("state", {})["sesion"] = sesion
+        metodo = scope["method"]
+        if sesion is None and metodo != "OPTIONS" and not self._tabla.es_publica(metodo, scope["path"]):
+            await send({"type": "http.response.start", "status": 307, "headers": self._cabeceras_redireccion})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await self.app(scope, receive, send)
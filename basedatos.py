@@ -0,0 +1,572 @@
+import os
+import re
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, asynccontextmanager
+from functools import lru_cache
+
+import pymssql
+from dotenv import load_dotenv
+
+from metricas import registro
+from bitacora import bitacora
+
+load_dotenv()
+
+# Cargar las variables de entorno
+server = os.getenv('DB_SERVER')
+database = os.getenv('DB_DATABASE')
+username = os.getenv('DB_USERNAME')
+password = os.getenv('DB_PASSWORD')
+
+# Configuración del pool de conexiones
+POOL_MIN = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+POOL_MAX = int(os.getenv('DB_POOL_MAX_SIZE', '20'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))  # Segundos de espera por una conexión libre
+POOL_MAX_INACTIVIDAD = float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300'))  # Cerrar conexiones ociosas
+POOL_MAX_VIDA = float(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))  # Reciclar conexiones viejas
+POOL_VERIFICAR_TRAS = float(os.getenv('DB_POOL_HEALTHCHECK_INTERVAL', '30'))  # Ping si estuvo ociosa más tiempo
+
+
+DURACION_CONSULTAS = registro.histograma(
+    "db_duracion_consulta_segundos", "Tiempo de ejecución de cada consulta (sin la espera por conexión)", ("consulta",)
+)
+ESPERA_POOL = registro.histograma(
+    "db_espera_pool_segundos", "Espera por un cupo de conexión del pool antes de cada operación"
+)
+ERRORES_CONEXION = registro.contador(
+    "db_errores_conexion_total", "Conexiones que no se pudieron abrir o que quedaron rotas", ("tipo",)
+)
+
+
+class PoolAgotado(Exception):
+    pass
+
+
+_ETIQUETA = re.compile(r"^\s*/\*\s*([\w.:-]+)\s*\*/")
+_VERBO = re.compile(r"^\s*(?:/\*.*?\*/)?\s*(EXEC(?:UTE)?|SELECT|INSERT|UPDATE|DELETE|MERGE|WITH)[\s(]+(\w+)",
+                    re.IGNORECASE | re.DOTALL)
+_TABLA = re.compile(r"\b(?:FROM|INTO|MERGE)\s+(\w+)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def nombre_consulta(query):
+    """Nombre estable de una consulta para métricas y registros.
+
+    Usa la etiqueta ``/* nombre */`` del inicio si la tiene; si no, el verbo
+    y la primera tabla (``select:Productos``, ``exec:RegistrarPedido``).
+    """
+    etiqueta = _ETIQUETA.match(query)
+    if etiqueta:
+        return etiqueta.group(1)
+    coincidencia = _VERBO.match(query)
+    if coincidencia is None:
+        return "otra"
+    verbo, siguiente = coincidencia.group(1).lower(), coincidencia.group(2)
+    if verbo.startswith("exec"):
+        return "exec:" + siguiente
+    tabla = _TABLA.search(query, coincidencia.start(2))
+    if verbo == "update" and (tabla is None or len(siguiente) > 2):
+        # UPDATE <tabla> SET ...; con un alias corto (UPDATE r ... FROM Tabla r) se usa la del FROM
+        return "update:" + siguiente
+    return f"{verbo}:{tabla.group(1)}" if tabla else verbo
+
+
+class _ConexionPool:
+    __slots__ = ("conn", "creada", "ultimo_uso")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.creada = time.monotonic()
+        self.ultimo_uso = self.creada
+
+
+class _Espera:
+    # Turno de un hilo esperando conexión; se atienden en orden de llegada
+    __slots__ = ("evento", "entrada", "puede_crear", "cerrado")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.entrada = None
+        self.puede_crear = False
+        self.cerrado = False
+
+
+class PoolConexiones:
+    """Pool acotado de conexiones pymssql, seguro entre hilos.
+
+    Las conexiones ociosas se reutilizan en orden LIFO, se verifican con un
+    ``SELECT 1`` si llevan tiempo sin usarse, y se cierran al superar el
+    tiempo máximo de inactividad o de vida.
+    """
+
+    def __init__(self, crear_conexion, min_tamano=POOL_MIN, max_tamano=POOL_MAX,
+                 timeout=POOL_TIMEOUT, max_inactividad=POOL_MAX_INACTIVIDAD,
+                 max_vida=POOL_MAX_VIDA, verificar_tras=POOL_VERIFICAR_TRAS):
+        self._crear_conexion = crear_conexion
+        self.min_tamano = min(min_tamano, max_tamano)
+        self.max_tamano = max_tamano
+        self.timeout = timeout
+        self.max_inactividad = max_inactividad
+        self.max_vida = max_vida
+        self.verificar_tras = verificar_tras
+        self._libres = deque()
+        self._esperando = deque()
+        self._total = 0  # Conexiones abiertas (libres + en uso)
+        self._cerrado = False
+        self._candado = threading.Lock()
+
+    @property
+    def total(self):
+        return self._total
+
+    @property
+    def libres(self):
+        return len(self._libres)
+
+    @property
+    def en_espera(self):
+        return len(self._esperando)
+
+    def precalentar(self):
+        # Abrir las conexiones mínimas por adelantado
+        while True:
+            with self._candado:
+                if self._cerrado or self._total >= self.min_tamano:
+                    return
+                self._total += 1
+            try:
+                entrada = _ConexionPool(self._crear_conexion())
+            except Exception:
+                self._descontar()
+                raise
+            self._devolver(entrada)
+
+    def adquirir(self):
+        limite = time.monotonic() + self.timeout
+        while True:
+            entrada = None
+            puede_crear = False
+            espera = None
+            with self._candado:
+                if self._cerrado:
+                    raise PoolAgotado("El pool de conexiones está cerrado")
+                desalojadas = self._desalojar_ociosas()
+                if self._libres:
+                    entrada = self._libres.pop()
+                elif self._total < self.max_tamano:
+                    self._total += 1
+                    puede_crear = True
+                else:
+                    espera = _Espera()
+                    self._esperando.append(espera)
+
+            for vieja in desalojadas:
+                self._cerrar_conexion(vieja.conn)
+
+            if espera is not None:
+                espera.evento.wait(max(0.0, limite - time.monotonic()))
+                with self._candado:
+                    if not espera.evento.is_set():
+                        self._esperando.remove(espera)
+                        raise PoolAgotado(f"No hay conexiones libres tras {self.timeout}s")
+                if espera.cerrado:
+                    raise PoolAgotado("El pool de conexiones está cerrado")
+                entrada = espera.entrada
+                puede_crear = espera.puede_crear
+
+            if puede_crear:
+                # Hay espacio en el pool: abrir una conexión nueva fuera del candado
+                try:
+                    return _ConexionPool(self._crear_conexion())
+                except Exception:
+                    ERRORES_CONEXION.inc("conectar")
+                    self._descontar()
+                    raise
+
+            ahora = time.monotonic()
+            if ahora - entrada.creada > self.max_vida:
+                self._descartar(entrada)
+                continue
+            if ahora - entrada.ultimo_uso > self.verificar_tras and not self._esta_viva(entrada.conn):
+                self._descartar(entrada)
+                continue
+            return entrada
+
+    def liberar(self, entrada, descartar=False):
+        if descartar or self._cerrado or time.monotonic() - entrada.creada > self.max_vida:
+            self._descartar(entrada)
+        else:
+            self._devolver(entrada)
+
+    @contextmanager
+    def conexion(self):
+        entrada = self.adquirir()
+        try:
+            yield entrada.conn
+        except BaseException as e:
+            # Deshacer lo pendiente y devolver la conexión, salvo que haya quedado rota
+            try:
+                entrada.conn.rollback()
+                descartar = self._rota(e, entrada.conn)
+            except Exception:
+                descartar = True
+            if descartar:
+                ERRORES_CONEXION.inc("operacional")
+            self.liberar(entrada, descartar=descartar)
+            raise
+        else:
+            self.liberar(entrada)
+
+    def cerrar(self):
+        with self._candado:
+            self._cerrado = True
+            libres = list(self._libres)
+            self._libres.clear()
+            self._total -= len(libres)
+            while self._esperando:
+                espera = self._esperando.popleft()
+                espera.cerrado = True
+                espera.evento.set()
+        for entrada in libres:
+            self._cerrar_conexion(entrada.conn)
+
+    def _devolver(self, entrada):
+        # Entregar directamente al primer hilo en espera para evitar que otro se adelante
+        entrada.ultimo_uso = time.monotonic()
+        with self._candado:
+            if self._esperando:
+                espera = self._esperando.popleft()
+                espera.entrada = entrada
+                espera.evento.set()
+            else:
+                self._libres.append(entrada)
+
+    def _descartar(self, entrada):
+        self._cerrar_conexion(entrada.conn)
+        self._descontar()
+
+    def _descontar(self):
+        # Se liberó un lugar: cederlo al primer hilo en espera para que abra una conexión
+        with self._candado:
+            if self._esperando:
+                espera = self._esperando.popleft()
+                espera.puede_crear = True
+                espera.evento.set()
+            else:
+                self._total -= 1
+
+    def _desalojar_ociosas(self):
+        # Se llama con el candado tomado; las más antiguas quedan al inicio de la cola.
+        # Devuelve las conexiones retiradas para cerrarlas fuera del candado.
+        ahora = time.monotonic()
+        desalojadas = []
+        while (self._libres and self._total > self.min_tamano
+               and ahora - self._libres[0].ultimo_uso > self.max_inactividad):
+            desalojadas.append(self._libres.popleft())
+            self._total -= 1
+        return desalojadas
+
+    @classmethod
+    def _rota(cls, error, conn):
+        # pymssql lanza OperationalError también por errores normales del servidor (THROW de los
+        # procedimientos, deadlock 1205, conversiones): solo se descarta si la conexión no responde
+        if not isinstance(error, pymssql.OperationalError):
+            return False
+        numero = codigo_error(error)
+        if numero is not None and numero >= 50000:
+            return False  # THROW de un procedimiento almacenado
+        return not cls._esta_viva(conn)
+
+    @staticmethod
+    def _esta_viva(conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1;")
+            cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _cerrar_conexion(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def crear_conexion():
+    return pymssql.connect(server=server, user=username, password=password, database=database)
+
+
+pool = PoolConexiones(crear_conexion)
+
+
+def codigo_error(error):
+    # Número de error de SQL Server (por ejemplo, el de un THROW 50001) o None
+    if isinstance(error, pymssql.Error) and error.args and isinstance(error.args[0], int):
+        return error.args[0]
+    return None
+
+
+def _medir(query, params, duracion):
+    nombre = nombre_consulta(query)
+    DURACION_CONSULTAS.observar(duracion, nombre)
+    bitacora.registrar(nombre, query, params, duracion)
+
+
+def es_lectura(query):
+    # Solo SELECT (o WITH ... SELECT): se puede ejecutar para medir su plan real
+    coincidencia = _VERBO.match(query)
+    return coincidencia is not None and coincidencia.group(1).upper() in ("SELECT", "WITH")
+
+
+def _ejecutar(conn, query, params, modo):
+    inicio = time.perf_counter()
+    try:
+        cursor = conn.cursor(as_dict=True)
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+
+        if modo == "todos":
+            return cursor.fetchall()
+        if modo == "uno":
+            return cursor.fetchone()
+        return cursor.rowcount
+    finally:
+        _medir(query, params, time.perf_counter() - inicio)
+
+
+class Transaccion:
+    """Sentencias sobre una misma conexión; se confirma al salir de ``db.transaccion()``."""
+
+    def __init__(self, bd, conn):
+        self._bd = bd
+        self._conn = conn
+
+    async def fetch(self, query, params=None):
+        return await self._bd._en_hilo(_ejecutar, self._conn, query, params, "todos")
+
+    async def fetch_one(self, query, params=None):
+        return await self._bd._en_hilo(_ejecutar, self._conn, query, params, "uno")
+
+    async def execute(self, query, params=None):
+        return await self._bd._en_hilo(_ejecutar, self._conn, query, params, "ninguno")
+
+
+class BaseDatos:
+    """Acceso asíncrono a la base de datos.
+
+    pymssql es bloqueante, así que cada sentencia corre en un ejecutor propio
+    con tantos hilos como conexiones tiene el pool. Un semáforo asíncrono
+    reserva la conexión antes de pasar al hilo, de modo que los hilos nunca
+    se quedan bloqueados esperando al pool y las peticiones en espera solo
+    cuestan una corrutina suspendida.
+
+    Las lecturas llamadas con ``coalescer=True`` se comparten: si ya hay en
+    curso una idéntica (misma consulta, parámetros y modo), se espera su
+    resultado en lugar de ocupar otra conexión. Todos reciben los mismos
+    objetos, así que el resultado no debe modificarse. ``coalescidas``
+    cuenta las llamadas atendidas así y ``ejecutadas_coalescibles`` las que
+    llegaron a la base de datos.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._ejecutor = ThreadPoolExecutor(max_workers=pool.max_tamano, thread_name_prefix="db")
+        self._cupos = None
+        self._loop_cupos = None
+        self._en_vuelo = {}  # (modo, query, params) -> tarea de la lectura en curso
+        self.coalescidas = 0
+        self.ejecutadas_coalescibles = 0
+
+    async def fetch(self, query, params=None, coalescer=False):
+        if coalescer:
+            return await self._compartida(query, params, "todos")
+        async with self._cupo():
+            return await self._en_hilo(self._ejecutar_suelta, query, params, "todos")
+
+    async def fetch_one(self, query, params=None, coalescer=False):
+        if coalescer:
+            return await self._compartida(query, params, "uno")
+        async with self._cupo():
+            return await self._en_hilo(self._ejecutar_suelta, query, params, "uno")
+
+    async def execute(self, query, params=None):
+        async with self._cupo():
+            return await self._en_hilo(self._ejecutar_suelta, query, params, "ninguno")
+
+    async def stream(self, query, params=None, tamano_lote=500):
+        """Itera el resultado por lotes de filas sin cargarlo completo en memoria.
+
+        La conexión queda reservada mientras dure la iteración; si se
+        abandona antes del final se descarta en lugar de volver al pool,
+        porque todavía tiene filas pendientes de leer.
+        """
+        async with self._cupo():
+            entrada = await self._en_hilo(self.pool.adquirir)
+            completo = False
+            try:
+                cursor = await self._en_hilo(self._abrir_cursor, entrada.conn, query, params)
+                while True:
+                    filas = await self._en_hilo(cursor.fetchmany, tamano_lote)
+                    if not filas:
+                        break
+                    yield filas
+                completo = True
+            finally:
+                await asyncio.shield(self._en_hilo(self.pool.liberar, entrada, not completo))
+
+    @asynccontextmanager
+    async def transaccion(self):
+        async with self._cupo():
+            entrada = await self._en_hilo(self.pool.adquirir)
+            try:
+                yield Transaccion(self, entrada.conn)
+            except BaseException:
+                # Protegido para que una cancelación no deje la conexión sin devolver
+                await asyncio.shield(self._en_hilo(self._terminar, entrada, False))
+                raise
+            else:
+                await asyncio.shield(self._en_hilo(self._terminar, entrada, True))
+
+    async def plan(self, query, params=None, real=False):
+        """Plan de ejecución de una consulta, como listas de filas (una por resultado).
+
+        Por defecto el plan estimado (``SET SHOWPLAN_ALL``, no ejecuta la
+        consulta). Con ``real=True`` la ejecuta con ``SET STATISTICS PROFILE``
+        y devuelve solo las filas del perfil; solo se permite con lecturas.
+        """
+        if real and not es_lectura(query):
+            raise ValueError("El plan real solo se puede obtener de consultas de lectura")
+        async with self._cupo():
+            return await self._en_hilo(self._capturar_plan, query, params, real)
+
+    async def precalentar(self):
+        await self._en_hilo(self.pool.precalentar)
+
+    def cerrar(self):
+        self._ejecutor.shutdown(wait=True)
+        self.pool.cerrar()
+
+    async def _compartida(self, query, params, modo):
+        clave = (modo, query, tuple(params) if params else None)
+        tarea = self._en_vuelo.get(clave)
+        if tarea is not None and tarea.get_loop() is asyncio.get_running_loop():
+            self.coalescidas += 1
+        else:
+            self.ejecutadas_coalescibles += 1
+            tarea = asyncio.ensure_future(self._leer(query, params, modo))
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda terminada: self._fin_lectura(clave, terminada))
+        # Protegida: si quien la lanzó se cancela, los demás siguen esperando el resultado
+        return await asyncio.shield(tarea)
+
+    async def _leer(self, query, params, modo):
+        async with self._cupo():
+            return await self._en_hilo(self._ejecutar_suelta, query, params, modo)
+
+    def _fin_lectura(self, clave, tarea):
+        if self._en_vuelo.get(clave) is tarea:
+            del self._en_vuelo[clave]
+        if not tarea.cancelled():
+            tarea.exception()  # Evita el aviso de excepción no recuperada si nadie quedó esperando
+
+    async def _en_hilo(self, funcion, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._ejecutor, funcion, *args)
+
+    @asynccontextmanager
+    async def _cupo(self):
+        loop = asyncio.get_running_loop()
+        if self._loop_cupos is not loop:
+            self._cupos = asyncio.Semaphore(self.pool.max_tamano)
+            self._loop_cupos = loop
+        inicio = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._cupos.acquire(), self.pool.timeout)
+        except asyncio.TimeoutError:
+            raise PoolAgotado(f"No hay conexiones libres tras {self.pool.timeout}s") from None
+        finally:
+            ESPERA_POOL.observar(time.perf_counter() - inicio)
+        try:
+            yield
+        finally:
+            self._cupos.release()
+
+    @staticmethod
+    def _abrir_cursor(conn, query, params):
+        inicio = time.perf_counter()
+        cursor = conn.cursor(as_dict=True)
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+        _medir(query, params, time.perf_counter() - inicio)
+        return cursor
+
+    def _capturar_plan(self, query, params, real):
+        opcion = "STATISTICS PROFILE" if real else "SHOWPLAN_ALL"
+        entrada = self.pool.adquirir()
+        try:
+            cursor = entrada.conn.cursor(as_dict=True)
+            # SET SHOWPLAN_ALL tiene que ir solo en su lote
+            cursor.execute(f"SET {opcion} ON;")
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            resultados = []
+            while True:
+                if cursor.description:
+                    filas = cursor.fetchall()
+                    # Con STATISTICS PROFILE se intercalan las filas de la consulta con las del perfil
+                    if not real or (filas and "StmtText" in filas[0]):
+                        # StmtText repite la sentencia con los parámetros ya interpolados: no se devuelve
+                        resultados.append([{columna: valor for columna, valor in fila.items() if columna != "StmtText"}
+                                           for fila in filas])
+                if not cursor.nextset():
+                    break
+            entrada.conn.rollback()
+            return resultados
+        finally:
+            # La conexión quedó con la opción activada: no se devuelve al pool
+            self.pool.liberar(entrada, descartar=True)
+
+    def _ejecutar_suelta(self, query, params, modo):
+        with self.pool.conexion() as conn:
+            resultado = _ejecutar(conn, query, params, modo)
+            # Siempre, no solo en execute: un fetch también puede escribir (INSERT ... OUTPUT, EXEC
+            # que devuelve filas) y la transacción implícita no debe quedar abierta en el pool
+            conn.commit()
+            return resultado
+
+    def _terminar(self, entrada, confirmar):
+        descartar = False
+        try:
+            if confirmar:
+                entrada.conn.commit()
+            else:
+                entrada.conn.rollback()
+        except Exception:
+            descartar = True
+            raise
+        finally:
+            self.pool.liberar(entrada, descartar=descartar)
+
+
+db = BaseDatos(pool)
+
+registro.funcion("db_pool_conexiones", "Conexiones abiertas en el pool (libres y en uso)", lambda: pool.total)
+registro.funcion("db_pool_conexiones_libres", "Conexiones ociosas en el pool", lambda: pool.libres)
+registro.funcion("db_pool_hilos_en_espera", "Hilos esperando una conexión del pool", lambda: pool.en_espera)
+registro.funcion("db_lecturas_coalescidas_total", "Lecturas atendidas con el resultado de otra idéntica en curso",
+                 lambda: db.coalescidas, tipo="counter")
+registro.funcion("db_lecturas_coalescibles_ejecutadas_total", "Lecturas coalescibles que llegaron a la base de datos",
+                 lambda: db.ejecutadas_coalescibles, tipo="counter")
@@ -0,0 +1,449 @@
+"""Base de datos en memoria que responde las consultas de la API por su etiqueta ``/* nombre */``.
+
+Sustituye a pymssql en los benchmarks: ``BaseDatosFalsa.conectar`` se usa
+como fábrica de conexiones de ``basedatos.pool``, así que la API corre con
+su pool, su ejecutor de hilos y sus transacciones reales; solo cambia lo
+que hay al otro lado del cursor. Cada consulta se despacha por el nombre
+que le da ``nombre_consulta()`` (la etiqueta del inicio del SQL) a un
+método que simula lo que hace SQL Server sobre tablas en memoria, y espera
+``latencia`` segundos en el hilo, como lo haría la ida y vuelta a la red.
+
+Una consulta sin simular falla con ``ConsultaSinSimular`` y su nombre, para
+que una etiqueta nueva en la API se note en el benchmark en lugar de
+devolver datos vacíos.
+"""
+import json
+import time
+import random
+import threading
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import bcrypt
+import pymssql
+
+from analitica import GRANULARIDADES
+from basedatos import nombre_consulta
+
+CONTRASENA = "secreto"
+PRODUCTO_CALIENTE = "Producto caliente"
+
+
+class ConsultaSinSimular(Exception):
+    pass
+
+
+def _error_procedimiento(numero, mensaje):
+    # Lo mismo que lanza pymssql ante un THROW del procedimiento (lo lee codigo_error)
+    return pymssql.OperationalError(numero, mensaje.encode())
+
+
+class CursorFalso:
+    def __init__(self, bd):
+        self._bd = bd
+        self._filas = None
+        self.rowcount = -1
+
+    @property
+    def description(self):
+        return None if self._filas is None else (("columnas",),)
+
+    def execute(self, query, params=None):
+        resultado = self._bd.ejecutar(query, params)
+        if isinstance(resultado, int):
+            self._filas, self.rowcount = None, resultado
+        else:
+            self._filas, self.rowcount = list(resultado), len(resultado)
+
+    def fetchall(self):
+        filas, self._filas = self._filas or [], []
+        return filas
+
+    def fetchone(self):
+        return self._filas.pop(0) if self._filas else None
+
+    def fetchmany(self, cantidad):
+        filas, self._filas = self._filas[:cantidad], self._filas[cantidad:]
+        return filas
+
+    def nextset(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class ConexionFalsa:
+    def __init__(self, bd):
+        self._bd = bd
+
+    def cursor(self, as_dict=False):
+        return CursorFalso(self._bd)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class BaseDatosFalsa:
+    """Tablas de la tienda en memoria y un método por cada consulta etiquetada.
+
+    Los datos se generan con ``semilla`` para que dos corridas partan del
+    mismo estado: ``productos`` productos (el 1 es ``PRODUCTO_CALIENTE``,
+    con stock de sobra), ``clientes`` clientes ``cliente1``... y un
+    administrador ``admin``, todos con la contraseña ``CONTRASENA``, y
+    ``pedidos`` pedidos repartidos en el último año. ``consultas`` cuenta
+    las ejecuciones por nombre.
+    """
+
+    def __init__(self, productos=200, clientes=500, pedidos=5000, latencia=0.002, semilla=1, rondas_bcrypt=4):
+        self.latencia = latencia
+        self.consultas = Counter()
+        self._candado = threading.Lock()
+        rng = random.Random(semilla)
+        hash_contrasena = bcrypt.hashpw(CONTRASENA.encode(), bcrypt.gensalt(rondas_bcrypt)).decode()
+
+        self.productos = {}
+        for producto_id in range(1, productos + 1):
+            self.productos[producto_id] = {
+                "ProductoID": producto_id,
+                "Nombre": PRODUCTO_CALIENTE if producto_id == 1 else f"Producto {producto_id}",
+                "Precio": Decimal(rng.randrange(500, 500000)) / 100,
+                "Stock": 10 ** 9 if producto_id == 1 else rng.randrange(0, 500),
+                "Imagen": None,
+                "Version": producto_id,
+            }
+        self._version = productos
+        self.clientes = {
+            cliente_id: {"ClienteID": cliente_id, "Nombre": f"Cliente {cliente_id}",
+                         "NombreUsuario": f"cliente{cliente_id}", "Contrasena": hash_contrasena}
+            for cliente_id in range(1, clientes + 1)
+        }
+        self._clientes_por_usuario = {cliente["NombreUsuario"]: cliente for cliente in self.clientes.values()}
+        self.administradores = {"admin": {"AdministradorID": 1, "Contrasena": hash_contrasena}}
+
+        self.pedidos = {}  # PedidoID -> pedido (en orden de ID)
+        self.ventas = {}  # VentaID -> venta
+        self._pedidos_por_cliente = {}
+        self.resumen_ventas = {}  # NombreProducto -> [TotalVendido, TotalCompra]
+        self.resumen_dias = {}  # (Fecha, ProductoID) -> [Pedidos, Unidades, Total]
+        self.sesiones = {}  # SesionID -> sesión
+        self._sesiones_por_token = {}
+        self.revocadas = set()  # Token de las sesiones de administrador cerradas
+        self.reservas = {}
+        self.auditoria = 0
+
+        ahora = datetime(2024, 6, 30, 12, 0, 0)
+        fechas = sorted(ahora - timedelta(minutes=rng.randrange(0, 365 * 24 * 60)) for _ in range(pedidos))
+        for fecha in fechas:
+            producto = self.productos[rng.randint(1, productos)]
+            self._crear_pedido(rng.randint(1, clientes), producto, rng.randint(1, 5), fecha)
+
+        self._manejadores = {
+            "select": self._ping,
+            "catalogo.instantanea": self._catalogo_instantanea,
+            "catalogo.huella": self._catalogo_huella,
+            "login.buscar_usuario": self._buscar_usuario,
+            "usuarios.rehash": self._rehash,
+            "sesiones.registrar": self._registrar_sesion,
+            "sesiones.verificar_cierre": self._verificar_cierre,
+            "sesiones.cerrar": self._cerrar_sesion,
+            "sesiones.verificar_revocacion": self._verificar_revocacion,
+            "sesiones.revocar": self._revocar_sesion,
+            "sesiones.pagina": self._pagina_sesiones,
+            "pedidos.registrar": self._registrar_pedido,
+            "pedidos.del_cliente": self._pedidos_del_cliente,
+            "pedidos.pagina": self._pagina_pedidos,
+            "pedidos.exportar": self._pagina_pedidos,
+            "ventas.pagina": self._pagina_ventas,
+            "ventas.exportar": self._pagina_ventas,
+            "carrito.validar": self._validar_carrito,
+            "carrito.registrar": self._registrar_carrito,
+            "reservas.reservar": self._reservar,
+            "reservas.confirmar": self._confirmar_reserva,
+            "reservas.liberar": self._liberar_reserva,
+            "reservas.barrer": self._barrer_reservas,
+            "auditoria.insertar_lote": self._insertar_auditoria,
+            "resumen.ganancia_total": self._ganancia_total,
+            "resumen.mas_solicitados": self._mas_solicitados,
+            "resumen.reconciliar_ventas": self._reconciliar,
+            "resumen.reconciliar_dias": self._reconciliar,
+            "analitica.series": self._series,
+            "panel.metricas": self._panel,
+        }
+
+    def conectar(self):
+        return ConexionFalsa(self)
+
+    def ejecutar(self, query, params):
+        nombre = nombre_consulta(query)
+        manejador = self._manejadores.get(nombre)
+        if manejador is None:
+            raise ConsultaSinSimular(f"Consulta sin simular: {nombre}")
+        if self.latencia:
+            time.sleep(self.latencia)
+        if params is not None and not isinstance(params, tuple):
+            params = (params,)
+        with self._candado:
+            self.consultas[nombre] += 1
+            return manejador(query, params or ())
+
+    # --- Escrituras compartidas por varios procedimientos ---
+
+    def _crear_pedido(self, cliente_id, producto, cantidad, fecha):
+        pedido_id = len(self.pedidos) + 1
+        total = producto["Precio"] * cantidad
+        pedido = {"PedidoID": pedido_id, "ClienteID": cliente_id, "ProductoID": producto["ProductoID"],
+                  "Cantidad": cantidad, "FechaCompra": fecha}
+        self.pedidos[pedido_id] = pedido
+        self._pedidos_por_cliente.setdefault(cliente_id, []).append(pedido)
+        venta_id = len(self.ventas) + 1
+        self.ventas[venta_id] = {"VentaID": venta_id, "PedidoID": pedido_id, "ClienteID": cliente_id,
+                                 "NombreProducto": producto["Nombre"], "Cantidad": cantidad,
+                                 "TotalCompra": total, "FechaVenta": fecha}
+        resumen = self.resumen_ventas.setdefault(producto["Nombre"], [0, Decimal(0)])
+        resumen[0] += cantidad
+        resumen[1] += total
+        dia = self.resumen_dias.setdefault((fecha.date(), producto["ProductoID"]), [0, 0, Decimal(0)])
+        dia[0] += 1
+        dia[1] += cantidad
+        dia[2] += total
+        return pedido_id, total
+
+    def _descontar_stock(self, producto_id, cantidad):
+        producto = self.productos.get(producto_id)
+        if producto is None:
+            raise _error_procedimiento(50002, "Producto no encontrado")
+        if producto["Stock"] < cantidad:
+            raise _error_procedimiento(50001, "Stock insuficiente")
+        producto["Stock"] -= cantidad
+        self._version += 1
+        producto["Version"] = self._version
+        return producto
+
+    # --- Consultas ---
+
+    def _ping(self, query, params):
+        return [{"": 1}]
+
+    def _catalogo_instantanea(self, query, params):
+        return [dict(producto) for producto in self.productos.values()]
+
+    def _catalogo_huella(self, query, params):
+        return [{"Total": len(self.productos), "Version": self._version}]
+
+    def _buscar_usuario(self, query, params):
+        cliente = self._clientes_por_usuario.get(params[0])
+        if cliente is not None:
+            return [{"TipoUsuario": "cliente", "UsuarioID": cliente["ClienteID"], "Contrasena": cliente["Contrasena"]}]
+        administrador = self.administradores.get(params[1])
+        if administrador is not None:
+            return [{"TipoUsuario": "administrador", "UsuarioID": administrador["AdministradorID"],
+                     "Contrasena": administrador["Contrasena"]}]
+        return []
+
+    def _rehash(self, query, params):
+        nuevo_hash, usuario_id = params
+        if "Clientes" in query and usuario_id in self.clientes:
+            self.clientes[usuario_id]["Contrasena"] = nuevo_hash
+            return 1
+        return 0
+
+    def _registrar_sesion(self, query, params):
+        cliente_id, ip, token = params
+        sesion_id = len(self.sesiones) + 1
+        sesion = {"SesionID": sesion_id, "ClienteID": cliente_id, "FechaInicio": datetime.now(),
+                  "FechaCierre": None, "IP": ip, "Token": token}
+        self.sesiones[sesion_id] = sesion
+        self._sesiones_por_token[token] = sesion
+        return 1
+
+    def _verificar_cierre(self, query, params):
+        sesion = self._sesiones_por_token.get(params[0])
+        return [{"FechaCierre": sesion["FechaCierre"]}] if sesion else []
+
+    def _cerrar_sesion(self, query, params):
+        sesion = self._sesiones_por_token.get(params[0])
+        if sesion is None or sesion["FechaCierre"] is not None:
+            return 0
+        sesion["FechaCierre"] = datetime.now()
+        return 1
+
+    def _verificar_revocacion(self, query, params):
+        return [{"Revocada": 1}] if params[0] in self.revocadas else []
+
+    def _revocar_sesion(self, query, params):
+        self.revocadas.add(params[0])
+        return 1
+
+    def _registrar_pedido(self, query, params):
+        cliente_id, producto_id, cantidad, _ = params
+        producto = self._descontar_stock(producto_id, cantidad)
+        pedido_id, total = self._crear_pedido(cliente_id, producto, cantidad, datetime.now())
+        return [{"PedidoID": pedido_id, "TotalCompra": total}]
+
+    def _pedidos_del_cliente(self, query, params):
+        return [
+            {"PedidoID": pedido["PedidoID"], "Cantidad": pedido["Cantidad"], "FechaCompra": pedido["FechaCompra"],
+             "Nombre": self.productos[pedido["ProductoID"]]["Nombre"],
+             "PrecioTotal": self.productos[pedido["ProductoID"]]["Precio"] * pedido["Cantidad"]}
+            for pedido in self._pedidos_por_cliente.get(params[0], ())
+        ]
+
+    def _validar_carrito(self, query, params):
+        filas = []
+        for linea in json.loads(params[0]):
+            producto = next((p for p in self.productos.values() if p["Nombre"] == linea["nombre"]), None)
+            filas.append({"Nombre": linea["nombre"], "Cantidad": linea["cantidad"],
+                          "ProductoID": producto["ProductoID"] if producto else None,
+                          "Stock": producto["Stock"] if producto else None})
+        return filas
+
+    def _registrar_carrito(self, query, params):
+        cliente_id, lineas = params
+        lineas = json.loads(lineas)
+        for linea in lineas:
+            producto = self.productos.get(linea["producto_id"])
+            if producto is None:
+                raise _error_procedimiento(50002, "Producto no encontrado")
+            if producto["Stock"] < linea["cantidad"]:
+                raise _error_procedimiento(50001, "Stock insuficiente")
+        filas = []
+        for linea in lineas:
+            producto = self._descontar_stock(linea["producto_id"], linea["cantidad"])
+            pedido_id, total = self._crear_pedido(cliente_id, producto, linea["cantidad"], datetime.now())
+            filas.append({"PedidoID": pedido_id, "ProductoID": producto["ProductoID"], "Nombre": producto["Nombre"],
+                          "Cantidad": linea["cantidad"], "TotalCompra": total})
+        return filas
+
+    def _reservar(self, query, params):
+        cliente_id, producto_id, cantidad, segundos = params
+        self._descontar_stock(producto_id, cantidad)
+        reserva_id = len(self.reservas) + 1
+        reserva = {"ReservaID": reserva_id, "ClienteID": cliente_id, "ProductoID": producto_id,
+                   "Cantidad": cantidad, "Expira": datetime.now() + timedelta(seconds=segundos)}
+        self.reservas[reserva_id] = reserva
+        return [dict(reserva)]
+
+    def _confirmar_reserva(self, query, params):
+        reserva_id, cliente_id = params
+        reserva = self.reservas.get(reserva_id)
+        if reserva is None or reserva["ClienteID"] != cliente_id or reserva["Expira"] < datetime.now():
+            raise _error_procedimiento(50003, "La reserva no existe o ha vencido")
+        del self.reservas[reserva_id]
+        pedido_id, _ = self._crear_pedido(cliente_id, self.productos[reserva["ProductoID"]],
+                                          reserva["Cantidad"], datetime.now())
+        return [{"PedidoID": pedido_id}]
+
+    def _liberar_reserva(self, query, params):
+        reserva_id, cliente_id = params
+        reserva = self.reservas.get(reserva_id)
+        if reserva is None or reserva["ClienteID"] != cliente_id:
+            return [{"Liberadas": 0}]
+        del self.reservas[reserva_id]
+        self.productos[reserva["ProductoID"]]["Stock"] += reserva["Cantidad"]
+        return [{"Liberadas": 1}]
+
+    def _barrer_reservas(self, query, params):
+        ahora = datetime.now()
+        vencidas = [reserva for reserva in self.reservas.values() if reserva["Expira"] < ahora][:params[0]]
+        for reserva in vencidas:
+            del self.reservas[reserva["ReservaID"]]
+            self.productos[reserva["ProductoID"]]["Stock"] += reserva["Cantidad"]
+        return [{"Liberadas": len(vencidas)}]
+
+    def _insertar_auditoria(self, query, params):
+        filas = len(params) // 5
+        self.auditoria += filas
+        return filas
+
+    def _ganancia_total(self, query, params):
+        return [{"GananciaTotal": sum((total for _, total in self.resumen_ventas.values()), Decimal(0))}]
+
+    def _mas_solicitados(self, query, params):
+        filas = [{"NombreProducto": nombre, "TotalVendido": vendido}
+                 for nombre, (vendido, _) in self.resumen_ventas.items() if vendido > 0]
+        return sorted(filas, key=lambda fila: fila["TotalVendido"], reverse=True)
+
+    def _reconciliar(self, query, params):
+        return [{"FilasCorregidas": 0}]
+
+    def _series(self, query, params):
+        # La granularidad se reconoce por su expresión SQL; "Fecha" (por día) va al final porque todas la contienen
+        granularidad = next(g for g in sorted(GRANULARIDADES.values(), key=lambda g: -len(g.sql)) if g.sql in query)
+        params = list(params)
+        desde = params.pop(0) if "Fecha >= %s" in query else None
+        hasta = params.pop(0) if "Fecha < %s" in query else None
+        grupos = {}
+        for (fecha, producto_id), (pedidos, unidades, total) in self.resumen_dias.items():
+            if (desde is not None and fecha < desde) or (hasta is not None and fecha >= hasta):
+                continue
+            grupo = grupos.setdefault((granularidad.inicio(fecha), producto_id), [0, 0, Decimal(0)])
+            grupo[0] += pedidos
+            grupo[1] += unidades
+            grupo[2] += total
+        return [
+            {"Periodo": periodo, "ProductoID": producto_id, "Pedidos": pedidos, "Unidades": unidades, "Total": total}
+            for (periodo, producto_id), (pedidos, unidades, total) in sorted(grupos.items())
+            if pedidos > 0
+        ]
+
+    def _panel(self, query, params):
+        return [{"Productos": len(self.productos), "Stock": sum(p["Stock"] for p in self.productos.values()),
+                 "Clientes": len(self.clientes), "Pedidos": len(self.pedidos)}]
+
+    # --- Listados por keyset (consulta_paginada) ---
+
+    @staticmethod
+    def _pagina(registros, clave_fecha, query, params):
+        # Los parámetros van en el orden de consulta_paginada: TOP, cursor, desde, hasta
+        params = list(params)
+        limite = params.pop(0) if "TOP (%s)" in query else None
+        cursor = params.pop(0) if "> %s" in query else None
+        desde = params.pop(0) if ">= %s" in query else None
+        hasta = params.pop(0) if "< %s" in query else None
+        ids = list(registros)
+        inicio = bisect_right(ids, cursor) if cursor is not None else 0
+        resultado = []
+        for registro_id in ids[inicio:]:
+            registro = registros[registro_id]
+            fecha = registro[clave_fecha]
+            if (desde is not None and fecha < desde) or (hasta is not None and fecha >= hasta):
+                continue
+            resultado.append(registro)
+            if limite is not None and len(resultado) >= limite:
+                break
+        return resultado
+
+    def _pagina_pedidos(self, query, params):
+        return [
+            {"pedido_id": pedido["PedidoID"], "cliente_nombre": self.clientes[pedido["ClienteID"]]["Nombre"],
+             "producto_nombre": self.productos[pedido["ProductoID"]]["Nombre"], "cantidad": pedido["Cantidad"],
+             "fecha_compra": pedido["FechaCompra"]}
+            for pedido in self._pagina(self.pedidos, "FechaCompra", query, params)
+        ]
+
+    def _pagina_ventas(self, query, params):
+        return [
+            {"venta_id": venta["VentaID"], "pedido_id": venta["PedidoID"], "cliente_id": venta["ClienteID"],
+             "nombre_usuario": self.clientes[venta["ClienteID"]]["NombreUsuario"],
+             "nombre_producto": venta["NombreProducto"], "cantidad": venta["Cantidad"],
+             "total_compra": venta["TotalCompra"], "fecha_venta": venta["FechaVenta"]}
+            for venta in self._pagina(self.ventas, "FechaVenta", query, params)
+        ]
+
+    def _pagina_sesiones(self, query, params):
+        return [
+            {"SesionID": sesion["SesionID"], "ClienteID": sesion["ClienteID"],
+             "NombreCliente": self.clientes[sesion["ClienteID"]]["Nombre"],
+             "NombreUsuario": self.clientes[sesion["ClienteID"]]["NombreUsuario"],
+             "FechaCierre": sesion["FechaCierre"], "FechaInicio": sesion["FechaInicio"], "IP": sesion["IP"]}
+            for sesion in self._pagina(self.sesiones, "FechaInicio", query, params)
+        ]
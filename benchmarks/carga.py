@@ -0,0 +1,487 @@
+"""Benchmark de carga de la API completa contra una base de datos en memoria.
+
+Arranca ``main:app`` en el mismo proceso (con su ciclo de vida: pools de
+bcrypt, catálogo, auditoría...) y sustituye las conexiones de SQL Server por
+``bd_falsa.BaseDatosFalsa``, que responde cada consulta por su etiqueta
+``/* nombre */`` tras una latencia simulada. Las peticiones se envían
+directamente a la app ASGI, sin red, desde usuarios virtuales concurrentes
+que eligen qué pedir según el peso de cada entrada de la mezcla:
+
+- ``catalogo``: navegación anónima de /productos (con If-None-Match y páginas);
+- ``login``: ráfaga de POST /login, con un 10 % de contraseñas incorrectas;
+- ``sku_caliente``: compras y reservas de un mismo producto mientras se lee el catálogo;
+- ``panel_admin``: sondeo del panel, gráficas, totales y listados del administrador;
+- ``recorrido``: el resto de endpoints (pedidos del cliente, carrito, exportaciones, /metrics...).
+
+Cada mezcla se corre ``--repeticiones`` veces y se toma la mediana de
+peticiones por segundo y latencia p50/p95/p99; además informa respuestas
+inesperadas, consultas a la base de datos por petición y, en una segunda
+pasada secuencial con tracemalloc, el pico de memoria asignada por petición
+(mediana) y los bytes que quedan retenidos por petición.
+
+Los resultados se comparan con ``benchmarks/linea_base.json`` y el proceso
+termina con código 1 si alguna métrica empeora más que ``--tolerancia``
+(``--tolerancia-cola`` para p99, que varía más entre corridas).
+La línea base solo vale para la máquina, la versión de Python y los
+argumentos con que se tomó (quedan anotados en su ``entorno``): con otros,
+la comparación se imprime pero no hace fallar el proceso. Para comparar en
+otra máquina, primero se regenera allí con ``--guardar``.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/carga.py
+    python benchmarks/carga.py --mezclas catalogo,sku_caliente --peticiones 5000
+    python benchmarks/carga.py --guardar
+"""
+import gc
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import statistics
+import tracemalloc
+from collections import Counter
+from typing import NamedTuple, Optional, Callable, List, Tuple
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import basedatos
+from bd_falsa import BaseDatosFalsa, CONTRASENA, PRODUCTO_CALIENTE
+
+LINEA_BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "linea_base.json")
+PRODUCTOS = 200
+CLIENTES = 500
+
+
+class Peticion(NamedTuple):
+    metodo: str
+    ruta: str  # Con la query string, si la hay
+    cuerpo: Optional[dict] = None  # Se envía como JSON
+    rol: Optional[str] = None  # None (anónima), "cliente" o "administrador"
+    esperados: Tuple[int, ...] = (200,)
+    condicional: bool = False  # Reenviar el ETag de la respuesta anterior en If-None-Match
+
+
+class Mezcla(NamedTuple):
+    descripcion: str
+    peticiones: int
+    concurrencia: int
+    entradas: List[Tuple[int, Callable[[random.Random], Peticion]]]  # (peso, fábrica de peticiones)
+
+
+def _cliente_al_azar(rng):
+    return f"cliente{rng.randint(1, CLIENTES)}"
+
+
+MEZCLAS = {
+    "catalogo": Mezcla("Navegación anónima del catálogo", 3000, 50, [
+        (60, lambda rng: Peticion("GET", "/productos", condicional=True, esperados=(200, 304))),
+        (25, lambda rng: Peticion("GET", f"/productos?limit=24&cursor={rng.randrange(0, PRODUCTOS, 24)}")),
+        (15, lambda rng: Peticion("GET", "/productos?fields=id,nombre,precio&limit=100")),
+    ]),
+    # Con más concurrencia que BCRYPT_MAX_QUEUE la API responde 503 (y cuentan como inesperadas)
+    "login": Mezcla("Ráfaga de inicios de sesión", 400, 8, [
+        (90, lambda rng: Peticion("POST", "/login", {"nombre_usuario": _cliente_al_azar(rng), "contrasena": CONTRASENA})),
+        (10, lambda rng: Peticion("POST", "/login", {"nombre_usuario": _cliente_al_azar(rng), "contrasena": "incorrecta"},
+                                  esperados=(401,))),
+    ]),
+    "sku_caliente": Mezcla("Compras concurrentes de un mismo producto", 2000, 50, [
+        (55, lambda rng: Peticion("POST", "/comprar-producto", {"nombre_producto": PRODUCTO_CALIENTE, "cantidad": 1},
+                                  rol="cliente")),
+        (15, lambda rng: Peticion("POST", "/productos/1/comprar", {"cantidad": rng.randint(1, 3)}, rol="cliente")),
+        (10, lambda rng: Peticion("POST", "/reservas", {"producto_id": 1, "cantidad": 1}, rol="cliente",
+                                  esperados=(201,))),
+        (20, lambda rng: Peticion("GET", "/productos", condicional=True, esperados=(200, 304))),
+    ]),
+    "panel_admin": Mezcla("Sondeo del panel de administración", 2000, 20, [
+        (25, lambda rng: Peticion("GET", "/datos-panel", rol="administrador", condicional=True, esperados=(200, 304))),
+        (15, lambda rng: Peticion("GET", "/ganancia-total", rol="administrador")),
+        (15, lambda rng: Peticion("GET", "/productos-mas-solicitados", rol="administrador")),
+        (15, lambda rng: Peticion("GET", "/datos-graficas?granularity=month", rol="administrador")),
+        (5, lambda rng: Peticion("GET", "/datos-graficas?granularity=day&from=2024-06-01&breakdown=true",
+                                 rol="administrador")),
+        (10, lambda rng: Peticion("GET", "/verificar-stock", rol="administrador", condicional=True,
+                                  esperados=(200, 304))),
+        (10, lambda rng: Peticion("GET", f"/ventas?limit=50&cursor={rng.randrange(0, 5000, 50)}", rol="administrador")),
+        (5, lambda rng: Peticion("GET", "/pedidos?limit=50&fields=pedido_id,producto_nombre,cantidad",
+                                 rol="administrador")),
+    ]),
+    "recorrido": Mezcla("Resto de endpoints", 600, 10, [
+        (20, lambda rng: Peticion("GET", "/mis-pedidos", rol="cliente")),
+        (10, lambda rng: Peticion("GET", "/user-role", rol="cliente")),
+        (15, lambda rng: Peticion("POST", "/carrito/checkout",
+                                  {"productos": [{"nombre": PRODUCTO_CALIENTE, "cantidad": 1},
+                                                 {"nombre": PRODUCTO_CALIENTE, "cantidad": 2}]}, rol="cliente")),
+        (10, lambda rng: Peticion("GET", "/sesiones-clientes?limit=50", rol="administrador")),
+        (10, lambda rng: Peticion("GET", "/ventas?from=2024-06-01&to=2024-06-15&limit=200", rol="administrador")),
+        (3, lambda rng: Peticion("GET", "/pedidos/export", rol="administrador")),
+        (3, lambda rng: Peticion("GET", "/ventas/export?format=csv&from=2024-03-01", rol="administrador")),
+        (10, lambda rng: Peticion("GET", "/metrics")),
+        (9, lambda rng: Peticion("GET", "/admin/consultas-lentas?top=20", rol="administrador")),
+        (10, lambda rng: Peticion("GET", "/", rol="cliente")),
+    ]),
+}
+
+# (métrica, texto, mayor es mejor, diferencia absoluta mínima para considerarla un cambio,
+#  si es de la cola de latencia y se compara con --tolerancia-cola)
+METRICAS = [
+    ("rps", "req/s", True, 0, False),
+    ("p50_ms", "p50 ms", False, 0.5, False),
+    ("p95_ms", "p95 ms", False, 0.5, False),
+    ("p99_ms", "p99 ms", False, 0.5, True),
+    ("consultas_por_peticion", "consultas/pet", False, 0.05, False),
+    ("pico_kib", "pico KiB", False, 4, False),
+    ("retenido_b", "retenido B", False, 256, False),
+]
+
+
+class Respuesta(NamedTuple):
+    estado: int
+    cabeceras: dict
+    cuerpo: bytes
+
+
+async def llamar(app, metodo, ruta, cuerpo=None, cabeceras=()):
+    """Una petición HTTP directa a la app ASGI; lee la respuesta completa (también las de streaming)."""
+    ruta, _, consulta = ruta.partition("?")
+    datos = json.dumps(cuerpo).encode() if cuerpo is not None else b""
+    encabezados = [(b"host", b"benchmark"), (b"accept", b"application/json"), *cabeceras]
+    if cuerpo is not None:
+        encabezados += [(b"content-type", b"application/json"), (b"content-length", str(len(datos)).encode())]
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+        "method": metodo, "scheme": "http", "path": ruta, "raw_path": ruta.encode(), "root_path": "",
+        "query_string": consulta.encode(), "headers": encabezados,
+        "client": ("127.0.0.1", 50000), "server": ("benchmark", 80),
+    }
+    terminada = asyncio.Event()
+    enviado = False
+    estado = None
+    respuesta_cabeceras = {}
+    partes = []
+
+    async def receive():
+        nonlocal enviado
+        if not enviado:
+            enviado = True
+            return {"type": "http.request", "body": datos, "more_body": False}
+        # El cliente sigue conectado hasta recibir la respuesta completa
+        await terminada.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(mensaje):
+        nonlocal estado
+        if mensaje["type"] == "http.response.start":
+            estado = mensaje["status"]
+            respuesta_cabeceras.update((nombre.decode("latin-1"), valor.decode("latin-1"))
+                                       for nombre, valor in mensaje.get("headers", ()))
+        elif mensaje["type"] == "http.response.body":
+            partes.append(mensaje.get("body", b""))
+            if not mensaje.get("more_body", False):
+                terminada.set()
+
+    await app(scope, receive, send)
+    terminada.set()
+    return Respuesta(estado, respuesta_cabeceras, b"".join(partes))
+
+
+class UsuarioVirtual:
+    # Un navegador: sus tokens por rol y los ETag que ya recibió
+    def __init__(self, app, rng, tokens):
+        self.app = app
+        self.rng = rng
+        self.tokens = tokens
+        self.etags = {}
+
+    async def enviar(self, peticion):
+        cabeceras = []
+        if peticion.rol is not None:
+            cabeceras.append((b"authorization", f"Bearer {self.tokens[peticion.rol]}".encode()))
+        # La mitad de las veces se revalida con el ETag guardado (como un navegador con caché)
+        etag = self.etags.get(peticion.ruta) if peticion.condicional else None
+        if etag is not None and self.rng.random() < 0.5:
+            cabeceras.append((b"if-none-match", etag.encode()))
+        respuesta = await llamar(self.app, peticion.metodo, peticion.ruta, peticion.cuerpo, cabeceras)
+        if peticion.condicional and "etag" in respuesta.cabeceras:
+            self.etags[peticion.ruta] = respuesta.cabeceras["etag"]
+        return respuesta
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+async def iniciar_sesiones(app, cantidad):
+    # Un token de administrador y ``cantidad`` de clientes distintos, con inicios de sesión reales
+    async def token(nombre_usuario):
+        respuesta = await llamar(app, "POST", "/login", {"nombre_usuario": nombre_usuario, "contrasena": CONTRASENA})
+        if respuesta.estado != 200:
+            raise SystemExit(f"No se pudo iniciar sesión como {nombre_usuario}: {respuesta.estado} {respuesta.cuerpo!r}")
+        return json.loads(respuesta.cuerpo)["token"]
+
+    administrador = await token("admin")
+    clientes = [await token(f"cliente{numero}") for numero in range(1, cantidad + 1)]
+    return administrador, clientes
+
+
+async def correr_mezcla(app, bd, mezcla, peticiones, concurrencia, repeticiones, sesiones, semilla, memoria):
+    """Corre la mezcla ``repeticiones`` veces tras un calentamiento.
+
+    Las métricas de tiempo son la mediana de las repeticiones; estados,
+    respuestas inesperadas y consultas se suman sobre todas.
+    """
+    fabricas = [fabrica for _, fabrica in mezcla.entradas]
+    pesos = [peso for peso, _ in mezcla.entradas]
+    administrador, clientes = sesiones
+    usuarios = [
+        UsuarioVirtual(app, random.Random(semilla * 1000 + numero),
+                       {"cliente": clientes[numero % len(clientes)], "administrador": administrador})
+        for numero in range(concurrencia)
+    ]
+    latencias = []
+    estados = Counter()
+    inesperadas = 0
+    restantes = 0
+
+    async def usuario_virtual(usuario, registrar):
+        nonlocal restantes, inesperadas
+        while restantes > 0:
+            restantes -= 1
+            peticion = usuario.rng.choices(fabricas, pesos)[0](usuario.rng)
+            inicio = time.perf_counter()
+            respuesta = await usuario.enviar(peticion)
+            if registrar:
+                latencias.append(time.perf_counter() - inicio)
+                estados[respuesta.estado] += 1
+                if respuesta.estado not in peticion.esperados:
+                    inesperadas += 1
+
+    # Calentamiento: instantánea del catálogo, procesos de bcrypt, cachés de rutas...
+    restantes = max(concurrencia, peticiones // 10)
+    await asyncio.gather(*(usuario_virtual(usuario, False) for usuario in usuarios))
+
+    corridas = []
+    consultas_antes = sum(bd.consultas.values())
+    for _ in range(repeticiones):
+        latencias.clear()
+        restantes = peticiones
+        inicio = time.perf_counter()
+        await asyncio.gather(*(usuario_virtual(usuario, True) for usuario in usuarios))
+        duracion = time.perf_counter() - inicio
+        corridas.append({
+            "rps": peticiones / duracion,
+            "p50_ms": percentil(latencias, 50) * 1000,
+            "p95_ms": percentil(latencias, 95) * 1000,
+            "p99_ms": percentil(latencias, 99) * 1000,
+        })
+    consultas = sum(bd.consultas.values()) - consultas_antes
+    total = peticiones * repeticiones
+
+    resultado = {"peticiones": total, "concurrencia": concurrencia, "repeticiones": repeticiones}
+    for clave in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+        resultado[clave] = round(statistics.median(corrida[clave] for corrida in corridas), 3)
+    resultado.update({
+        "inesperadas": inesperadas,
+        "estados": {str(estado): cantidad for estado, cantidad in sorted(estados.items())},
+        "consultas_por_peticion": round(consultas / total, 3),
+    })
+    if memoria:
+        resultado.update(await medir_memoria(usuarios[0], fabricas, pesos, memoria))
+    return resultado
+
+
+async def medir_memoria(usuario, fabricas, pesos, peticiones):
+    """Pico de memoria por petición (mediana) y bytes retenidos por petición, una petición a la vez.
+
+    Lo retenido no cuenta lo que guarda la base de datos falsa (pedidos,
+    sesiones...), que en producción vive en SQL Server.
+    """
+    excluir = [tracemalloc.Filter(False, sys.modules[BaseDatosFalsa.__module__].__file__)]
+    gc.collect()
+    tracemalloc.start()
+    try:
+        antes = tracemalloc.take_snapshot().filter_traces(excluir)
+        picos = []
+        for _ in range(peticiones):
+            peticion = usuario.rng.choices(fabricas, pesos)[0](usuario.rng)
+            tracemalloc.reset_peak()
+            actual = tracemalloc.get_traced_memory()[0]
+            await usuario.enviar(peticion)
+            picos.append(tracemalloc.get_traced_memory()[1] - actual)
+        # Deja terminar las tareas en segundo plano de las últimas respuestas
+        await asyncio.sleep(0.05)
+        gc.collect()
+        despues = tracemalloc.take_snapshot().filter_traces(excluir)
+    finally:
+        tracemalloc.stop()
+    retenido = sum(diferencia.size_diff for diferencia in despues.compare_to(antes, "filename"))
+    return {
+        "pico_kib": round(statistics.median(picos) / 1024, 1),
+        "retenido_b": round(retenido / peticiones),
+    }
+
+
+def modelo_cpu():
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as archivo:
+            for linea in archivo:
+                if linea.startswith("model name"):
+                    return linea.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def comparar(resultados, linea_base, tolerancia, tolerancia_cola):
+    """Imprime la diferencia con la línea base y devuelve la lista de regresiones.
+
+    Si el entorno no es el de la línea base, o una mezcla se corrió con otras
+    peticiones, usuarios o repeticiones, sus diferencias solo se informan.
+    """
+    regresiones = []
+    distintos = [clave for clave in ("maquina", "cpus", "python", "parametros")
+                 if linea_base["entorno"].get(clave) != resultados["entorno"].get(clave)]
+    if distintos:
+        print(f"\nAviso: la línea base se tomó con otros {', '.join(distintos)}; "
+              f"las diferencias no cuentan como regresiones")
+
+    print(f"\nComparación con la línea base ({linea_base['entorno']['fecha']}, tolerancia {tolerancia:.0%}, "
+          f"p99 {tolerancia_cola:.0%}):")
+    for nombre, actual in resultados["mezclas"].items():
+        base = linea_base["mezclas"].get(nombre)
+        if base is None:
+            print(f"  {nombre}: sin línea base")
+            continue
+        comparable = not distintos
+        if ((base["peticiones"], base["concurrencia"], base["repeticiones"])
+                != (actual["peticiones"], actual["concurrencia"], actual["repeticiones"])):
+            print(f"  {nombre}: aviso, la línea base usó {base['repeticiones']} x {base['peticiones']} peticiones "
+                  f"y {base['concurrencia']} usuarios; las diferencias no cuentan como regresiones")
+            comparable = False
+        for clave, texto, mayor_mejor, minimo, cola in METRICAS:
+            if clave not in actual or clave not in base:
+                continue
+            antes, ahora = base[clave], actual[clave]
+            cambio = (ahora - antes) / antes if antes else 0.0
+            peor = -cambio if mayor_mejor else cambio
+            regresion = (comparable and peor > (tolerancia_cola if cola else tolerancia)
+                         and abs(ahora - antes) > minimo)
+            marca = "  REGRESIÓN" if regresion else ""
+            print(f"  {nombre:<13} {texto:<14} {antes:>10g} -> {ahora:>10g} ({cambio:+.1%}){marca}")
+            if regresion:
+                regresiones.append(f"{nombre} {texto}")
+        tasa_antes = base["inesperadas"] / base["peticiones"]
+        tasa_ahora = actual["inesperadas"] / actual["peticiones"]
+        if tasa_ahora > tasa_antes + 0.01:  # Respuestas de error: cuentan en cualquier entorno
+            print(f"  {nombre:<13} {'inesperadas':<14} {tasa_antes:>10.1%} -> {tasa_ahora:>10.1%}  REGRESIÓN")
+            regresiones.append(f"{nombre} respuestas inesperadas")
+    return regresiones
+
+
+def imprimir(resultados):
+    print(f"\n{'mezcla':<13} {'pet.':>6} {'conc.':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'inesp.':>6} {'consultas/pet':>13} {'pico KiB':>9} {'retenido B':>10}  estados")
+    for nombre, r in resultados["mezclas"].items():
+        print(f"{nombre:<13} {r['peticiones']:>6} {r['concurrencia']:>5} {r['rps']:>8.1f} {r['p50_ms']:>8.2f} "
+              f"{r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['inesperadas']:>6} {r['consultas_por_peticion']:>13.2f} "
+              f"{r.get('pico_kib', '-'):>9} {r.get('retenido_b', '-'):>10}  {r['estados']}")
+
+
+def preparar_entorno(args):
+    # Configuración de la API: se fija antes de importar main (contrasenas y variantes leen os.getenv al importarse)
+    os.environ["BCRYPT_ROUNDS"] = str(args.rondas_bcrypt)
+    os.environ["IMAGE_VARIANT_BACKFILL"] = "false"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.chdir(RAIZ)  # main monta imgs/ y static/ con rutas relativas
+
+
+async def principal(args):
+    preparar_entorno(args)
+    bd = BaseDatosFalsa(productos=PRODUCTOS, clientes=CLIENTES, latencia=args.latencia_bd / 1000,
+                        semilla=args.semilla, rondas_bcrypt=args.rondas_bcrypt)
+    basedatos.pool._crear_conexion = bd.conectar
+    import main
+
+    nombres = args.mezclas.split(",") if args.mezclas else list(MEZCLAS)
+    desconocidas = [nombre for nombre in nombres if nombre not in MEZCLAS]
+    if desconocidas:
+        raise SystemExit(f"Mezclas desconocidas: {', '.join(desconocidas)} (hay {', '.join(MEZCLAS)})")
+
+    resultados = {
+        "entorno": {
+            "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "maquina": modelo_cpu(),
+            "cpus": os.cpu_count(),
+            "parametros": {"latencia_bd_ms": args.latencia_bd, "rondas_bcrypt": args.rondas_bcrypt,
+                           "semilla": args.semilla, "pool": basedatos.pool.max_tamano},
+            "argumentos": {"repeticiones": args.repeticiones, "peticiones": args.peticiones,
+                           "concurrencia": args.concurrencia},
+        },
+        "mezclas": {},
+    }
+    async with main.app.router.lifespan_context(main.app):
+        sesiones = await iniciar_sesiones(main.app, args.sesiones)
+        for nombre in nombres:
+            mezcla = MEZCLAS[nombre]
+            peticiones = args.peticiones or mezcla.peticiones
+            concurrencia = args.concurrencia or mezcla.concurrencia
+            print(f"{nombre}: {mezcla.descripcion} ({args.repeticiones} x {peticiones} peticiones, "
+                  f"{concurrencia} usuarios)...", flush=True)
+            resultados["mezclas"][nombre] = await correr_mezcla(
+                main.app, bd, mezcla, peticiones, concurrencia, args.repeticiones, sesiones, args.semilla,
+                0 if args.sin_memoria else args.peticiones_memoria
+            )
+
+    imprimir(resultados)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+
+    if args.guardar:
+        with open(args.linea_base, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+            archivo.write("\n")
+        print(f"\nLínea base guardada en {args.linea_base}")
+        return 0
+    if not os.path.exists(args.linea_base):
+        print(f"\nNo hay línea base en {args.linea_base}; créela con --guardar")
+        return 0
+    with open(args.linea_base, encoding="utf-8") as archivo:
+        linea_base = json.load(archivo)
+    regresiones = comparar(resultados, linea_base, args.tolerancia, args.tolerancia_cola)
+    if regresiones:
+        print(f"\n{len(regresiones)} regresiones: {'; '.join(regresiones)}")
+        return 1
+    print("\nSin regresiones")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mezclas", help=f"Separadas por comas (por defecto todas: {','.join(MEZCLAS)})")
+    parser.add_argument("--peticiones", type=int, help="Peticiones por mezcla (por defecto, las de cada mezcla)")
+    parser.add_argument("--concurrencia", type=int, help="Usuarios virtuales (por defecto, los de cada mezcla)")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Corridas por mezcla (se toma la mediana)")
+    parser.add_argument("--latencia-bd", type=float, default=2.0, help="Milisegundos de cada consulta simulada")
+    parser.add_argument("--rondas-bcrypt", type=int, default=4, help="Factor de trabajo de bcrypt (API y hashes)")
+    parser.add_argument("--sesiones", type=int, default=20, help="Clientes con sesión iniciada para las mezclas")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--peticiones-memoria", type=int, default=200, help="Peticiones de la pasada con tracemalloc")
+    parser.add_argument("--sin-memoria", action="store_true", help="Omitir la pasada con tracemalloc")
+    parser.add_argument("--linea-base", default=LINEA_BASE)
+    parser.add_argument("--guardar", action="store_true", help="Reescribir la línea base con estos resultados")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Empeoramiento relativo admitido (0.25 = 25 %%)")
+    parser.add_argument("--tolerancia-cola", type=float, default=0.5, help="Empeoramiento admitido en p99")
+    parser.add_argument("--json", help="Escribir también los resultados en este archivo")
+    raise SystemExit(asyncio.run(principal(parser.parse_args())))
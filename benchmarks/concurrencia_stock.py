@@ -0,0 +1,112 @@
+"""Prueba de concurrencia sobre un solo producto: comprueba que no se vende más stock del que hay.
+
+Lanza muchas compras simultáneas de un mismo producto contra un servidor en
+marcha (con su base de datos) y compara el stock inicial, el final y el
+número de compras aceptadas. Si el stock queda negativo o no cuadra, termina
+con código 1.
+
+Uso (el producto debe tener menos stock que compras se lanzan):
+
+    python benchmarks/concurrencia_stock.py --usuario cliente1 --contrasena secreto \\
+        --producto "Samsung S23" --peticiones 1000 --concurrencia 200
+
+Con ``--modo reserva`` cada compra pasa por POST /reservas y
+POST /reservas/{id}/confirmar en lugar de POST /comprar-producto.
+Requiere httpx (``pip install -r requirements-dev.txt``).
+"""
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+async def stock_de(cliente, nombre):
+    respuesta = await cliente.get("/productos")
+    respuesta.raise_for_status()
+    for producto in respuesta.json():
+        if producto["nombre"] == nombre:
+            return producto["id"], producto["stock"]
+    raise SystemExit(f"Producto no encontrado: {nombre}")
+
+
+async def comprar(cliente, args, producto_id):
+    if args.modo == "compra":
+        respuesta = await cliente.post("/comprar-producto",
+                                       json={"nombre_producto": args.producto, "cantidad": args.cantidad})
+        return respuesta.status_code
+    respuesta = await cliente.post("/reservas", json={"producto_id": producto_id, "cantidad": args.cantidad})
+    if respuesta.status_code != 201:
+        return respuesta.status_code
+    reserva_id = respuesta.json()["reserva_id"]
+    respuesta = await cliente.post(f"/reservas/{reserva_id}/confirmar")
+    return respuesta.status_code
+
+
+async def principal(args):
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+    async with httpx.AsyncClient(base_url=args.url, limits=limites, timeout=args.timeout) as cliente:
+        respuesta = await cliente.post("/login", json={"nombre_usuario": args.usuario, "contrasena": args.contrasena})
+        respuesta.raise_for_status()
+        cliente.headers["Authorization"] = f"Bearer {respuesta.json()['token']}"
+
+        producto_id, stock_inicial = await stock_de(cliente, args.producto)
+        print(f"Stock inicial de {args.producto!r}: {stock_inicial}")
+
+        semaforo = asyncio.Semaphore(args.concurrencia)
+        latencias = []
+        estados = {}
+
+        async def una_compra():
+            async with semaforo:
+                inicio = time.perf_counter()
+                try:
+                    estado = await comprar(cliente, args, producto_id)
+                except httpx.HTTPError as e:
+                    estado = type(e).__name__
+                latencias.append(time.perf_counter() - inicio)
+                estados[estado] = estados.get(estado, 0) + 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(una_compra() for _ in range(args.peticiones)))
+        duracion = time.perf_counter() - inicio
+
+        # Dar tiempo a que la instantánea del catálogo vea el stock final en todos los workers
+        await asyncio.sleep(args.espera)
+        _, stock_final = await stock_de(cliente, args.producto)
+
+    exitosas = estados.get(200, 0)
+    vendidas = exitosas * args.cantidad
+    print(f"Peticiones: {args.peticiones} en {duracion:.2f}s ({args.peticiones / duracion:.0f} req/s)")
+    print(f"Latencia p50/p95/p99: {percentil(latencias, 50) * 1000:.1f} / "
+          f"{percentil(latencias, 95) * 1000:.1f} / {percentil(latencias, 99) * 1000:.1f} ms "
+          f"(media {statistics.fmean(latencias) * 1000:.1f} ms)")
+    print(f"Respuestas: {dict(sorted(estados.items(), key=str))}")
+    print(f"Unidades vendidas: {vendidas}; stock final: {stock_final}")
+
+    correcto = stock_final >= 0 and vendidas <= stock_inicial and stock_final == stock_inicial - vendidas
+    print("OK: sin sobreventa" if correcto else "ERROR: el stock no cuadra con las compras aceptadas")
+    return 0 if correcto else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--usuario", required=True, help="Nombre de usuario de un cliente")
+    parser.add_argument("--contrasena", required=True)
+    parser.add_argument("--producto", required=True, help="Nombre del producto a comprar")
+    parser.add_argument("--peticiones", type=int, default=500)
+    parser.add_argument("--concurrencia", type=int, default=100)
+    parser.add_argument("--cantidad", type=int, default=1)
+    parser.add_argument("--modo", choices=["compra", "reserva"], default="compra")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--espera", type=float, default=3, help="Segundos antes de leer el stock final")
+    raise SystemExit(asyncio.run(principal(parser.parse_args())))
@@ -0,0 +1,135 @@
+"""Microbenchmark del middleware de autenticación: costo por petición de cada versión.
+
+Llama a la app ASGI directamente (sin red ni servidor) con una sesión ya en
+caché y compara:
+
+- ``sin middleware``: la app sola, como referencia;
+- ``BaseHTTPMiddleware``: el AuthMiddleware anterior (lista de rutas y Request);
+- ``ASGI``: MiddlewareAutenticacion con la tabla de rutas precompilada.
+
+Uso:
+
+    python benchmarks/middleware_autenticacion.py --peticiones 20000
+
+Se ejecuta desde la raíz del repositorio (importa autenticacion y sesiones).
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, RedirectResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from autenticacion import MiddlewareAutenticacion, publica
+from sesiones import Sesion, token_de_peticion
+
+TOKEN = "token-de-prueba"
+
+
+class AlmacenEnMemoria:
+    # Equivale a un acierto en la caché de AlmacenSesiones
+    def __init__(self):
+        self._sesiones = {TOKEN: Sesion("t", "cliente", "usuario", 1)}
+
+    async def obtener(self, token):
+        return self._sesiones.get(token) if token else None
+
+
+def crear_app():
+    app = FastAPI()
+
+    @app.get("/productos")
+    @publica
+    async def productos():
+        return JSONResponse([])
+
+    @app.get("/mis-pedidos")
+    async def mis_pedidos(request: Request):
+        sesion = getattr(request.state, "sesion", None)
+        return JSONResponse({"cliente": sesion.cliente_id if sesion else None})
+
+    return app
+
+
+def con_middleware_anterior(app, almacen):
+    class AuthMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request: Request, call_next):
+            allowed_paths = ["/login", "/cliente/registrar", "/CargaLogin.html", "/productos"]
+            request.state.sesion = await almacen.obtener(token_de_peticion(request))
+            if request.url.path not in allowed_paths and request.state.sesion is None:
+                return RedirectResponse(url='/CargaLogin.html')
+            return await call_next(request)
+
+    app.add_middleware(AuthMiddleware)
+    return app
+
+
+def con_middleware_asgi(app, almacen):
+    app.add_middleware(MiddlewareAutenticacion, almacen=almacen, router=app.router,
+                       prefijos_publicos=("/imgs/", "/static/"))
+    return app
+
+
+def scope_de(ruta, con_token):
+    cabeceras = [(b"host", b"localhost"), (b"accept", b"application/json")]
+    if con_token:
+        cabeceras.append((b"authorization", f"Bearer {TOKEN}".encode()))
+    return {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": ruta, "raw_path": ruta.encode(), "root_path": "",
+        "query_string": b"", "headers": cabeceras, "client": ("127.0.0.1", 1), "server": ("localhost", 80),
+    }
+
+
+async def medir(app, ruta, con_token, peticiones):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    estados = []
+
+    async def send(mensaje):
+        if mensaje["type"] == "http.response.start":
+            estados.append(mensaje["status"])
+
+    # Calentamiento: construye la pila de middlewares y la tabla de rutas
+    for _ in range(200):
+        await app(scope_de(ruta, con_token), receive, send)
+    estados.clear()
+
+    duraciones = []
+    for _ in range(peticiones):
+        inicio = time.perf_counter()
+        await app(scope_de(ruta, con_token), receive, send)
+        duraciones.append(time.perf_counter() - inicio)
+    assert len(set(estados)) == 1, f"Respuestas distintas: {set(estados)}"
+    return statistics.mean(duraciones) * 1e6, statistics.median(duraciones) * 1e6, estados[0]
+
+
+async def principal(args):
+    casos = [
+        ("sin middleware", lambda app, almacen: app),
+        ("BaseHTTPMiddleware", con_middleware_anterior),
+        ("ASGI", con_middleware_asgi),
+    ]
+    rutas = [("/mis-pedidos", True), ("/productos", False)]
+    print(f"{'ruta':<14} {'versión':<20} {'media µs':>10} {'p50 µs':>10} {'sobrecosto µs':>14}")
+    for ruta, con_token in rutas:
+        referencia = None
+        for nombre, montar in casos:
+            app = montar(crear_app(), AlmacenEnMemoria())
+            media, mediana, estado = await medir(app, ruta, con_token, args.peticiones)
+            if referencia is None:
+                referencia = media
+            print(f"{ruta:<14} {nombre:<20} {media:>10.1f} {mediana:>10.1f} {media - referencia:>14.1f}  ({estado})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peticiones", type=int, default=20000)
+    asyncio.run(principal(parser.parse_args()))
@@ -0,0 +1,114 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime, date
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuración de la bitácora de consultas
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '500'))  # Desde cuántos milisegundos se registra como lenta
+DB_QUERY_LOG_SIZE = int(os.getenv('DB_QUERY_LOG_SIZE', '5000'))  # Ejecuciones recientes que se conservan
+
+ORDENES = ("maximo", "p95", "total")
+
+# Únicas consultas cuyos parámetros se guardan para pedir su plan: lecturas de catálogo, resúmenes
+# y listados, cuyos parámetros son IDs, fechas y límites. Las de login, registro, contraseñas y
+# sesiones nunca se guardan (pymssql interpola los parámetros en el texto que ve el servidor).
+CONSULTAS_PLANIFICABLES = frozenset({
+    "catalogo.instantanea", "catalogo.huella",
+    "resumen.ganancia_total", "resumen.mas_solicitados",
+    "analitica.series", "panel.metricas",
+    "pedidos.pagina", "pedidos.exportar", "pedidos.del_cliente",
+    "ventas.pagina", "ventas.exportar",
+    "productos.obtener", "productos.existe",
+})
+
+
+def redactar(params):
+    # Solo el tipo (y el largo de los textos) de cada parámetro: nunca los valores
+    if params is None:
+        return None
+    if not isinstance(params, (tuple, list)):
+        params = (params,)
+    redactados = []
+    for valor in params:
+        if valor is None:
+            redactados.append("NULL")
+        elif isinstance(valor, (str, bytes)):
+            redactados.append(f"<{type(valor).__name__}:{len(valor)}>")
+        elif isinstance(valor, (datetime, date)):
+            redactados.append("<fecha>")
+        else:
+            redactados.append(f"<{type(valor).__name__}>")
+    return redactados
+
+
+def _percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+class BitacoraConsultas:
+    """Duraciones recientes de cada consulta y registro de las lentas.
+
+    ``registrar()`` se llama desde los hilos de la base de datos tras cada
+    sentencia: guarda (nombre, duración) en un buffer circular y, por
+    nombre, la ejecución más lenta vista; el texto y los parámetros solo se
+    conservan para las ``CONSULTAS_PLANIFICABLES``. Las que pasan de
+    ``umbral_ms`` se escriben en el log con los parámetros redactados.
+    """
+
+    def __init__(self, umbral_ms=DB_SLOW_QUERY_MS, tamano=DB_QUERY_LOG_SIZE):
+        self.umbral = umbral_ms / 1000
+        self._recientes = deque(maxlen=tamano)
+        self._mas_lentas = {}  # nombre -> (duración, time.time(), query, params)
+        self._candado = threading.Lock()
+
+    def registrar(self, nombre, query, params, duracion):
+        self._recientes.append((nombre, duracion))
+        anterior = self._mas_lentas.get(nombre)
+        if anterior is None or duracion > anterior[0]:
+            with self._candado:
+                anterior = self._mas_lentas.get(nombre)
+                if anterior is None or duracion > anterior[0]:
+                    if nombre in CONSULTAS_PLANIFICABLES:
+                        self._mas_lentas[nombre] = (duracion, time.time(), query, params)
+                    else:
+                        self._mas_lentas[nombre] = (duracion, time.time(), None, None)
+        if duracion >= self.umbral:
+            logger.warning(f"Consulta lenta {nombre}: {duracion * 1000:.1f} ms, parámetros {redactar(params)}")
+
+    def top(self, cantidad=10, orden="maximo"):
+        """Las ``cantidad`` consultas más lentas entre las ejecuciones recientes."""
+        por_nombre = {}
+        for nombre, duracion in list(self._recientes):
+            por_nombre.setdefault(nombre, []).append(duracion)
+        resumen = []
+        for nombre, duraciones in por_nombre.items():
+            duraciones.sort()
+            peor = self._mas_lentas.get(nombre)
+            resumen.append({
+                "nombre": nombre,
+                "ejecuciones": len(duraciones),
+                "total_ms": round(sum(duraciones) * 1000, 3),
+                "promedio_ms": round(sum(duraciones) / len(duraciones) * 1000, 3),
+                "p95_ms": round(_percentil(duraciones, 95) * 1000, 3),
+                "maximo_ms": round(duraciones[-1] * 1000, 3),
+                "peor_historico_ms": round(peor[0] * 1000, 3) if peor else None,
+                "peor_historico_fecha": datetime.fromtimestamp(peor[1]).isoformat() if peor else None,
+            })
+        resumen.sort(key=lambda fila: fila[f"{orden}_ms"], reverse=True)
+        return resumen[:cantidad]
+
+    def muestra(self, nombre):
+        """(query, params) de la ejecución más lenta de ``nombre``, o None (también si no es planificable)."""
+        peor = self._mas_lentas.get(nombre)
+        return (peor[2], peor[3]) if peor and peor[2] is not None else None
+
+
+bitacora = BitacoraConsultas()
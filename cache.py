@@ -0,0 +1,90 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ValorSWR:
+    """Valor calculado de forma asíncrona con TTL y stale-while-revalidate.
+
+    Mientras está fresco se devuelve tal cual. Vencido el TTL, pero dentro
+    de ``max_obsoleto`` segundos más, se devuelve el valor anterior y se
+    recalcula en segundo plano. Pasado ese margen (o sin valor previo) la
+    petición espera el recálculo. Nunca hay más de un recálculo en curso.
+    """
+
+    def __init__(self, cargar, ttl, max_obsoleto):
+        self._cargar = cargar
+        self.ttl = ttl
+        self.max_obsoleto = max_obsoleto
+        self._valor = None
+        self._cargado = None  # time.monotonic() de la última carga
+        self._cargando = None
+
+    def invalidar(self):
+        # La próxima lectura espera un valor nuevo
+        self._cargado = None
+
+    async def obtener(self):
+        ahora = time.monotonic()
+        if self._cargado is not None:
+            edad = ahora - self._cargado
+            if edad < self.ttl:
+                return self._valor
+            if edad < self.ttl + self.max_obsoleto:
+                self._recargar()
+                return self._valor
+        return await asyncio.shield(self._recargar())
+
+    def _recargar(self):
+        if self._cargando is None:
+            self._cargando = asyncio.ensure_future(self._cargar_y_guardar())
+            self._cargando.add_done_callback(self._fin_carga)
+        return self._cargando
+
+    async def _cargar_y_guardar(self):
+        valor = await self._cargar()
+        self._valor = valor
+        self._cargado = time.monotonic()
+        return valor
+
+    def _fin_carga(self, tarea):
+        self._cargando = None
+        if not tarea.cancelled() and tarea.exception() is not None:
+            logger.error(f"Error al recalcular valor en caché: {tarea.exception()}")
+
+
+class CacheLRU:
+    """Diccionario acotado con expiración por entrada; expulsa la menos usada."""
+
+    def __init__(self, max_tamano, ttl):
+        self.max_tamano = max_tamano
+        self.ttl = ttl
+        self._datos = OrderedDict()
+
+    def __len__(self):
+        return len(self._datos)
+
+    def get(self, clave):
+        entrada = self._datos.get(clave)
+        if entrada is None:
+            return None
+        valor, expira = entrada
+        if expira < time.monotonic():
+            del self._datos[clave]
+            return None
+        self._datos.move_to_end(clave)
+        return valor
+
+    def set(self, clave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._datos[clave] = (valor, time.monotonic() + ttl)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.max_tamano:
+            self._datos.popitem(last=False)
+
+    def pop(self, clave):
+        entrada = self._datos.pop(clave, None)
+        return entrada[0] if entrada else None
@@ -0,0 +1,73 @@
+import os
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+
+from dotenv import load_dotenv
+from fastapi import Response
+
+load_dotenv()
+
+# Cache-Control por ruta; se puede sobrescribir con variables de entorno
+CACHE_CONTROL = {
+    "/productos": os.getenv('CACHE_CONTROL_PRODUCTOS', 'public, max-age=0, must-revalidate'),
+    "/verificar-stock": os.getenv('CACHE_CONTROL_VERIFICAR_STOCK', 'private, no-cache'),
+    "/datos-panel": os.getenv('CACHE_CONTROL_DATOS_PANEL', 'private, no-cache'),
+}
+
+
+def calcular_etag(contenido):
+    # ETag fuerte derivado del contenido
+    return '"' + hashlib.blake2b(contenido, digest_size=16).hexdigest() + '"'
+
+
+def fecha_http(marca_tiempo):
+    return formatdate(marca_tiempo, usegmt=True)
+
+
+def _etag_coincide(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match usa comparación débil: se ignora el prefijo W/
+    etiqueta = etag[2:] if etag.startswith("W/") else etag
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == etiqueta:
+            return True
+    return False
+
+
+def _no_modificado_desde(if_modified_since, modificado):
+    try:
+        return int(modificado) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def respuesta_condicional(request, ruta, cuerpo, etag=None, modificado=None, media_type="application/json"):
+    """Responde 304 si el cliente ya tiene esta versión, o el cuerpo con sus validadores.
+
+    ``cuerpo`` son bytes ya serializados; ``modificado`` es un timestamp
+    Unix para Last-Modified. If-Modified-Since solo se evalúa si la
+    petición no trae If-None-Match.
+    """
+    etag = etag or calcular_etag(cuerpo)
+    cabeceras = {"ETag": etag}
+    cache_control = CACHE_CONTROL.get(ruta)
+    if cache_control:
+        cabeceras["Cache-Control"] = cache_control
+    if modificado is not None:
+        cabeceras["Last-Modified"] = fecha_http(modificado)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        no_modificado = _etag_coincide(if_none_match, etag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        no_modificado = bool(if_modified_since and modificado is not None
+                             and _no_modificado_desde(if_modified_since, modificado))
+
+    if no_modificado:
+        return Response(status_code=304, headers=cabeceras)
+    return Response(content=cuerpo, media_type=media_type, headers=cabeceras)
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+
+from cache_http import calcular_etag
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuración de la caché del catálogo
+CATALOG_TTL = float(os.getenv('CATALOG_TTL', '60'))  # Reconstruir aunque no haya cambios conocidos
+CATALOG_POLL_INTERVAL = float(os.getenv('CATALOG_POLL_INTERVAL', '2'))  # Revisar cambios de otros workers
+
+
+class Instantanea(NamedTuple):
+    version: int
+    productos: list  # Filas ya convertidas al formato de la API
+    cuerpo: bytes  # JSON listo para enviar
+    etag: str
+    huella: tuple  # (cantidad de productos, mayor rowversion) al construirla
+    creada: float  # time.monotonic(), para el TTL
+    vistas: dict  # Otras representaciones serializadas de los mismos datos
+
+
+def serializar(datos):
+    # Mismo formato compacto que JSONResponse
+    return json.dumps(datos, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class CatalogoProductos:
+    """Instantánea en memoria de la tabla Productos.
+
+    Cada escritura local llama a ``invalidar()``, que sube el número de
+    versión; la siguiente lectura reconstruye la instantánea una sola vez
+    aunque lleguen muchas peticiones a la vez. Para enterarse de cambios
+    hechos por otros workers, ``vigilar()`` compara cada pocos segundos la
+    huella (COUNT y MAX(rowversion)) de Productos con la de la instantánea.
+
+    Las compras solo cambian el stock, así que el índice de nombres
+    (nombre -> ProductoID y precio) que usa ``resolver()`` sobrevive a
+    esas invalidaciones; solo se descarta con ``invalidar(nombres=True)``
+    (altas, cambios y bajas de productos) o pasado el TTL.
+
+    Si se pasa ``variantes_de`` (imagen -> mapa de srcset o None), cada
+    producto incluye las variantes reducidas de su imagen.
+    """
+
+    def __init__(self, bd, ttl=CATALOG_TTL, intervalo=CATALOG_POLL_INTERVAL, variantes_de=None):
+        self._bd = bd
+        self._variantes_de = variantes_de
+        self.ttl = ttl
+        self.intervalo = intervalo
+        self.version = 0
+        self._instantanea = None
+        self._reconstruyendo = None
+        self.version_nombres = 0
+        self._nombres = None  # (version_nombres, time.monotonic(), {nombre: (ProductoID, precio)})
+
+    def invalidar(self, nombres=False):
+        # nombres=True cuando cambian nombres o precios, no solo el stock
+        self.version += 1
+        if nombres:
+            self.version_nombres += 1
+
+    async def resolver(self, nombre):
+        """(ProductoID, precio) del producto con ese nombre, o None si no existe."""
+        nombres = self._nombres
+        if (nombres is None or nombres[0] != self.version_nombres
+                or time.monotonic() - nombres[1] >= self.ttl):
+            await self.obtener()
+            nombres = self._nombres
+        resultado = nombres[2].get(nombre)
+        if resultado is None and self._instantanea.version != self.version:
+            # Puede ser un producto creado en otro worker: se reconstruye antes de darlo por inexistente
+            await self.obtener()
+            resultado = self._nombres[2].get(nombre)
+        return resultado
+
+    async def obtener(self):
+        instantanea = self._instantanea
+        if (instantanea is not None and instantanea.version == self.version
+                and time.monotonic() - instantanea.creada < self.ttl):
+            return instantanea
+
+        # Una sola reconstrucción en curso; el resto de peticiones la esperan. Si la que estaba
+        # en curso empezó antes de la versión que se pidió, se lanza otra; las invalidaciones
+        # que lleguen después no hacen esperar más a quien ya pidió
+        pedida = self.version
+        while True:
+            if self._reconstruyendo is None or self._reconstruyendo.done():
+                self._reconstruyendo = asyncio.ensure_future(self._reconstruir())
+                self._reconstruyendo.add_done_callback(self._fin_reconstruccion)
+            instantanea = await asyncio.shield(self._reconstruyendo)
+            if instantanea.version >= pedida:
+                return instantanea
+
+    def _fin_reconstruccion(self, tarea):
+        if self._reconstruyendo is tarea:
+            self._reconstruyendo = None
+        if not tarea.cancelled():
+            tarea.exception()  # Evita el aviso de excepción no recuperada
+
+    async def _reconstruir(self):
+        version = self.version
+        version_nombres = self.version_nombres
+        query = """
+        /* catalogo.instantanea */
+        SELECT ProductoID, Nombre, Precio, Stock, Imagen, CAST(Version AS BIGINT) AS Version
+        FROM Productos
+        ORDER BY ProductoID;
+        """
+        filas = await self._bd.fetch(query)
+        productos = [
+            {
+                "id": fila['ProductoID'],
+                "nombre": fila['Nombre'],
+                "precio": float(fila['Precio']),
+                "stock": fila['Stock'],
+                "imagen": f"/imgs/{fila['Imagen']}" if fila['Imagen'] else None,
+                "variantes": self._variantes_de(fila['Imagen']) if self._variantes_de and fila['Imagen'] else None
+            }
+            for fila in filas
+        ]
+        huella = (len(filas), max((fila['Version'] for fila in filas), default=None))
+        cuerpo = serializar(productos)
+        instantanea = Instantanea(version, productos, cuerpo, calcular_etag(cuerpo), huella,
+                                  time.monotonic(), {})
+        self._instantanea = instantanea
+
+        # Con nombres repetidos gana el de menor ProductoID
+        nombres = {}
+        for producto in reversed(productos):
+            nombres[producto['nombre']] = (producto['id'], producto['precio'])
+        self._nombres = (version_nombres, instantanea.creada, nombres)
+        return instantanea
+
+    @staticmethod
+    def vista(instantanea, nombre, construir):
+        # Serializa una sola vez por instantánea otra forma de presentar los productos
+        vista = instantanea.vistas.get(nombre)
+        if vista is None:
+            cuerpo = serializar(construir(instantanea.productos))
+            vista = (cuerpo, calcular_etag(cuerpo))
+            instantanea.vistas[nombre] = vista
+        return vista
+
+    async def vigilar(self):
+        query = "/* catalogo.huella */ SELECT COUNT_BIG(*) AS Total, CAST(MAX(Version) AS BIGINT) AS Version FROM Productos;"
+        while True:
+            await asyncio.sleep(self.intervalo)
+            instantanea = self._instantanea
+            if instantanea is None or instantanea.version != self.version:
+                continue
+            try:
+                fila = await self._bd.fetch_one(query)
+            except Exception as e:
+                logger.error(f"No se pudo revisar la versión del catálogo: {e}")
+                continue
+            if (fila['Total'], fila['Version']) != instantanea.huella:
+                self.invalidar()
@@ -0,0 +1,119 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from dotenv import load_dotenv
+
+from metricas import registro
+
+load_dotenv()
+
+# Configuración del servicio de contraseñas
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))  # Factor de trabajo de los hashes nuevos
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', str(os.cpu_count() or 1)))
+BCRYPT_MAX_QUEUE = int(os.getenv('BCRYPT_MAX_QUEUE', str(BCRYPT_WORKERS * 8)))  # Operaciones pendientes permitidas
+
+
+DURACION_BCRYPT = registro.histograma(
+    "bcrypt_duracion_segundos", "Duración de cada hash o verificación, incluida la espera en el pool de procesos",
+    ("operacion",)
+)
+RECHAZOS_BCRYPT = registro.contador(
+    "bcrypt_rechazos_total", "Operaciones rechazadas por haber demasiadas en curso"
+)
+
+
+class ServicioSaturado(Exception):
+    pass
+
+
+# Estas funciones corren dentro de los procesos del pool
+def _hashear(contrasena, rondas):
+    return bcrypt.hashpw(contrasena.encode('utf-8'), bcrypt.gensalt(rounds=rondas)).decode('utf-8')
+
+
+def _verificar(contrasena, hashed):
+    try:
+        return bcrypt.checkpw(contrasena.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        # Hash con formato inválido (por ejemplo, una contraseña guardada en texto plano)
+        return False
+
+
+def costo_hash(hashed):
+    # Formato bcrypt: $2b$12$<salt+hash>
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class ServicioContrasenas:
+    """Hashea y verifica contraseñas con bcrypt en un pool de procesos.
+
+    bcrypt ocupa la CPU durante cientos de milisegundos, así que se ejecuta
+    fuera del event loop. Si ya hay ``max_pendientes`` operaciones en curso
+    se rechaza la petición con ``ServicioSaturado`` en lugar de encolarla
+    sin límite.
+    """
+
+    def __init__(self, workers=BCRYPT_WORKERS, max_pendientes=BCRYPT_MAX_QUEUE, rondas=BCRYPT_ROUNDS):
+        self.workers = workers
+        self.max_pendientes = max_pendientes
+        self.rondas = rondas
+        self._pendientes = 0
+        self._ejecutor = None
+
+    @property
+    def pendientes(self):
+        return self._pendientes
+
+    def iniciar(self):
+        if self._ejecutor is None:
+            # 'spawn' evita heredar los hilos del proceso principal (pool de base de datos)
+            self._ejecutor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def cerrar(self):
+        if self._ejecutor is not None:
+            self._ejecutor.shutdown(wait=True, cancel_futures=True)
+            self._ejecutor = None
+
+    async def hashear(self, contrasena):
+        return await self._enviar("hashear", _hashear, contrasena, self.rondas)
+
+    async def verificar(self, contrasena, hashed):
+        return await self._enviar("verificar", _verificar, contrasena, hashed)
+
+    def necesita_rehash(self, hashed):
+        # El hash se creó con otro factor de trabajo del configurado
+        return costo_hash(hashed) != self.rondas
+
+    async def _enviar(self, operacion, funcion, *args):
+        if self._pendientes >= self.max_pendientes:
+            RECHAZOS_BCRYPT.inc()
+            raise ServicioSaturado("Demasiadas operaciones de contraseña en curso")
+        self.iniciar()
+        self._pendientes += 1
+        inicio = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._ejecutor, funcion, *args)
+        except BrokenProcessPool:
+            # Un proceso murió: recrear el pool en la próxima llamada
+            self._ejecutor = None
+            raise
+        finally:
+            self._pendientes -= 1
+            DURACION_BCRYPT.observar(time.perf_counter() - inicio, operacion)
+
+
+hasher = ServicioContrasenas()
+
+registro.funcion("bcrypt_operaciones_pendientes", "Operaciones de contraseña en curso o en cola",
+                 lambda: hasher.pendientes)
@@ -0,0 +1,145 @@
+import os
+import re
+import gzip
+import mimetypes
+import tempfile
+
+from dotenv import load_dotenv
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+
+try:
+    import brotli
+except ImportError:  # Sin el paquete brotli solo se generan las versiones .gz
+    brotli = None
+
+load_dotenv()
+
+# Cache-Control de los archivos estáticos
+STATIC_CACHE_CONTROL = os.getenv('STATIC_CACHE_CONTROL', 'public, no-cache')
+STATIC_IMMUTABLE_CACHE_CONTROL = os.getenv('STATIC_IMMUTABLE_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+
+# Nombres derivados del contenido (imgs/<sha256>.<ext> y sus variantes): nunca cambian de contenido
+_NOMBRE_CON_HASH = re.compile(r"^[0-9a-f]{64}(-\d+w)?\.[a-z0-9]+$")
+# Formatos de texto que vale la pena comprimir de antemano
+EXTENSIONES_COMPRIMIBLES = {".html", ".css", ".js", ".svg", ".json", ".txt"}
+# Codificación -> extensión del archivo hermano, en orden de preferencia
+CODIFICACIONES = [("br", ".br"), ("gzip", ".gz")]
+
+
+def codificaciones_aceptadas(accept_encoding):
+    # Accept-Encoding: "gzip, br;q=0.5, deflate;q=0"; las de q=0 quedan fuera
+    aceptadas = set()
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.partition(";")
+        nombre = nombre.strip().lower()
+        calidad = parametros.strip()
+        if calidad.startswith("q="):
+            try:
+                if float(calidad[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if nombre:
+            aceptadas.add(nombre)
+    return aceptadas
+
+
+def _escribir_comprimido(ruta, contenido):
+    # Temporal en la misma carpeta + os.replace: nunca se sirve un archivo a medio escribir
+    descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), prefix=".comprimido-")
+    try:
+        with os.fdopen(descriptor, "wb") as destino:
+            destino.write(contenido)
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+
+
+def _comprimir(contenido, codificacion):
+    if codificacion == "br":
+        return brotli.compress(contenido, quality=11)
+    return gzip.compress(contenido, compresslevel=9, mtime=0)
+
+
+class ArchivosEstaticos(StaticFiles):
+    """StaticFiles con caché inmutable para nombres con hash y versiones precomprimidas.
+
+    Los archivos cuyo nombre es un hash de su contenido se sirven con
+    ``Cache-Control: immutable`` por un año; el resto con revalidación
+    (ETag / If-None-Match). ``precomprimir()`` genera al arrancar los
+    hermanos ``.br``/``.gz`` de los archivos de texto, que se entregan
+    según Accept-Encoding. Range, If-Range y el envío sin copia
+    (extensión ``http.response.pathsend``, si el servidor la ofrece) los
+    resuelve FileResponse de Starlette.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Ruta original -> ((st_mtime, st_size) del original, {codificación: (ruta, stat)})
+        self._comprimidos = {}
+
+    def precomprimir(self):
+        """Crea (o renueva si el original cambió) los .br/.gz de la carpeta; devuelve cuántos escribió."""
+        escritos = 0
+        comprimidos = {}
+        for carpeta, _, archivos in os.walk(self.directory):
+            for archivo in archivos:
+                if os.path.splitext(archivo)[1].lower() not in EXTENSIONES_COMPRIMIBLES:
+                    continue
+                ruta = os.path.realpath(os.path.join(carpeta, archivo))
+                original = os.stat(ruta)
+                contenido = None
+                hermanos = {}
+                for codificacion, extension in CODIFICACIONES:
+                    if codificacion == "br" and brotli is None:
+                        continue
+                    ruta_comprimida = ruta + extension
+                    try:
+                        actual = os.stat(ruta_comprimida)
+                    except FileNotFoundError:
+                        actual = None
+                    if actual is None or actual.st_mtime < original.st_mtime:
+                        if contenido is None:
+                            with open(ruta, "rb") as origen:
+                                contenido = origen.read()
+                        comprimido = _comprimir(contenido, codificacion)
+                        if len(comprimido) >= original.st_size:
+                            continue  # No ahorra nada
+                        _escribir_comprimido(ruta_comprimida, comprimido)
+                        actual = os.stat(ruta_comprimida)
+                        escritos += 1
+                    hermanos[codificacion] = (ruta_comprimida, actual)
+                if hermanos:
+                    comprimidos[ruta] = ((original.st_mtime, original.st_size), hermanos)
+        self._comprimidos = comprimidos
+        return escritos
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        cabeceras = {"Cache-Control": STATIC_IMMUTABLE_CACHE_CONTROL
+                     if _NOMBRE_CON_HASH.match(os.path.basename(full_path)) else STATIC_CACHE_CONTROL}
+
+        ruta, estado, media_type = full_path, stat_result, None
+        comprimidos = self._comprimidos.get(full_path)  # lookup_path ya devuelve la ruta real
+        if comprimidos is not None:
+            cabeceras["Vary"] = "Accept-Encoding"
+            huella, hermanos = comprimidos
+            # Si el original cambió después de precomprimir, se sirve el original
+            if huella == (stat_result.st_mtime, stat_result.st_size):
+                aceptadas = codificaciones_aceptadas(request_headers.get("accept-encoding", ""))
+                for codificacion, _ in CODIFICACIONES:
+                    if codificacion in aceptadas and codificacion in hermanos:
+                        ruta, estado = hermanos[codificacion]
+                        media_type = mimetypes.guess_type(str(full_path))[0]
+                        cabeceras["Content-Encoding"] = codificacion
+                        break
+
+        response = FileResponse(ruta, status_code=status_code, stat_result=estado,
+                                media_type=media_type, headers=cabeceras)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
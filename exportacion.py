@@ -0,0 +1,80 @@
+import io
+import csv
+import json
+import zlib
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from estaticos import codificaciones_aceptadas
+
+FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _ndjson(filas, campos, elegidos, salida, _escritor):
+    for fila in filas:
+        item = {}
+        for nombre in elegidos:
+            convertir = campos[nombre].convertir
+            item[nombre] = convertir(fila[nombre]) if convertir else fila[nombre]
+        salida.write(json.dumps(item, ensure_ascii=False, separators=(",", ":"), default=str))
+        salida.write("\n")
+
+
+def _csv(filas, campos, elegidos, _salida, escritor):
+    for fila in filas:
+        valores = []
+        for nombre in elegidos:
+            convertir = campos[nombre].convertir
+            valores.append(convertir(fila[nombre]) if convertir else fila[nombre])
+        escritor.writerow(valores)
+
+
+async def _generar(lotes, formato, campos, elegidos, comprimir):
+    # gzip (wbits=31) incremental: cada lote se comprime y se envía en cuanto está listo
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+    salida = io.StringIO()
+    escritor = csv.writer(salida, lineterminator="\n")
+    escribir = _csv if formato == "csv" else _ndjson
+
+    if formato == "csv":
+        escritor.writerow(elegidos)
+    try:
+        async for filas in lotes:
+            escribir(filas, campos, elegidos, salida, escritor)
+            datos = salida.getvalue().encode("utf-8")
+            salida.seek(0)
+            salida.truncate()
+            if compresor is not None:
+                datos = compresor.compress(datos)
+            if datos:
+                yield datos
+    finally:
+        # Si el cliente se desconecta, liberar la conexión de inmediato
+        await lotes.aclose()
+
+    resto = salida.getvalue().encode("utf-8")
+    if compresor is not None:
+        resto = compresor.compress(resto) + compresor.flush()
+    if resto:
+        yield resto
+
+
+def respuesta_exportacion(request, lotes, formato, campos, elegidos, nombre_archivo):
+    """StreamingResponse en NDJSON o CSV, comprimida con gzip si el cliente la acepta."""
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {formato}")
+    comprimir = "gzip" in codificaciones_aceptadas(request.headers.get("accept-encoding", ""))
+    cabeceras = {
+        "Content-Disposition": f'attachment; filename="{nombre_archivo}.{formato}"',
+        "Vary": "Accept-Encoding",
+    }
+    if comprimir:
+        cabeceras["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        _generar(lotes, formato, campos, elegidos, comprimir),
+        media_type=FORMATOS[formato], headers=cabeceras
+    )
@@ -0,0 +1,133 @@
+import os
+import re
+import asyncio
+import hashlib
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+from starlette.responses import JSONResponse
+
+from cache import CacheLRU
+
+load_dotenv()
+
+# Configuración de las claves de idempotencia
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))  # Tiempo que se recuerda la respuesta de una clave
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+CABECERA_IDEMPOTENCIA = b"idempotency-key"
+MAX_LARGO_CLAVE = 255
+
+
+class RespuestaGuardada(NamedTuple):
+    huella: str  # Hash del cuerpo de la petición original
+    estado: int
+    cabeceras: list
+    cuerpo: bytes
+
+
+def _respuesta_error(estado, detalle):
+    # Mismo formato que las HTTPException del resto de la API
+    return JSONResponse({"detail": detalle}, status_code=estado)
+
+
+async def _enviar(send, estado, cabeceras, cuerpo):
+    await send({"type": "http.response.start", "status": estado, "headers": cabeceras})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+class MiddlewareIdempotencia:
+    """Repite la primera respuesta de una petición con la misma cabecera Idempotency-Key.
+
+    Solo aplica a las rutas indicadas (método y expresión regular de la
+    ruta). La clave se guarda por sesión, método y ruta, junto con un hash
+    del cuerpo: reutilizarla con otro cuerpo responde 422. Si llega un
+    duplicado mientras la primera petición sigue en curso, espera su
+    resultado en lugar de ejecutarse otra vez. Las respuestas 5xx no se
+    guardan, para que un reintento posterior pueda salir bien. El almacén
+    es de cada proceso: con varios workers un reintento que cae en otro
+    worker no se detecta aquí.
+    """
+
+    def __init__(self, app, rutas, ttl=IDEMPOTENCY_TTL, max_tamano=IDEMPOTENCY_CACHE_SIZE):
+        self.app = app
+        self._rutas = [(metodo, re.compile(patron)) for metodo, patron in rutas]
+        self._respuestas = CacheLRU(max_tamano, ttl)
+        self._en_curso = {}
+
+    def _aplica(self, scope):
+        if scope["type"] != "http":
+            return False
+        return any(scope["method"] == metodo and patron.fullmatch(scope["path"])
+                   for metodo, patron in self._rutas)
+
+    async def __call__(self, scope, receive, send):
+        clave_cliente = None
+        if self._aplica(scope):
+            clave_cliente = next((valor for nombre, valor in scope["headers"] if nombre == CABECERA_IDEMPOTENCIA), None)
+        if clave_cliente is None:
+            await self.app(scope, receive, send)
+            return
+        if not clave_cliente or len(clave_cliente) > MAX_LARGO_CLAVE:
+            await _respuesta_error(400, "Idempotency-Key no válida")(scope, receive, send)
+            return
+
+        # El cuerpo se lee completo (son JSON pequeños) para poder compararlo y volver a entregarlo
+        partes = []
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "http.disconnect":
+                return
+            partes.append(mensaje.get("body", b""))
+            if not mensaje.get("more_body"):
+                break
+        cuerpo_peticion = b"".join(partes)
+        huella = hashlib.blake2b(cuerpo_peticion, digest_size=16).hexdigest()
+
+        sesion = scope.get("state", {}).get("sesion")
+        clave = (sesion.token_id if sesion else None, scope["method"], scope["path"], clave_cliente)
+
+        guardada = self._respuestas.get(clave)
+        while guardada is None and clave in self._en_curso:
+            # Si la primera termina sin respuesta, uno de los que esperaban pasa a ejecutarla
+            guardada = await asyncio.shield(self._en_curso[clave])
+        if guardada is not None:
+            if guardada.huella != huella:
+                await _respuesta_error(422, "Idempotency-Key ya usada con otra petición")(scope, receive, send)
+                return
+            cabeceras = guardada.cabeceras + [(b"idempotent-replayed", b"true")]
+            await _enviar(send, guardada.estado, cabeceras, guardada.cuerpo)
+            return
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_curso[clave] = futuro
+        respuesta = {"estado": None, "cabeceras": [], "cuerpo": []}
+        entregado = False
+
+        async def recibir():
+            nonlocal entregado
+            if not entregado:
+                entregado = True
+                return {"type": "http.request", "body": cuerpo_peticion, "more_body": False}
+            return await receive()
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                respuesta["estado"] = mensaje["status"]
+                respuesta["cabeceras"] = [(nombre, valor) for nombre, valor in mensaje.get("headers", [])
+                                          if nombre.lower() != b"set-cookie"]
+            elif mensaje["type"] == "http.response.body":
+                respuesta["cuerpo"].append(mensaje.get("body", b""))
+            await send(mensaje)
+
+        guardada = None
+        try:
+            await self.app(scope, recibir, enviar)
+            if respuesta["estado"] is not None:
+                guardada = RespuestaGuardada(huella, respuesta["estado"], respuesta["cabeceras"],
+                                             b"".join(respuesta["cuerpo"]))
+                if guardada.estado < 500:
+                    self._respuestas.set(clave, guardada)
+        finally:
+            del self._en_curso[clave]
+            # Los duplicados que esperaban reciben la misma respuesta (o se ejecutan si no la hubo)
+            futuro.set_result(guardada)
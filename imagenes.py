@@ -0,0 +1,93 @@
+import os
+import hashlib
+import tempfile
+import asyncio
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuración de la subida de imágenes
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(5 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(64 * 1024)))
+CARPETA_IMAGENES = "imgs"
+
+# Firmas (magic bytes) de los formatos aceptados y su extensión
+FIRMAS_IMAGEN = [
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+
+class ImagenRechazada(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado  # Código HTTP con el que responder
+
+
+def detectar_extension(cabecera):
+    # El tipo se decide por el contenido, no por el nombre ni el Content-Type del cliente
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return ".webp"
+    for firma, extension in FIRMAS_IMAGEN:
+        if cabecera.startswith(firma):
+            return extension
+    return None
+
+
+def _guardar(origen, carpeta, max_bytes, tamano_trozo):
+    # Copia por trozos a un temporal de la misma carpeta, calculando el SHA-256 a la vez
+    descriptor, temporal = tempfile.mkstemp(dir=carpeta, prefix=".subida-")
+    try:
+        resumen = hashlib.sha256()
+        extension = None
+        total = 0
+        with os.fdopen(descriptor, "wb") as destino:
+            while True:
+                trozo = origen.read(tamano_trozo)
+                if not trozo:
+                    break
+                if extension is None:
+                    extension = detectar_extension(trozo)
+                    if extension is None:
+                        raise ImagenRechazada(415, "Formato de imagen no soportado (PNG, JPEG, GIF o WebP)")
+                total += len(trozo)
+                if total > max_bytes:
+                    raise ImagenRechazada(413, f"La imagen supera el máximo de {max_bytes} bytes")
+                resumen.update(trozo)
+                destino.write(trozo)
+            destino.flush()
+            os.fsync(destino.fileno())
+        if total == 0:
+            raise ImagenRechazada(400, "La imagen está vacía")
+
+        # Nombre por contenido: la misma imagen subida para otro producto reutiliza el archivo
+        nombre = resumen.hexdigest() + extension
+        ruta = os.path.join(carpeta, nombre)
+        if os.path.exists(ruta):
+            os.unlink(temporal)
+        else:
+            os.replace(temporal, ruta)
+        return nombre
+    except BaseException:
+        try:
+            os.unlink(temporal)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+async def guardar_imagen(imagen, carpeta=CARPETA_IMAGENES, max_bytes=UPLOAD_MAX_BYTES,
+                         tamano_trozo=UPLOAD_CHUNK_SIZE):
+    """Guarda un UploadFile en ``carpeta`` y devuelve su nombre (``<sha256>.<ext>``).
+
+    La copia entera corre en un hilo para no bloquear el event loop. Se
+    corta en cuanto se pasa de ``max_bytes`` (413) o si los primeros bytes
+    no son de un formato de imagen conocido (415). El archivo aparece en
+    la carpeta de una vez (``os.replace``), nunca a medio escribir.
+    """
+    if imagen.size is not None and imagen.size > max_bytes:
+        raise ImagenRechazada(413, f"La imagen supera el máximo de {max_bytes} bytes")
+    return await asyncio.to_thread(_guardar, imagen.file, carpeta, max_bytes, tamano_trozo)
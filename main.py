@@ -1,25 +1,99 @@
 import os
-import pymssql
-from fastapi import FastAPI, HTTPException, Request, File, UploadFile, Form, status, Depends
+import json
+import time
+import asyncio
+import logging
+import secrets
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response, File, UploadFile, Form, Query, status, Depends, BackgroundTasks
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
+from datetime import datetime, date
 from fastapi.middleware.cors import CORSMiddleware
-import shutil
-from fastapi.staticfiles import StaticFiles
-from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi.responses import RedirectResponse, JSONResponse
-import bcrypt
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv  # Importar la librería
 
+from basedatos import db, codigo_error
+from contrasenas import hasher, ServicioSaturado
+from sesiones import AlmacenSesiones, Sesion, COOKIE_SESION, token_de_peticion
+from catalogo import CatalogoProductos, serializar
+from cache_http import respuesta_condicional, calcular_etag
+from cache import ValorSWR
+from resumenes import ResumenVentas, QUERY_DESCONTAR_PEDIDO
+from analitica import AnaliticaPedidos, elegir_granularidad
+from reservas import ReservasStock
+from idempotencia import MiddlewareIdempotencia
+from auditoria import EscritorAuditoria
+from imagenes import guardar_imagen, ImagenRechazada
+from variantes import variantes, IMAGE_VARIANT_BACKFILL
+from estaticos import ArchivosEstaticos
+from autenticacion import MiddlewareAutenticacion, publica
+from metricas import registro, MiddlewareMetricas, METRICS_TOKEN, TIPO_CONTENIDO
+from bitacora import bitacora, ORDENES, CONSULTAS_PLANIFICABLES
+from exportacion import respuesta_exportacion
+from paginacion import (
+    Campo, formato_fecha, elegir_campos, limite_pagina, consulta_paginada,
+    armar_pagina, pagina_en_memoria, cabeceras_pagina
+)
+
 load_dotenv()  # Cargar el archivo .env
 
-app = FastAPI()
+# Registro de eventos de la aplicación (nivel configurable con LOG_LEVEL)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def ciclo_vida(app: FastAPI):
+    # Abrir las conexiones mínimas del pool (prueba de conexión)
+    try:
+        await db.precalentar()
+        logger.info("Connection successful")
+    except Exception as e:
+        logger.error(f"Connection failed: {e}")
+    # Versiones .br/.gz de los HTML de static/ (solo se recomprimen los que cambiaron)
+    try:
+        await asyncio.to_thread(archivos_static.precomprimir)
+    except Exception as e:
+        logger.error(f"No se pudieron precomprimir los archivos estáticos: {e}")
+    hasher.iniciar()
+    variantes.iniciar()
+    auditoria.iniciar()
+    vigilancia_catalogo = asyncio.create_task(catalogo.vigilar())
+    reconciliacion_ventas = asyncio.create_task(resumen_ventas.vigilar())
+    barrido_reservas = asyncio.create_task(reservas.vigilar())
+    relleno_variantes = asyncio.create_task(rellenar_variantes()) if IMAGE_VARIANT_BACKFILL else None
+    yield
+    vigilancia_catalogo.cancel()
+    reconciliacion_ventas.cancel()
+    barrido_reservas.cancel()
+    if relleno_variantes is not None:
+        relleno_variantes.cancel()
+    hasher.cerrar()
+    variantes.cerrar()
+    # Escribir los eventos de auditoría pendientes antes de cerrar el pool
+    await auditoria.cerrar()
+    db.cerrar()
+
+
+app = FastAPI(lifespan=ciclo_vida)
+
+# Instantánea en memoria del catálogo de productos
+catalogo = CatalogoProductos(db, variantes_de=variantes.srcset)
 
-# Cargar las variables de entorno
-server = os.getenv('DB_SERVER')
-database = os.getenv('DB_DATABASE')
-username = os.getenv('DB_USERNAME')
-password = os.getenv('DB_PASSWORD')
+# Totales de ventas por producto (tabla ResumenVentasProducto)
+resumen_ventas = ResumenVentas(db)
+
+# Series de pedidos por periodo (tabla ResumenPedidosDia)
+analitica = AnaliticaPedidos(db)
+
+# Reservas temporales de stock; cada cambio de stock invalida el catálogo
+reservas = ReservasStock(db, al_cambiar_stock=catalogo.invalidar)
+
+# Eventos de AuditoriaCRUD escritos por lotes en segundo plano
+auditoria = EscritorAuditoria(db)
 
 
 # Configuración de CORS para permitir el origen específico y credenciales
@@ -44,56 +118,13 @@ app.add_middleware(
     allow_headers=["*"],  # Puedes limitar las cabeceras específicas si es necesario
 )
 
-# Función para ejecutar consultas
-def ejecutar_consulta(query, params=None):
-    try:
-        conn = pymssql.connect(server=server, user=username, password=password, database=database)
-        cursor = conn.cursor(as_dict=True)
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
-        
-        if query.strip().upper().startswith("SELECT"):
-            resultados = cursor.fetchall()
-        else:
-            conn.commit()
-            resultados = True
-
-        conn.close()
-        return resultados
-    except Exception as e:
-        print(f"Error al conectar con la base de datos: {e}")
-        return None
-# Prueba de conexión
-try:
-    conn = pymssql.connect(server=server, user=username, password=password, database=database)
-    print("Connection successful")
-    conn.close()
-except Exception as e:
-    print(f"Connection failed: {e}")
-
 @app.get("/")
-def read_root():
+async def read_root():
     return {"Hello": "World"}
 
-@app.post("/login")
-def login(username: str, password: str):
-    query = "SELECT * FROM Users WHERE username=%s AND password=%s"
-    params = (username, password)
-    result = ejecutar_consulta(query, params)
-    if result:
-        return {"status": "success", "data": result}
-    else:
-        raise HTTPException(status_code=400, detail="Invalid username or password")
-
-def registrar_auditoria(tipo_operacion, tabla, registro_id, usuario):
-    query = """
-    INSERT INTO AuditoriaCRUD (TipoOperacion, Tabla, RegistroID, Usuario)
-    VALUES (%s, %s, %s, %s);
-    """
-    params = (tipo_operacion, tabla, registro_id, usuario)
-    ejecutar_consulta(query, params)
+async def registrar_auditoria(tipo_operacion, tabla, registro_id, usuario):
+    # Solo encola el evento; EscritorAuditoria lo inserta junto con otros en un mismo INSERT
+    await auditoria.registrar(tipo_operacion, tabla, registro_id, usuario)
 
 class ClienteCreate(BaseModel):
     nombre: str
@@ -110,6 +141,7 @@ class LoginRequest(BaseModel):
 class LoginResponse(BaseModel):
     mensaje: str
     tipo_usuario: Optional[str] = None
+    token: Optional[str] = None
 
 class Producto(BaseModel):
     id: Optional[int]
@@ -117,6 +149,7 @@ class Producto(BaseModel):
     precio: float
     stock: int
     imagen: Optional[str] = None
+    variantes: Optional[dict] = None  # {formato: srcset} con las versiones reducidas de la imagen
     
 class ProductoCreateUpdate(BaseModel):
     nombre: str
@@ -135,8 +168,11 @@ class PedidoResponse(BaseModel):
     
 class ProductoCarrito(BaseModel):
     nombre: str
-    precio: float
+    precio: Optional[float] = None  # Solo informativo: se cobra el precio actual del producto
     cantidad: int
+
+class CarritoRequest(BaseModel):
+    productos: List[ProductoCarrito]
     
 class DeleteResponse(BaseModel):
     mensaje: str
@@ -153,180 +189,272 @@ class Venta(BaseModel):
 
 
 
-# Middleware de autenticación
-class AuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Definir rutas que no requieren autenticación
-        allowed_paths = ["/login", "/cliente/registrar", "/CargaLogin.html", "/productos"]
+# Almacén de sesiones (token firmado + caché en memoria + SesionesClientes)
+almacen_sesiones = AlmacenSesiones(db)
 
-        # Permitir acceso público a las rutas permitidas
-        if request.url.path not in allowed_paths and not usuario_actual.get("nombre_usuario"):
-            return RedirectResponse(url='/CargaLogin.html')
-        
-        # Llamar al siguiente middleware o al controlador de endpoint
-        response = await call_next(request)
-        return response
+# Idempotency-Key en las rutas que crean o cancelan pedidos; va dentro de MiddlewareAutenticacion
+# para que cada clave quede asociada a la sesión
+app.add_middleware(MiddlewareIdempotencia, rutas=[
+    ("POST", r"/comprar-producto"),
+    ("POST", r"/productos/\d+/comprar"),
+    ("POST", r"/carrito/checkout"),
+    ("DELETE", r"/pedido/\d+"),
+    ("POST", r"/reservas"),
+    ("POST", r"/reservas/\d+/confirmar"),
+])
+
+# Middleware de autenticación: las rutas sin sesión se marcan con @publica en cada endpoint
+app.add_middleware(MiddlewareAutenticacion, almacen=almacen_sesiones, router=app.router,
+                   prefijos_publicos=("/imgs/", "/static/"))
+
+# Latencia por ruta; va por fuera de todo para medir también la autenticación
+app.add_middleware(MiddlewareMetricas)
+
+registro.funcion("auditoria_eventos_pendientes", "Eventos de auditoría en cola sin escribir",
+                 lambda: auditoria.pendientes)
+
+# Métricas en formato Prometheus; con METRICS_TOKEN definido se exige como Bearer
+@app.get("/metrics", include_in_schema=False)
+@publica
+async def metricas(request: Request):
+    if METRICS_TOKEN:
+        autorizacion = request.headers.get("authorization", "")
+        if not secrets.compare_digest(autorizacion.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            raise HTTPException(status_code=401, detail="Token de métricas no válido")
+    return Response(content=registro.exponer(), media_type=TIPO_CONTENIDO)
+
+# Dependencia para obtener la sesión de la petición actual
+def sesion_actual(request: Request) -> Optional[Sesion]:
+    return getattr(request.state, "sesion", None)
+
+
+def cliente_de_sesion(sesion):
+    # ClienteID de la sesión, o 401 si no es una sesión de cliente
+    cliente_id = sesion.cliente_id if sesion else None
+    if not cliente_id:
+        raise HTTPException(status_code=401, detail="Usuario no autenticado")
+    return cliente_id
 
-# Agregar el middleware a la aplicación FastAPI
-app.add_middleware(AuthMiddleware)
 
-# Variable global para almacenar el estado del usuario actual
-usuario_actual = {"tipo_usuario": None, "nombre_usuario": None, "cliente_id": None}
+# Errores lanzados con THROW en los procedimientos almacenados
+ERRORES_PROCEDIMIENTOS = {
+    50001: (400, "Stock insuficiente"),
+    50002: (404, "Producto no encontrado"),
+    50003: (404, "La reserva no existe o ha vencido"),
+}
+
+def error_http(e):
+    # HTTPException para un error conocido de los procedimientos, o 500
+    estado, detalle = ERRORES_PROCEDIMIENTOS.get(codigo_error(e), (500, str(e)))
+    return HTTPException(status_code=estado, detail=detalle)
 
 
 
 # Endpoint para obtener el rol del usuario
 @app.get("/user-role")
-def get_user_role():
-    print(f"Current user: {usuario_actual}")  # Log para depuración
-    if not usuario_actual["nombre_usuario"]:
+async def get_user_role(sesion: Optional[Sesion] = Depends(sesion_actual)):
+    logger.debug(f"Current user: {sesion}")
+    if sesion is None:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    return {"role": usuario_actual["tipo_usuario"]}
+    return {"role": sesion.tipo_usuario}
 
 
 # Endpoint para la página de usuario
 @app.get("/user-page")
-def user_page():
-    if usuario_actual["tipo_usuario"] != "cliente":
+async def user_page(sesion: Optional[Sesion] = Depends(sesion_actual)):
+    if sesion is None or sesion.tipo_usuario != "cliente":
         raise HTTPException(status_code=403, detail="Access forbidden: insufficient permissions")
     return {"message": "Access granted"}
 
 # Endpoint para la página de administrador
 @app.get("/admin-page")
-def admin_page():
-    if usuario_actual["tipo_usuario"] != "administrador":
+async def admin_page(sesion: Optional[Sesion] = Depends(sesion_actual)):
+    if sesion is None or sesion.tipo_usuario != "administrador":
         raise HTTPException(status_code=403, detail="Access forbidden: insufficient permissions")
     return {"message": "Access granted"}
 
+def guardar_cookie_sesion(response: Response, token):
+    # El frontend está en otro dominio, por eso SameSite=None (requiere Secure)
+    response.set_cookie(
+        COOKIE_SESION, token, max_age=almacen_sesiones.max_edad,
+        httponly=True, secure=True, samesite="none"
+    )
+
 @app.post("/cliente/registrar")
+@publica
 async def registrar_cliente(cliente: ClienteCreate):
     try:
-        # Cifrar la contraseña
-        hashed_password = bcrypt.hashpw(cliente.contrasena.encode('utf-8'), bcrypt.gensalt())
+        # Cifrar la contraseña (en el pool de procesos)
+        hashed_password = await hasher.hashear(cliente.contrasena)
         
         query = """
+        /* clientes.registrar */
         INSERT INTO Clientes (Nombre, Apellido, CorreoElectronico, NombreUsuario, Contrasena)
+        OUTPUT inserted.ClienteID
         VALUES (%s, %s, %s, %s, %s);
         """
-        params = (cliente.nombre, cliente.apellido, cliente.correo_electronico, cliente.nombre_usuario, hashed_password.decode('utf-8'))
-        ejecutar_consulta(query, params)
+        params = (cliente.nombre, cliente.apellido, cliente.correo_electronico, cliente.nombre_usuario, hashed_password)
+        async with db.transaccion() as tx:
+            nuevo = await tx.fetch_one(query, params)
+        await registrar_auditoria("INSERT", "Clientes", nuevo['ClienteID'], cliente.nombre_usuario)
         return {"mensaje": "Cliente registrado exitosamente"}
+    except ServicioSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/login")
-async def iniciar_sesion(login: LoginRequest, request: Request):
+# Tabla y columna de ID de cada tipo de usuario
+TABLAS_USUARIO = {
+    "cliente": ("Clientes", "ClienteID"),
+    "administrador": ("Administradores", "AdministradorID"),
+}
+
+async def actualizar_hash(tabla, columna_id, registro_id, contrasena):
+    # Volver a hashear con el factor de trabajo actual tras un inicio de sesión correcto
     try:
-        print(f"Intentando iniciar sesión: nombre_usuario={login.nombre_usuario}")
+        nuevo_hash = await hasher.hashear(contrasena)
+        query = f"/* usuarios.rehash */ UPDATE {tabla} SET Contrasena = %s WHERE {columna_id} = %s;"
+        await db.execute(query, (nuevo_hash, registro_id))
+    except Exception as e:
+        logger.error(f"No se pudo actualizar el hash de {tabla} {registro_id}: {e}")
 
-        # Verificar si el usuario es un cliente
-        query_cliente = """
-        SELECT ClienteID, Contrasena FROM Clientes WHERE NombreUsuario = %s;
+@app.post("/login")
+@publica
+async def iniciar_sesion(login: LoginRequest, request: Request, response: Response, background_tasks: BackgroundTasks):
+    try:
+        logger.debug(f"Intentando iniciar sesión: nombre_usuario={login.nombre_usuario}")
+
+        # Buscar el usuario en Clientes y Administradores con una sola consulta
+        # (si el nombre existe en ambas tablas se toma el cliente)
+        query_usuario = """
+        /* login.buscar_usuario */
+        SELECT TOP 1 TipoUsuario, UsuarioID, Contrasena FROM (
+            SELECT 'cliente' AS TipoUsuario, ClienteID AS UsuarioID, Contrasena, 0 AS Orden
+            FROM Clientes WHERE NombreUsuario = %s
+            UNION ALL
+            SELECT 'administrador', AdministradorID, Contrasena, 1
+            FROM Administradores WHERE NombreUsuario = %s
+        ) AS u
+        ORDER BY Orden;
         """
-        params_cliente = (login.nombre_usuario,)
-        resultado_cliente = ejecutar_consulta(query_cliente, params_cliente)
-        
-        if resultado_cliente:
-            cliente_id = resultado_cliente[0]['ClienteID']
-            hashed_password = resultado_cliente[0]['Contrasena']
-            print(f"Cliente encontrado: ClienteID={cliente_id}")
-
-            if bcrypt.checkpw(login.contrasena.encode('utf-8'), hashed_password.encode('utf-8')):
-                # Manejo de sesión para el cliente
-                query_sesion = """
-                IF EXISTS (SELECT 1 FROM SesionesClientes WHERE ClienteID = %s)
-                    UPDATE SesionesClientes SET FechaInicio = GETDATE(), IP = %s WHERE ClienteID = %s
-                ELSE
-                    INSERT INTO SesionesClientes (ClienteID, FechaInicio, IP) VALUES (%s, GETDATE(), %s);
-                """
-                client_ip = request.client.host
-                params_sesion = (cliente_id, client_ip, cliente_id, cliente_id, client_ip)
-                ejecutar_consulta(query_sesion, params_sesion)
+        usuario = await db.fetch_one(query_usuario, (login.nombre_usuario, login.nombre_usuario))
 
-                return {"mensaje": "Inicio de sesión exitoso", "tipo_usuario": "cliente"}
+        # Un único chequeo de contraseña
+        if usuario and await hasher.verificar(login.contrasena, usuario['Contrasena']):
+            tipo_usuario = usuario['TipoUsuario']
+            usuario_id = usuario['UsuarioID']
+            logger.debug(f"Usuario encontrado: {tipo_usuario} {usuario_id}")
 
-        # Verificar si el usuario es un administrador
-        query_admin = """
-        SELECT AdministradorID, Contrasena FROM Administradores WHERE NombreUsuario = %s;
-        """
-        params_admin = (login.nombre_usuario,)
-        resultado_admin = ejecutar_consulta(query_admin, params_admin)
+            tabla, columna_id = TABLAS_USUARIO[tipo_usuario]
+            if hasher.necesita_rehash(usuario['Contrasena']):
+                background_tasks.add_task(actualizar_hash, tabla, columna_id, usuario_id, login.contrasena)
 
-        if resultado_admin:
-            administrador_id = resultado_admin[0]['AdministradorID']
-            hashed_password = resultado_admin[0]['Contrasena']
-            print(f"Administrador encontrado: AdministradorID={administrador_id}")
+            if tipo_usuario == "cliente":
+                token, sesion = almacen_sesiones.crear("cliente", login.nombre_usuario, cliente_id=usuario_id)
+                # La fila de SesionesClientes se escribe después de enviar la respuesta
+                client_ip = request.client.host if request.client else None
+                background_tasks.add_task(almacen_sesiones.registrar, sesion, client_ip)
+            else:
+                token, _ = almacen_sesiones.crear("administrador", login.nombre_usuario, administrador_id=usuario_id)
 
-            if bcrypt.checkpw(login.contrasena.encode('utf-8'), hashed_password.encode('utf-8')):
-                return {"mensaje": "Inicio de sesión exitoso", "tipo_usuario": "administrador"}
+            guardar_cookie_sesion(response, token)
+            return {"mensaje": "Inicio de sesión exitoso", "tipo_usuario": tipo_usuario, "token": token}
 
         # Si no se encuentra el usuario o las contraseñas no coinciden
         raise HTTPException(status_code=401, detail="Credenciales incorrectas o usuario no encontrado")
     except HTTPException as http_err:
         # Devolvemos la excepción HTTP tal como está
-        print(f"Error HTTP: {str(http_err.detail)}")
+        logger.info(f"Inicio de sesión rechazado: {http_err.detail}")
         raise
+    except ServicioSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         # Manejo de otros errores
-        print(f"Error durante el inicio de sesión: {str(e)}")
+        logger.error(f"Error durante el inicio de sesión: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 
 
 @app.post("/logout", response_model=LoginResponse)
-def cerrar_sesion():
+async def cerrar_sesion(request: Request, response: Response):
     try:
-        # Obtener el ClienteID automáticamente basado en la sesión activa
-        cliente_id = usuario_actual.get("cliente_id")
-
-        if cliente_id is not None:
-            # Actualizar la tabla SesionesClientes para marcar la sesión como cerrada
-            query = """
-            UPDATE SesionesClientes
-            SET FechaCierre = GETDATE()
-            WHERE ClienteID = %s AND FechaCierre IS NULL;
-            """
-            ejecutar_consulta(query, (cliente_id,))
+        # Cerrar la sesión del token actual (marca FechaCierre en SesionesClientes)
+        await almacen_sesiones.cerrar(token_de_peticion(request))
         
-        # Limpiar la información de sesión actual
-        usuario_actual["tipo_usuario"] = None
-        usuario_actual["nombre_usuario"] = None
-        usuario_actual["cliente_id"] = None
+        # Limpiar la cookie de sesión
+        response.delete_cookie(COOKIE_SESION, httponly=True, secure=True, samesite="none")
 
         return {"mensaje": "Sesión cerrada exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Campos disponibles en /sesiones-clientes (nombre en la API -> columna)
+CAMPOS_SESIONES = {
+    "SesionID": Campo("sc.SesionID"),
+    "ClienteID": Campo("sc.ClienteID"),
+    "NombreCliente": Campo("c.Nombre"),
+    "NombreUsuario": Campo("c.NombreUsuario"),
+    "FechaCierre": Campo("sc.FechaCierre"),
+    "FechaInicio": Campo("sc.FechaInicio"),
+    "IP": Campo("sc.IP"),
+}
+
 @app.get("/sesiones-clientes", response_model=List[dict])
-def obtener_sesiones_clientes():
+async def obtener_sesiones_clientes(
+    request: Request,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    desde: Optional[datetime] = Query(None, alias="from"),
+    hasta: Optional[datetime] = Query(None, alias="to")
+):
+    elegidos = elegir_campos(fields, CAMPOS_SESIONES, "SesionID")
+    limite = limite_pagina(limit)
     try:
-        query = """
-        SELECT sc.SesionID, sc.ClienteID, c.Nombre, c.NombreUsuario, sc.FechaInicio, sc.FechaCierre, sc.IP
-        FROM SesionesClientes sc
-        JOIN Clientes c ON sc.ClienteID = c.ClienteID;
-        """
-        sesiones = ejecutar_consulta(query)
-        lista_sesiones = [
-            {
-                "SesionID": sesion["SesionID"],
-                "ClienteID": sesion["ClienteID"],
-                "NombreCliente": sesion["Nombre"],
-                "NombreUsuario": sesion["NombreUsuario"],
-                "FechaCierre": sesion["FechaCierre"],
-                "FechaInicio": sesion["FechaInicio"],
-                "IP": sesion["IP"]
-            }
-            for sesion in sesiones
-        ]
-        return lista_sesiones
+        query, params = consulta_paginada(
+            CAMPOS_SESIONES, elegidos, "SesionID",
+            "FROM SesionesClientes sc JOIN Clientes c ON sc.ClienteID = c.ClienteID",
+            columna_fecha="sc.FechaInicio", cursor=cursor, limite=limite, desde=desde, hasta=hasta,
+            nombre="sesiones.pagina"
+        )
+        sesiones = await db.fetch(query, params)
+        lista_sesiones, siguiente = armar_pagina(sesiones, CAMPOS_SESIONES, elegidos, "SesionID", limite)
+        return JSONResponse(content=jsonable_encoder(lista_sesiones), headers=cabeceras_pagina(request, siguiente))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Configura la carpeta 'imgs' para servir archivos estáticos
-app.mount("/imgs", StaticFiles(directory="imgs"), name="imgs")
+# Imágenes y páginas estáticas: caché inmutable para nombres con hash, Range y versiones precomprimidas
+archivos_static = ArchivosEstaticos(directory="static")
+app.mount("/imgs", ArchivosEstaticos(directory="imgs"), name="imgs")
+app.mount("/static", archivos_static, name="static")
+
+@app.get("/CargaLogin.html", include_in_schema=False)
+@publica
+async def pagina_login(request: Request):
+    return await archivos_static.get_response("CargaLogin.html", request.scope)
+
+async def generar_variantes(imagen):
+    try:
+        await variantes.generar(imagen)
+        catalogo.invalidar()
+    except Exception as e:
+        logger.error(f"No se pudieron generar las variantes de {imagen}: {e}")
+
+async def rellenar_variantes():
+    # Variantes de las imágenes de productos que se subieron sin ellas
+    try:
+        instantanea = await catalogo.obtener()
+    except Exception as e:
+        logger.error(f"No se pudo leer el catálogo para generar variantes: {e}")
+        return
+    imagenes = {producto['imagen'].rsplit("/", 1)[-1] for producto in instantanea.productos if producto['imagen']}
+    if await variantes.rellenar(sorted(imagenes)):
+        catalogo.invalidar()
 
 @app.post("/productos", response_model=Producto)
-def crear_producto(
+async def crear_producto(
+    background_tasks: BackgroundTasks,
     nombre: str = Form(...), 
     precio: float = Form(...), 
     stock: int = Form(...), 
@@ -335,21 +463,24 @@ def crear_producto(
     try:
         filename = None
         if imagen:
-            # Guardar la imagen
-            filename = imagen.filename
-            filepath = f"imgs/{filename}"
-            with open(filepath, "wb") as buffer:
-                shutil.copyfileobj(imagen.file, buffer)
+            # Guardar la imagen con un nombre derivado de su contenido (se ignora el nombre del cliente)
+            filename = await guardar_imagen(imagen)
         
         query = """
+        /* productos.crear */
         INSERT INTO Productos (Nombre, Precio, Stock, Imagen)
         VALUES (%s, %s, %s, %s);
         """
         params = (nombre, precio, stock, filename)
-        ejecutar_consulta(query, params)
+        await db.execute(query, params)
+        catalogo.invalidar(nombres=True)
         
-        query = "SELECT TOP 1 ProductoID, Nombre, Precio, Stock, Imagen FROM Productos ORDER BY ProductoID DESC;"
-        producto_creado = ejecutar_consulta(query)[0]
+        query = "/* productos.ultimo_creado */ SELECT TOP 1 ProductoID, Nombre, Precio, Stock, Imagen FROM Productos ORDER BY ProductoID DESC;"
+        producto_creado = (await db.fetch(query))[0]
+        if filename and not variantes.tiene_variantes(filename):
+            # Las variantes reducidas se generan después de responder; una imagen ya subida
+            # (mismo contenido, mismo nombre) reutiliza las que tiene
+            background_tasks.add_task(generar_variantes, filename)
         
         return Producto(
             id=producto_creado['ProductoID'], 
@@ -358,37 +489,49 @@ def crear_producto(
             stock=producto_creado['Stock'], 
             imagen=f"/imgs/{producto_creado['Imagen']}" if producto_creado['Imagen'] else None
         )
+    except ImagenRechazada as e:
+        raise HTTPException(status_code=e.estado, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+CAMPOS_PRODUCTOS = {nombre: Campo(nombre) for nombre in Producto.model_fields}
+
 @app.get("/productos", response_model=List[Producto])
-def obtener_productos():
-    query = "SELECT ProductoID, Nombre, Precio, Stock, Imagen FROM Productos;"
-    productos = ejecutar_consulta(query)
-    lista_productos = [
-        Producto(
-            id=producto['ProductoID'], 
-            nombre=producto['Nombre'], 
-            precio=producto['Precio'], 
-            stock=producto['Stock'], 
-            imagen=f"/imgs/{producto['Imagen']}" if producto['Imagen'] else None
+@publica
+async def obtener_productos(
+    request: Request,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None
+):
+    instantanea = await catalogo.obtener()
+    if cursor is not None or limit is not None or fields:
+        # Página del catálogo en memoria, con el mismo keyset por id que los demás listados
+        elegidos = elegir_campos(fields, CAMPOS_PRODUCTOS, "id")
+        pagina, siguiente = pagina_en_memoria(
+            instantanea.productos, "id", elegidos, cursor=cursor, limite=limite_pagina(limit)
         )
-        for producto in productos
-    ]
-    return lista_productos
+        return JSONResponse(content=pagina, headers=cabeceras_pagina(request, siguiente))
+
+    # Sin parámetros se sirve la instantánea completa ya serializada (o 304 si no cambió).
+    # Sin Last-Modified: la hora de reconstrucción cambia con cada TTL y entre workers aunque
+    # los datos sean los mismos; la revalidación va solo por ETag
+    return respuesta_condicional(request, "/productos", instantanea.cuerpo, etag=instantanea.etag)
 
 @app.put("/productos/{producto_id}", response_model=Producto)
-def actualizar_producto(producto_id: int, producto: ProductoCreateUpdate):
+async def actualizar_producto(producto_id: int, producto: ProductoCreateUpdate):
     try:
         query = """
+        /* productos.actualizar */
         UPDATE Productos SET Nombre = %s, Precio = %s, Stock = %s
         WHERE ProductoID = %s;
         """
         params = (producto.nombre, producto.precio, producto.stock, producto_id)
-        ejecutar_consulta(query, params)
+        await db.execute(query, params)
+        catalogo.invalidar(nombres=True)
         
-        query = "SELECT ProductoID, Nombre, Precio, Stock FROM Productos WHERE ProductoID = %s;"
-        producto_actualizado = ejecutar_consulta(query, (producto_id,))[0]
+        query = "/* productos.obtener */ SELECT ProductoID, Nombre, Precio, Stock FROM Productos WHERE ProductoID = %s;"
+        producto_actualizado = (await db.fetch(query, (producto_id,)))[0]
         
         return Producto(
             id=producto_actualizado['ProductoID'], 
@@ -400,152 +543,275 @@ def actualizar_producto(producto_id: int, producto: ProductoCreateUpdate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/productos/{producto_id}")
-def eliminar_producto(producto_id: int):
+async def eliminar_producto(producto_id: int):
     try:
         # Primero, verificar si el producto existe
-        query_verificar_producto = "SELECT ProductoID FROM Productos WHERE ProductoID = %s;"
+        query_verificar_producto = "/* productos.existe */ SELECT ProductoID FROM Productos WHERE ProductoID = %s;"
         params_producto = (producto_id,)
-        producto = ejecutar_consulta(query_verificar_producto, params_producto)
+        producto = await db.fetch(query_verificar_producto, params_producto)
         
         if not producto:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
         
         # Eliminar el producto de la tabla Productos
-        query_eliminar_producto = "DELETE FROM Productos WHERE ProductoID = %s;"
-        ejecutar_consulta(query_eliminar_producto, params_producto)
+        query_eliminar_producto = "/* productos.eliminar */ DELETE FROM Productos WHERE ProductoID = %s;"
+        await db.execute(query_eliminar_producto, params_producto)
+        catalogo.invalidar(nombres=True)
         
         return {"mensaje": "Producto eliminado exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def registrar_compra(sesion, producto_id, cantidad):
+    # Un solo EXEC: RegistrarPedido descuenta el stock de forma condicional (Stock >= Cantidad)
+    # y obtiene nombre y precio en el mismo UPDATE; el nombre del cliente sale de la sesión
+    cliente_id = cliente_de_sesion(sesion)
+    if cantidad <= 0:
+        raise HTTPException(status_code=400, detail="Cantidad no válida")
+    query_registrar_pedido = """
+    /* pedidos.registrar */
+    EXEC RegistrarPedido @ClienteID = %s, @ProductoID = %s, @Cantidad = %s, @NombreUsuario = %s;
+    """
+    params_registrar_pedido = (cliente_id, producto_id, cantidad, sesion.nombre_usuario)
+    try:
+        async with db.transaccion() as tx:
+            pedido = await tx.fetch_one(query_registrar_pedido, params_registrar_pedido)
+    except Exception as e:
+        if codigo_error(e) == 50002:
+            # El producto se borró (quizá en otro worker) y el índice de nombres aún lo tenía
+            catalogo.invalidar(nombres=True)
+        raise error_http(e)
+    catalogo.invalidar()
+    await registrar_auditoria("INSERT", "Pedidos", pedido['PedidoID'], sesion.nombre_usuario)
+    return {
+        "mensaje": "Compra realizada exitosamente",
+        "pedido_id": pedido['PedidoID'],
+        "total_compra": float(pedido['TotalCompra'])
+    }
+
 @app.post("/comprar-producto")
-def comprar_producto(compra: CompraRequest):
+async def comprar_producto(compra: CompraRequest, sesion: Optional[Sesion] = Depends(sesion_actual)):
+    cliente_de_sesion(sesion)
     try:
-        # Verificar que el producto existe y obtener su stock y precio
-        query_producto = """
-        SELECT ProductoID, Nombre, Precio, Stock FROM Productos WHERE Nombre = %s;
-        """
-        params_producto = (compra.nombre_producto,)
-        producto = ejecutar_consulta(query_producto, params_producto)
-        
-        if not producto:
-            raise HTTPException(status_code=404, detail="Producto no encontrado")
-        
-        producto_id = producto[0]['ProductoID']
-        nombre_producto = producto[0]['Nombre']
-        precio = producto[0]['Precio']
-        stock_disponible = producto[0]['Stock']
-        
-        # Verificar que hay suficiente stock para la compra
-        if stock_disponible < compra.cantidad:
-            raise HTTPException(status_code=400, detail="Stock insuficiente")
-        
-        # Calcular el total de la compra
-        total_compra = precio * compra.cantidad
-        
-        # Llamar al procedimiento almacenado para registrar el pedido y la venta
-        query_registrar_pedido = """
-        EXEC RegistrarPedido @ClienteID = %s, @ProductoID = %s, @Cantidad = %s;
-        """
-        cliente_id = usuario_actual.get("cliente_id")  # Suponiendo que 'usuario_actual' tiene el ID del cliente
-        if not cliente_id:
-            raise HTTPException(status_code=401, detail="Usuario no autenticado")
-        params_registrar_pedido = (cliente_id, producto_id, compra.cantidad)
-        ejecutar_consulta(query_registrar_pedido, params_registrar_pedido)
-        
-        return {"mensaje": "Compra realizada exitosamente"}
+        # El nombre se resuelve con el índice en memoria del catálogo, sin consultar la base de datos
+        producto = await catalogo.resolver(compra.nombre_producto)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if producto is None:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    producto_id, _ = producto
+    return await registrar_compra(sesion, producto_id, compra.cantidad)
+
+class CantidadRequest(BaseModel):
+    cantidad: int
+
+@app.post("/productos/{producto_id}/comprar")
+async def comprar_producto_por_id(producto_id: int, compra: CantidadRequest, sesion: Optional[Sesion] = Depends(sesion_actual)):
+    return await registrar_compra(sesion, producto_id, compra.cantidad)
+
+class ReservaRequest(BaseModel):
+    producto_id: int
+    cantidad: int
+
+@app.post("/reservas", status_code=201)
+async def crear_reserva(reserva: ReservaRequest, sesion: Optional[Sesion] = Depends(sesion_actual)):
+    cliente_id = cliente_de_sesion(sesion)
+    if reserva.cantidad <= 0:
+        raise HTTPException(status_code=400, detail="Cantidad no válida")
+    try:
+        fila = await reservas.reservar(cliente_id, reserva.producto_id, reserva.cantidad)
+        return {
+            "reserva_id": fila['ReservaID'],
+            "producto_id": fila['ProductoID'],
+            "cantidad": fila['Cantidad'],
+            "expira": formato_fecha(fila['Expira'])
+        }
+    except Exception as e:
+        raise error_http(e)
+
+@app.post("/reservas/{reserva_id}/confirmar")
+async def confirmar_reserva(reserva_id: int, sesion: Optional[Sesion] = Depends(sesion_actual)):
+    cliente_id = cliente_de_sesion(sesion)
+    try:
+        pedido_id = await reservas.confirmar(reserva_id, cliente_id)
+        await registrar_auditoria("INSERT", "Pedidos", pedido_id, sesion.nombre_usuario)
+        return {"mensaje": "Compra realizada exitosamente", "pedido_id": pedido_id}
+    except Exception as e:
+        raise error_http(e)
+
+@app.delete("/reservas/{reserva_id}")
+async def liberar_reserva(reserva_id: int, sesion: Optional[Sesion] = Depends(sesion_actual)):
+    cliente_id = cliente_de_sesion(sesion)
+    try:
+        liberada = await reservas.liberar(reserva_id, cliente_id)
+    except Exception as e:
+        raise error_http(e)
+    if not liberada:
+        raise HTTPException(status_code=404, detail="La reserva no existe o ha vencido")
+    return {"mensaje": "Reserva liberada"}
+
+@app.post("/carrito/checkout")
+async def checkout_carrito(carrito: CarritoRequest, sesion: Optional[Sesion] = Depends(sesion_actual)):
+    cliente_id = cliente_de_sesion(sesion)
+    if not carrito.productos:
+        raise HTTPException(status_code=400, detail="El carrito está vacío")
+
+    # Las líneas repetidas del mismo producto se suman
+    cantidades = {}
+    for linea in carrito.productos:
+        if linea.cantidad <= 0:
+            raise HTTPException(status_code=400, detail=f"Cantidad no válida para {linea.nombre}")
+        cantidades[linea.nombre] = cantidades.get(linea.nombre, 0) + linea.cantidad
+
+    try:
+        # Resolver y validar el stock de todas las líneas en una sola consulta
+        query_validar = """
+        /* carrito.validar */
+        SELECT l.Nombre, l.Cantidad, p.ProductoID, p.Stock
+        FROM OPENJSON(%s) WITH (Nombre NVARCHAR(100) '$.nombre', Cantidad INT '$.cantidad') l
+        OUTER APPLY (
+            SELECT TOP 1 ProductoID, Stock FROM Productos WHERE Nombre = l.Nombre ORDER BY ProductoID
+        ) p;
+        """
+        lineas = json.dumps([{"nombre": nombre, "cantidad": cantidad} for nombre, cantidad in cantidades.items()])
+        filas = await db.fetch(query_validar, (lineas,))
+
+        no_encontrados = [fila['Nombre'] for fila in filas if fila['ProductoID'] is None]
+        if no_encontrados:
+            raise HTTPException(status_code=404, detail=f"Productos no encontrados: {', '.join(no_encontrados)}")
+        sin_stock = [fila['Nombre'] for fila in filas if fila['Stock'] < fila['Cantidad']]
+        if sin_stock:
+            raise HTTPException(status_code=400, detail=f"Stock insuficiente: {', '.join(sin_stock)}")
+
+        # Todos los pedidos y ventas en una sola transacción; el procedimiento vuelve a
+        # comprobar el stock al descontarlo, por si cambió desde la validación
+        query_registrar = "/* carrito.registrar */ EXEC RegistrarPedidoCarrito @ClienteID = %s, @Lineas = %s;"
+        lineas_pedido = json.dumps([{"producto_id": fila['ProductoID'], "cantidad": fila['Cantidad']} for fila in filas])
+        try:
+            async with db.transaccion() as tx:
+                pedidos = await tx.fetch(query_registrar, (cliente_id, lineas_pedido))
+        except Exception as e:
+            if codigo_error(e) == 50002:
+                # Se borró un producto después de validar: el índice de nombres quedó viejo
+                catalogo.invalidar(nombres=True)
+            raise
+        catalogo.invalidar()
+        for pedido in pedidos:
+            await registrar_auditoria("INSERT", "Pedidos", pedido['PedidoID'], sesion.nombre_usuario)
+
+        return {
+            "mensaje": "Compra realizada exitosamente",
+            "pedidos": [
+                {
+                    "pedido_id": pedido['PedidoID'],
+                    "producto_id": pedido['ProductoID'],
+                    "nombre_producto": pedido['Nombre'],
+                    "cantidad": pedido['Cantidad'],
+                    "total_compra": float(pedido['TotalCompra'])
+                }
+                for pedido in pedidos
+            ]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise error_http(e)
 
 @app.delete("/pedido/{pedido_id}", response_model=dict)
-def cancelar_pedido(pedido_id: int):
-    logging.info(f"Intentando cancelar el pedido: {pedido_id}")
+async def cancelar_pedido(pedido_id: int, sesion: Optional[Sesion] = Depends(sesion_actual)):
+    logger.info(f"Intentando cancelar el pedido: {pedido_id}")
 
-    if usuario_actual["tipo_usuario"] != "cliente":
-        logging.error(f"Acceso denegado para el pedido: {pedido_id}")
+    if sesion is None or sesion.tipo_usuario != "cliente":
+        logger.error(f"Acceso denegado para el pedido: {pedido_id}")
         raise HTTPException(status_code=403, detail="Acceso denegado")
     
     try:
         # Verificar que el pedido pertenece al cliente actual
         query_verificar = """
+        /* pedidos.cancelar.verificar */
         SELECT PedidoID, ClienteID, ProductoID, Cantidad FROM Pedidos WHERE PedidoID = %s;
         """
         params_verificar = (pedido_id,)
-        logging.debug(f"Ejecutando consulta de verificación: {query_verificar} con params: {params_verificar}")
-        resultado = ejecutar_consulta(query_verificar, params_verificar)
+        logger.debug(f"Ejecutando consulta de verificación: {query_verificar} con params: {params_verificar}")
+        resultado = await db.fetch(query_verificar, params_verificar)
         
-        if not resultado or resultado[0]['ClienteID'] != usuario_actual["cliente_id"]:
-            logging.error(f"Pedido no encontrado o no autorizado para el pedido: {pedido_id}")
+        if not resultado or resultado[0]['ClienteID'] != sesion.cliente_id:
+            logger.error(f"Pedido no encontrado o no autorizado para el pedido: {pedido_id}")
             raise HTTPException(status_code=403, detail="Pedido no encontrado o no autorizado")
         
         # Obtener los detalles del pedido
         pedido_id, cliente_id, producto_id, cantidad = resultado[0]['PedidoID'], resultado[0]['ClienteID'], resultado[0]['ProductoID'], resultado[0]['Cantidad']
-        logging.debug(f"Detalles del pedido obtenidos: PedidoID={pedido_id}, ClienteID={cliente_id}, ProductoID={producto_id}, Cantidad={cantidad}")
+        logger.debug(f"Detalles del pedido obtenidos: PedidoID={pedido_id}, ClienteID={cliente_id}, ProductoID={producto_id}, Cantidad={cantidad}")
         
-        # Comenzar una transacción
-        with pymssql.connect(server=server, user=username, password=password, database=database) as conn:
-            cursor = conn.cursor(as_dict=True)
-            
-            try:
-                logging.info(f"Insertando en PedidosCancelados: PedidoID={pedido_id}, ClienteID={cliente_id}, ProductoID={producto_id}, Cantidad={cantidad}")
+        # Comenzar una transacción; se confirma al salir del bloque y se revierte si hay error
+        try:
+            async with db.transaccion() as tx:
+                logger.info(f"Insertando en PedidosCancelados: PedidoID={pedido_id}, ClienteID={cliente_id}, ProductoID={producto_id}, Cantidad={cantidad}")
                 # Insertar en PedidosCancelados
                 query_insertar_cancelado = """
+                /* pedidos.cancelar.registrar */
                 INSERT INTO PedidosCancelados (PedidoID, ClienteID, ProductoID, Cantidad, FechaCancelacion)
                 VALUES (%s, %s, %s, %s, GETDATE());
                 """
-                cursor.execute(query_insertar_cancelado, (pedido_id, cliente_id, producto_id, cantidad))
+                await tx.execute(query_insertar_cancelado, (pedido_id, cliente_id, producto_id, cantidad))
                 
-                logging.info(f"Eliminando ventas relacionadas para el pedido: PedidoID={pedido_id}")
+                # Descontar el pedido de los resúmenes antes de eliminarlo
+                await tx.execute(QUERY_DESCONTAR_PEDIDO, (pedido_id, pedido_id))
+
+                logger.info(f"Eliminando ventas relacionadas para el pedido: PedidoID={pedido_id}")
                 # Eliminar ventas relacionadas con el pedido
                 query_eliminar_ventas = """
+                /* pedidos.cancelar.eliminar_ventas */
                 DELETE FROM Ventas WHERE PedidoID = %s;
                 """
-                cursor.execute(query_eliminar_ventas, (pedido_id,))
+                await tx.execute(query_eliminar_ventas, (pedido_id,))
                 
-                logging.info(f"Actualizando el stock para el producto: ProductoID={producto_id}, Cantidad={cantidad}")
+                logger.info(f"Actualizando el stock para el producto: ProductoID={producto_id}, Cantidad={cantidad}")
                 # Actualizar el stock
                 query_actualizar_stock = """
+                /* pedidos.cancelar.devolver_stock */
                 UPDATE Productos
                 SET Stock = Stock + %s
                 WHERE ProductoID = %s;
                 """
-                cursor.execute(query_actualizar_stock, (cantidad, producto_id))
+                await tx.execute(query_actualizar_stock, (cantidad, producto_id))
                 
-                logging.info(f"Eliminando de la tabla Pedidos: PedidoID={pedido_id}")
+                logger.info(f"Eliminando de la tabla Pedidos: PedidoID={pedido_id}")
                 # Eliminar el pedido de la tabla Pedidos
                 query_eliminar_pedido = """
+                /* pedidos.cancelar.eliminar */
                 DELETE FROM Pedidos WHERE PedidoID = %s;
                 """
-                cursor.execute(query_eliminar_pedido, (pedido_id,))
-                
-                # Confirmar la transacción
-                conn.commit()
-                logging.info("Transacción confirmada")
-                
-                return {"mensaje": "Pedido cancelado exitosamente"}
-            except Exception as e:
-                logging.error(f"Error en la transacción, revirtiendo cambios para el pedido: {pedido_id}, error: {e}")
-                # Revertir la transacción en caso de error
-                conn.rollback()
-                raise HTTPException(status_code=500, detail=str(e))
+                await tx.execute(query_eliminar_pedido, (pedido_id,))
+            
+            logger.info("Transacción confirmada")
+            catalogo.invalidar()
+            await registrar_auditoria("DELETE", "Pedidos", pedido_id, sesion.nombre_usuario)
+            return {"mensaje": "Pedido cancelado exitosamente"}
+        except Exception as e:
+            logger.error(f"Error en la transacción, cambios revertidos para el pedido: {pedido_id}, error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
-        logging.error(f"Error al procesar la cancelación del pedido: {pedido_id}, error: {e}")
+        logger.error(f"Error al procesar la cancelación del pedido: {pedido_id}, error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/mis-pedidos", response_model=List[dict])
-def obtener_mis_pedidos():
+async def obtener_mis_pedidos(sesion: Optional[Sesion] = Depends(sesion_actual)):
+    if sesion is None or sesion.cliente_id is None:
+        raise HTTPException(status_code=401, detail="Usuario no autenticado")
     try:
-        cliente_id = usuario_actual["cliente_id"]  # Suponiendo que 'usuario_actual' tiene el ID del cliente
+        cliente_id = sesion.cliente_id
 
         # Consulta para obtener los detalles de los pedidos del cliente
         query_pedidos = """
+        /* pedidos.del_cliente */
         SELECT p.PedidoID, p.Cantidad, p.FechaCompra, pr.Nombre, pr.Precio * p.Cantidad AS PrecioTotal
         FROM Pedidos p
         JOIN Productos pr ON p.ProductoID = pr.ProductoID
         WHERE p.ClienteID = %s;
         """
         params_pedidos = (cliente_id,)
-        pedidos = ejecutar_consulta(query_pedidos, params_pedidos)
+        pedidos = await db.fetch(query_pedidos, params_pedidos)
         
         lista_pedidos = [
             {
@@ -561,77 +827,97 @@ def obtener_mis_pedidos():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Campos disponibles en /pedidos
+CAMPOS_PEDIDOS = {
+    "pedido_id": Campo("p.PedidoID"),
+    "cliente_nombre": Campo("c.Nombre"),
+    "producto_nombre": Campo("pr.Nombre"),
+    "cantidad": Campo("p.Cantidad"),
+    "fecha_compra": Campo("p.FechaCompra", formato_fecha),
+}
+
 @app.get("/pedidos", response_model=List[dict])
-def obtener_todos_los_pedidos():
+async def obtener_todos_los_pedidos(
+    request: Request,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    desde: Optional[datetime] = Query(None, alias="from"),
+    hasta: Optional[datetime] = Query(None, alias="to")
+):
+    elegidos = elegir_campos(fields, CAMPOS_PEDIDOS, "pedido_id")
+    limite = limite_pagina(limit)
     try:
-        # Consulta para obtener los detalles de todos los pedidos
-        query_pedidos = """
-        SELECT p.PedidoID, c.Nombre AS ClienteNombre, pr.Nombre AS ProductoNombre, p.Cantidad, p.FechaCompra
-        FROM Pedidos p
-        JOIN Clientes c ON p.ClienteID = c.ClienteID
-        JOIN Productos pr ON p.ProductoID = pr.ProductoID;
-        """
-        pedidos = ejecutar_consulta(query_pedidos)
+        # Consulta para obtener una página de los pedidos
+        query_pedidos, params_pedidos = consulta_paginada(
+            CAMPOS_PEDIDOS, elegidos, "pedido_id",
+            """FROM Pedidos p
+            JOIN Clientes c ON p.ClienteID = c.ClienteID
+            JOIN Productos pr ON p.ProductoID = pr.ProductoID""",
+            columna_fecha="p.FechaCompra", cursor=cursor, limite=limite, desde=desde, hasta=hasta,
+            nombre="pedidos.pagina"
+        )
+        pedidos = await db.fetch(query_pedidos, params_pedidos)
         
-        lista_pedidos = [
-            {
-                "pedido_id": pedido['PedidoID'],
-                "cliente_nombre": pedido['ClienteNombre'],
-                "producto_nombre": pedido['ProductoNombre'],
-                "cantidad": pedido['Cantidad'],
-                "fecha_compra": pedido['FechaCompra'].strftime('%Y-%m-%d %H:%M:%S')
-            }
-            for pedido in pedidos
-        ]
-        return lista_pedidos
+        lista_pedidos, siguiente = armar_pagina(pedidos, CAMPOS_PEDIDOS, elegidos, "pedido_id", limite)
+        return JSONResponse(content=lista_pedidos, headers=cabeceras_pagina(request, siguiente))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/pedidos/export")
+async def exportar_pedidos(
+    request: Request,
+    formato: str = Query("ndjson", alias="format"),
+    desde: Optional[datetime] = Query(None, alias="from"),
+    hasta: Optional[datetime] = Query(None, alias="to")
+):
+    # Exportación completa en streaming, leyendo del cursor por lotes
+    elegidos = list(CAMPOS_PEDIDOS)
+    query, params = consulta_paginada(
+        CAMPOS_PEDIDOS, elegidos, "pedido_id",
+        """FROM Pedidos p
+        JOIN Clientes c ON p.ClienteID = c.ClienteID
+        JOIN Productos pr ON p.ProductoID = pr.ProductoID""",
+        columna_fecha="p.FechaCompra", limite=None, desde=desde, hasta=hasta, nombre="pedidos.exportar"
+    )
+    return respuesta_exportacion(request, db.stream(query, params), formato, CAMPOS_PEDIDOS, elegidos, "pedidos")
+
 @app.delete("/productos/{producto_id}")
-def eliminar_producto(producto_id: int):
+async def eliminar_producto(producto_id: int):
     try:
         # Actualizar registros en Pedidos para establecer ProductoID a NULL
-        query_actualizar_pedidos = "UPDATE Pedidos SET ProductoID = NULL WHERE ProductoID = %s"
+        query_actualizar_pedidos = "/* productos.eliminar.desvincular_pedidos */ UPDATE Pedidos SET ProductoID = NULL WHERE ProductoID = %s"
         params_pedidos = (producto_id,)
-        ejecutar_consulta(query_actualizar_pedidos, params_pedidos)
+        await db.execute(query_actualizar_pedidos, params_pedidos)
         
         # Actualizar registros en PedidosCancelados para establecer ProductoID a NULL
-        query_actualizar_pedidos_cancelados = "UPDATE PedidosCancelados SET ProductoID = NULL WHERE ProductoID = %s"
+        query_actualizar_pedidos_cancelados = "/* productos.eliminar.desvincular_cancelados */ UPDATE PedidosCancelados SET ProductoID = NULL WHERE ProductoID = %s"
         params_pedidos_cancelados = (producto_id,)
-        ejecutar_consulta(query_actualizar_pedidos_cancelados, params_pedidos_cancelados)
+        await db.execute(query_actualizar_pedidos_cancelados, params_pedidos_cancelados)
         
         # Finalmente, eliminar el producto
-        query_eliminar_producto = "DELETE FROM Productos WHERE ProductoID = %s;"
+        query_eliminar_producto = "/* productos.eliminar */ DELETE FROM Productos WHERE ProductoID = %s;"
         params_producto = (producto_id,)
-        ejecutar_consulta(query_eliminar_producto, params_producto)
+        await db.execute(query_eliminar_producto, params_producto)
+        catalogo.invalidar(nombres=True)
         
         return {"mensaje": "Producto eliminado exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/ganancia-total", response_model=dict)
-def obtener_ganancia_total():
+async def obtener_ganancia_total():
     try:
-        query = """
-        SELECT SUM(TotalCompra) AS GananciaTotal
-        FROM Ventas;
-        """
-        resultado = ejecutar_consulta(query)
-        ganancia_total = resultado[0]['GananciaTotal'] if resultado and resultado[0]['GananciaTotal'] else 0
+        # Suma sobre una fila por producto en lugar de todo el historial de Ventas
+        ganancia_total = await resumen_ventas.ganancia_total()
         return {"GananciaTotal": ganancia_total}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/productos-mas-solicitados", response_model=List[dict])
-def obtener_productos_mas_solicitados():
+async def obtener_productos_mas_solicitados():
     try:
-        query = """
-        SELECT NombreProducto, SUM(Cantidad) AS TotalVendido
-        FROM Ventas
-        GROUP BY NombreProducto
-        ORDER BY TotalVendido DESC;
-        """
-        productos = ejecutar_consulta(query)
+        productos = await resumen_ventas.mas_solicitados()
         lista_productos = [
             {
                 "NombreProducto": producto['NombreProducto'],
@@ -643,53 +929,78 @@ def obtener_productos_mas_solicitados():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def lista_verificar_stock(productos):
+    return [
+        {
+            "ProductoID": producto['id'],
+            "Nombre": producto['nombre'],
+            "Stock": producto['stock'],
+            "Mensaje": "Favor de actualizar inventario" if producto['stock'] < 10 else ""
+        }
+        for producto in productos
+    ]
+
 @app.get("/verificar-stock", response_model=List[dict])
-def verificar_stock_productos():
+async def verificar_stock_productos(request: Request):
     try:
-        query = """
-        SELECT ProductoID, Nombre, Stock
-        FROM Productos;
-        """
-        productos = ejecutar_consulta(query)
-        lista_productos = [
-            {
-                "ProductoID": producto['ProductoID'],
-                "Nombre": producto['Nombre'],
-                "Stock": producto['Stock'],
-                "Mensaje": "Favor de actualizar inventario" if producto['Stock'] < 10 else ""
-            }
-            for producto in productos
-        ]
-        return lista_productos
+        # Se arma a partir de la instantánea del catálogo, sin consultar la base de datos
+        instantanea = await catalogo.obtener()
+        cuerpo, etag = catalogo.vista(instantanea, "verificar-stock", lista_verificar_stock)
+        return respuesta_condicional(request, "/verificar-stock", cuerpo, etag=etag)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Campos disponibles en /ventas (mismos nombres que el modelo Venta)
+CAMPOS_VENTAS = {
+    "venta_id": Campo("VentaID"),
+    "pedido_id": Campo("PedidoID"),
+    "cliente_id": Campo("ClienteID"),
+    "nombre_usuario": Campo("NombreUsuario"),
+    "nombre_producto": Campo("NombreProducto"),
+    "cantidad": Campo("Cantidad"),
+    "total_compra": Campo("TotalCompra", float),
+    "fecha_venta": Campo("FechaVenta", formato_fecha),
+}
+
 @app.get("/ventas", response_model=List[Venta])
-def obtener_ventas():
+async def obtener_ventas(
+    request: Request,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    desde: Optional[datetime] = Query(None, alias="from"),
+    hasta: Optional[datetime] = Query(None, alias="to")
+):
+    elegidos = elegir_campos(fields, CAMPOS_VENTAS, "venta_id")
+    limite = limite_pagina(limit)
     try:
-        query = """
-        SELECT VentaID, PedidoID, ClienteID, NombreUsuario, NombreProducto, Cantidad, TotalCompra, FechaVenta
-        FROM Ventas;
-        """
-        ventas = ejecutar_consulta(query)
+        query, params = consulta_paginada(
+            CAMPOS_VENTAS, elegidos, "venta_id", "FROM Ventas",
+            columna_fecha="FechaVenta", cursor=cursor, limite=limite, desde=desde, hasta=hasta,
+            nombre="ventas.pagina"
+        )
+        ventas = await db.fetch(query, params)
         
-        lista_ventas = [
-            Venta(
-                venta_id=venta['VentaID'],
-                pedido_id=venta['PedidoID'],
-                cliente_id=venta['ClienteID'],
-                nombre_usuario=venta['NombreUsuario'],
-                nombre_producto=venta['NombreProducto'],
-                cantidad=venta['Cantidad'],
-                total_compra=venta['TotalCompra'],
-                fecha_venta=venta['FechaVenta'].strftime('%Y-%m-%d %H:%M:%S')
-            )
-            for venta in ventas
-        ]
-        return lista_ventas
+        lista_ventas, siguiente = armar_pagina(ventas, CAMPOS_VENTAS, elegidos, "venta_id", limite)
+        return JSONResponse(content=lista_ventas, headers=cabeceras_pagina(request, siguiente))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/ventas/export")
+async def exportar_ventas(
+    request: Request,
+    formato: str = Query("ndjson", alias="format"),
+    desde: Optional[datetime] = Query(None, alias="from"),
+    hasta: Optional[datetime] = Query(None, alias="to")
+):
+    # Exportación completa en streaming, leyendo del cursor por lotes
+    elegidos = list(CAMPOS_VENTAS)
+    query, params = consulta_paginada(
+        CAMPOS_VENTAS, elegidos, "venta_id", "FROM Ventas",
+        columna_fecha="FechaVenta", limite=None, desde=desde, hasta=hasta, nombre="ventas.exportar"
+    )
+    return respuesta_exportacion(request, db.stream(query, params), formato, CAMPOS_VENTAS, elegidos, "ventas")
+
 class DatosPanel(BaseModel):
     productos: int
     stock: int
@@ -701,59 +1012,121 @@ class DatosGraficas(BaseModel):
     categoriasBarras: List[str]
     pastel: List[int]
     categoriasPastel: List[str]
+    seriesProductos: Optional[List[dict]] = None
 
-# Mapeo de los números de los meses a nombres en español
-meses_espanol = {
-    1: "Enero", 2: "Febrero", 3: "Marzo", 4: "Abril",
-    5: "Mayo", 6: "Junio", 7: "Julio", 8: "Agosto",
-    9: "Septiembre", 10: "Octubre", 11: "Noviembre", 12: "Diciembre"
-}
+async def calcular_datos_panel():
+    # Las cuatro métricas en una sola consulta
+    query = """
+    /* panel.metricas */
+    SELECT
+        (SELECT COUNT(*) FROM Productos) AS Productos,
+        (SELECT ISNULL(SUM(Stock), 0) FROM Productos) AS Stock,
+        (SELECT COUNT(*) FROM Clientes) AS Clientes,
+        (SELECT COUNT(*) FROM Pedidos) AS Pedidos;
+    """
+    fila = await db.fetch_one(query)
+    datos = DatosPanel(productos=fila['Productos'], stock=fila['Stock'], clientes=fila['Clientes'], pedidos=fila['Pedidos'])
+    cuerpo = serializar(datos.model_dump())
+    return cuerpo, calcular_etag(cuerpo), time.time()
+
+# Métricas del panel en caché: frescas PANEL_CACHE_TTL segundos y servidas obsoletas
+# (mientras se recalculan en segundo plano) hasta PANEL_STALE_TTL segundos más
+datos_panel = ValorSWR(
+    calcular_datos_panel,
+    ttl=float(os.getenv('PANEL_CACHE_TTL', '5')),
+    max_obsoleto=float(os.getenv('PANEL_STALE_TTL', '60'))
+)
 
 @app.get("/datos-panel", response_model=DatosPanel)
-def get_datos_panel():
+async def get_datos_panel(request: Request):
     try:
-        query_productos = "SELECT COUNT(*) FROM Productos;"
-        query_stock = "SELECT SUM(Stock) FROM Productos;"
-        query_clientes = "SELECT COUNT(*) FROM Clientes;"
-        query_pedidos = "SELECT COUNT(*) FROM Pedidos;"
-
-        productos = ejecutar_consulta(query_productos)[0]['']
-        stock = ejecutar_consulta(query_stock)[0][0]
-        clientes = ejecutar_consulta(query_clientes)[0][0]
-        pedidos = ejecutar_consulta(query_pedidos)[0][0]
-
-        return DatosPanel(productos=productos, stock=stock, clientes=clientes, pedidos=pedidos)
+        cuerpo, etag, modificado = await datos_panel.obtener()
+        return respuesta_condicional(request, "/datos-panel", cuerpo, etag=etag, modificado=modificado)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/datos-graficas", response_model=DatosGraficas)
-def get_datos_graficas():
+async def get_datos_graficas(
+    granularidad: str = Query("month", alias="granularity"),
+    desde: Optional[date] = Query(None, alias="from"),
+    hasta: Optional[date] = Query(None, alias="to"),
+    desglose: bool = Query(False, alias="breakdown")
+):
+    periodo = elegir_granularidad(granularidad)
     try:
-        query_barras = """
-        SELECT MONTH(FechaCompra) AS Mes, COUNT(*) AS Total
-        FROM Pedidos
-        GROUP BY MONTH(FechaCompra)
-        ORDER BY MONTH(FechaCompra);
-        """
-        query_pastel = """
-        SELECT Nombre, COUNT(*) AS Total
-        FROM Productos
-        JOIN Pedidos ON Productos.ProductoID = Pedidos.ProductoID
-        GROUP BY Nombre;
-        """
-
-        barras = ejecutar_consulta(query_barras)
-        pastel = ejecutar_consulta(query_pastel)
-
-        categorias_barras = [meses_espanol[row['Mes']] for row in barras]
-        data_barras = [row['Total'] for row in barras]
+        periodos, filas = await analitica.series(periodo, desde, hasta)
+
+        # Los nombres salen de la instantánea del catálogo; los productos eliminados no van en el pastel
+        instantanea = await catalogo.obtener()
+        nombres = {producto['id']: producto['nombre'] for producto in instantanea.productos}
+
+        indice = {inicio: posicion for posicion, inicio in enumerate(periodos)}
+        data_barras = [0] * len(periodos)
+        totales_productos = {}
+        series = {}
+        for inicio, producto_id, pedidos, _, _ in filas:
+            data_barras[indice[inicio]] += pedidos
+            if producto_id not in nombres:
+                continue
+            totales_productos[producto_id] = totales_productos.get(producto_id, 0) + pedidos
+            if desglose:
+                serie = series.setdefault(producto_id, [0] * len(periodos))
+                serie[indice[inicio]] += pedidos
+
+        categorias_barras = [periodo.etiqueta(inicio) for inicio in periodos]
+        orden = sorted(totales_productos, key=totales_productos.get, reverse=True)
+        categorias_pastel = [nombres[producto_id] for producto_id in orden]
+        data_pastel = [totales_productos[producto_id] for producto_id in orden]
+        series_productos = [
+            {"id": producto_id, "nombre": nombres[producto_id], "datos": series[producto_id]}
+            for producto_id in orden
+        ] if desglose else None
+
+        return DatosGraficas(barras=data_barras, categoriasBarras=categorias_barras, pastel=data_pastel,
+                             categoriasPastel=categorias_pastel, seriesProductos=series_productos)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        categorias_pastel = [row['Nombre'] for row in pastel]
-        data_pastel = [row['Total'] for row in pastel]
+def exigir_administrador(sesion):
+    if sesion is None or sesion.tipo_usuario != "administrador":
+        raise HTTPException(status_code=403, detail="Access forbidden: insufficient permissions")
 
-        return DatosGraficas(barras=data_barras, categoriasBarras=categorias_barras, pastel=data_pastel, categoriasPastel=categorias_pastel)
+# Consultas más lentas entre las ejecuciones recientes de este worker
+@app.get("/admin/consultas-lentas")
+async def obtener_consultas_lentas(
+    top: int = Query(10, ge=1, le=100),
+    orden: str = "maximo",
+    sesion: Optional[Sesion] = Depends(sesion_actual)
+):
+    exigir_administrador(sesion)
+    if orden not in ORDENES:
+        raise HTTPException(status_code=400, detail=f"orden debe ser uno de: {', '.join(ORDENES)}")
+    return {"umbral_ms": bitacora.umbral * 1000, "consultas": bitacora.top(top, orden)}
+
+# Plan de la ejecución más lenta de una consulta planificable: estimado (SHOWPLAN_ALL) o, con real=true, medido
+@app.get("/admin/consultas-lentas/{nombre}/plan")
+async def obtener_plan_consulta(nombre: str, real: bool = False, sesion: Optional[Sesion] = Depends(sesion_actual)):
+    exigir_administrador(sesion)
+    if nombre not in CONSULTAS_PLANIFICABLES:
+        raise HTTPException(status_code=400, detail="Esa consulta no admite pedir su plan")
+    muestra = bitacora.muestra(nombre)
+    if muestra is None:
+        raise HTTPException(status_code=404, detail="No hay ejecuciones registradas de esa consulta")
+    query, params = muestra
+    try:
+        plan = await db.plan(query, params, real=real)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return JSONResponse(content=jsonable_encoder({
+        "nombre": nombre,
+        "modo": "real" if real else "estimado",
+        "consulta": query.strip(),
+        "plan": plan,
+    }))
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,176 @@
+import os
+import math
+import time
+import threading
+from bisect import bisect_left
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuración de las métricas
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # Si está definido, /metrics exige "Authorization: Bearer <token>"
+
+# Límites (segundos) de los histogramas de latencia
+LIMITES_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres, valores, extra=""):
+    partes = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor):
+    if valor == math.inf:
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    # Contador acumulado por combinación de etiquetas; se puede incrementar desde cualquier hilo
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._candado = threading.Lock()
+
+    def inc(self, *etiquetas, cantidad=1):
+        with self._candado:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+    def muestras(self):
+        with self._candado:
+            valores = list(self._valores.items())
+        return [(self.nombre + _etiquetas(self.etiquetas, clave), valor) for clave, valor in valores]
+
+
+class Histograma:
+    """Histograma acumulativo con límites fijos, al estilo de Prometheus.
+
+    ``observar()`` solo hace una búsqueda binaria y tres sumas bajo un
+    candado, así que se puede llamar en cada petición o consulta.
+    """
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(sorted(limites))
+        self._series = {}  # etiquetas -> [conteos por límite (+Inf al final), suma, total]
+        self._candado = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        indice = bisect_left(self.limites, valor)
+        with self._candado:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def muestras(self):
+        with self._candado:
+            series = [(clave, list(conteos), suma, total) for clave, (conteos, suma, total) in self._series.items()]
+        resultado = []
+        for clave, conteos, suma, total in series:
+            acumulado = 0
+            for limite, conteo in zip(self.limites + (math.inf,), conteos):
+                acumulado += conteo
+                etiqueta_le = f'le="{_numero(limite)}"'
+                resultado.append((self.nombre + "_bucket" + _etiquetas(self.etiquetas, clave, etiqueta_le), acumulado))
+            resultado.append((self.nombre + "_sum" + _etiquetas(self.etiquetas, clave), suma))
+            resultado.append((self.nombre + "_count" + _etiquetas(self.etiquetas, clave), total))
+        return resultado
+
+
+class Funcion:
+    # Valor leído al exponer (tamaño del pool, eventos en cola...); no cuesta nada en el camino caliente
+    def __init__(self, nombre, ayuda, funcion, tipo="gauge"):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.tipo = tipo
+        self._funcion = funcion
+
+    def muestras(self):
+        return [(self.nombre, self._funcion())]
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = {}
+
+    def _agregar(self, metrica):
+        if metrica.nombre in self._metricas:
+            raise ValueError(f"Métrica duplicada: {metrica.nombre}")
+        self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._agregar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        return self._agregar(Histograma(nombre, ayuda, etiquetas, limites))
+
+    def funcion(self, nombre, ayuda, funcion, tipo="gauge"):
+        return self._agregar(Funcion(nombre, ayuda, funcion, tipo))
+
+    def exponer(self):
+        """Todas las métricas en el formato de texto de Prometheus."""
+        lineas = []
+        for metrica in self._metricas.values():
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            for serie, valor in metrica.muestras():
+                lineas.append(f"{serie} {_numero(valor)}")
+        return ("\n".join(lineas) + "\n").encode("utf-8")
+
+
+registro = RegistroMetricas()
+
+DURACION_PETICIONES = registro.histograma(
+    "http_duracion_peticion_segundos", "Duración de las peticiones HTTP por ruta", ("metodo", "ruta", "estado")
+)
+
+
+class MiddlewareMetricas:
+    """Mide cada petición HTTP y la anota con la plantilla de su ruta.
+
+    La ruta se toma de ``scope["route"]`` (la deja el router de Starlette)
+    para que ``/pedido/1`` y ``/pedido/2`` cuenten como ``/pedido/{pedido_id}``;
+    las peticiones que no llegan a ninguna ruta se agrupan en ``sin_ruta``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            ruta = scope.get("route")
+            DURACION_PETICIONES.observar(time.perf_counter() - inicio, scope["method"],
+                                         getattr(ruta, "path", None) or "sin_ruta", estado)
@@ -0,0 +1,108 @@
+import os
+from bisect import bisect_right
+from typing import NamedTuple, Callable, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()
+
+# Límites de página para los listados
+PAGE_DEFAULT_LIMIT = int(os.getenv('PAGE_DEFAULT_LIMIT', '100'))
+PAGE_MAX_LIMIT = int(os.getenv('PAGE_MAX_LIMIT', '1000'))
+
+
+class Campo(NamedTuple):
+    sql: str  # Expresión SQL de la columna
+    convertir: Optional[Callable] = None  # Conversión del valor al formato de la API
+
+
+def formato_fecha(valor):
+    return valor.strftime('%Y-%m-%d %H:%M:%S') if valor is not None else None
+
+
+def elegir_campos(fields, campos, campo_id):
+    # "fields=a,b" -> lista de campos pedidos; el campo del cursor siempre se incluye
+    if not fields:
+        return list(campos)
+    elegidos = [nombre.strip() for nombre in fields.split(",") if nombre.strip()]
+    desconocidos = [nombre for nombre in elegidos if nombre not in campos]
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(desconocidos)}")
+    if campo_id not in elegidos:
+        elegidos.insert(0, campo_id)
+    return elegidos
+
+
+def limite_pagina(limit):
+    if limit is None:
+        return PAGE_DEFAULT_LIMIT
+    return max(1, min(limit, PAGE_MAX_LIMIT))
+
+
+def consulta_paginada(campos, elegidos, campo_id, origen, columna_fecha=None,
+                      cursor=None, limite=PAGE_DEFAULT_LIMIT, desde=None, hasta=None, nombre=None):
+    """Arma un SELECT por keyset: ``id > cursor ORDER BY id`` con TOP y filtros de fecha.
+
+    Se pide una fila de más para saber si existe una página siguiente.
+    Con ``limite=None`` no se pone TOP (exportaciones completas).
+    ``nombre`` etiqueta la consulta (``/* nombre */``) para las métricas,
+    ya que el texto cambia según los campos y filtros elegidos.
+    """
+    columnas = ", ".join(f"{campos[nombre].sql} AS {nombre}" for nombre in elegidos)
+    condiciones = []
+    params = [] if limite is None else [limite + 1]
+    if cursor is not None:
+        condiciones.append(f"{campos[campo_id].sql} > %s")
+        params.append(cursor)
+    if desde is not None:
+        condiciones.append(f"{columna_fecha} >= %s")
+        params.append(desde)
+    if hasta is not None:
+        condiciones.append(f"{columna_fecha} < %s")
+        params.append(hasta)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    top = "" if limite is None else "TOP (%s) "
+    etiqueta = f"/* {nombre} */" if nombre else ""
+    query = f"""
+    {etiqueta}
+    SELECT {top}{columnas}
+    {origen}
+    {where}
+    ORDER BY {campos[campo_id].sql};
+    """
+    return query, tuple(params)
+
+
+def armar_pagina(filas, campos, elegidos, campo_id, limite):
+    # Devuelve las filas convertidas y el cursor de la página siguiente (o None)
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = filas[-1][campo_id]
+    pagina = []
+    for fila in filas:
+        item = {}
+        for nombre in elegidos:
+            convertir = campos[nombre].convertir
+            item[nombre] = convertir(fila[nombre]) if convertir else fila[nombre]
+        pagina.append(item)
+    return pagina, siguiente
+
+
+def pagina_en_memoria(items, clave_id, elegidos, cursor=None, limite=PAGE_DEFAULT_LIMIT):
+    # Mismo keyset sobre una lista ya ordenada por id (por ejemplo, la instantánea del catálogo)
+    inicio = bisect_right(items, cursor, key=lambda item: item[clave_id]) if cursor is not None else 0
+    trozo = items[inicio:inicio + limite + 1]
+    siguiente = None
+    if len(trozo) > limite:
+        trozo = trozo[:limite]
+        siguiente = trozo[-1][clave_id]
+    return [{nombre: item[nombre] for nombre in elegidos} for item in trozo], siguiente
+
+
+def cabeceras_pagina(request, siguiente):
+    if siguiente is None:
+        return {}
+    url = request.url.include_query_params(cursor=siguiente)
+    return {"X-Next-Cursor": str(siguiente), "Link": f'<{url}>; rel="next"'}
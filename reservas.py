@@ -0,0 +1,77 @@
+import os
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuración de las reservas de stock
+RESERVATION_TTL = int(os.getenv('RESERVATION_TTL', '600'))  # Vigencia de una reserva en segundos
+RESERVATION_SWEEP_INTERVAL = float(os.getenv('RESERVATION_SWEEP_INTERVAL', '30'))  # Cada cuánto se liberan las vencidas
+RESERVATION_SWEEP_BATCH = int(os.getenv('RESERVATION_SWEEP_BATCH', '500'))
+
+
+class ReservasStock:
+    """Reservas temporales de stock (tabla ReservasStock).
+
+    Reservar descuenta el stock al momento con el mismo UPDATE condicional
+    que una compra, así que una reserva nunca deja el stock en negativo.
+    Confirmarla crea el pedido sin volver a tocar el stock; si vence antes,
+    ``vigilar()`` la borra y devuelve las unidades. ``al_cambiar_stock`` se
+    llama cada vez que el stock de Productos cambia por una reserva.
+    """
+
+    def __init__(self, bd, al_cambiar_stock=None, ttl=RESERVATION_TTL,
+                 intervalo=RESERVATION_SWEEP_INTERVAL, lote=RESERVATION_SWEEP_BATCH):
+        self._bd = bd
+        self._al_cambiar_stock = al_cambiar_stock or (lambda: None)
+        self.ttl = ttl
+        self.intervalo = intervalo
+        self.lote = lote
+
+    async def reservar(self, cliente_id, producto_id, cantidad):
+        query = "/* reservas.reservar */ EXEC ReservarStock @ClienteID = %s, @ProductoID = %s, @Cantidad = %s, @Segundos = %s;"
+        async with self._bd.transaccion() as tx:
+            reserva = await tx.fetch_one(query, (cliente_id, producto_id, cantidad, self.ttl))
+        self._al_cambiar_stock()
+        return reserva
+
+    async def confirmar(self, reserva_id, cliente_id):
+        # Devuelve el PedidoID creado
+        query = "/* reservas.confirmar */ EXEC ConfirmarReserva @ReservaID = %s, @ClienteID = %s;"
+        async with self._bd.transaccion() as tx:
+            fila = await tx.fetch_one(query, (reserva_id, cliente_id))
+        return fila['PedidoID']
+
+    async def liberar(self, reserva_id, cliente_id):
+        query = "/* reservas.liberar */ EXEC LiberarReservas @ReservaID = %s, @ClienteID = %s;"
+        async with self._bd.transaccion() as tx:
+            fila = await tx.fetch_one(query, (reserva_id, cliente_id))
+        if fila['Liberadas']:
+            self._al_cambiar_stock()
+        return fila['Liberadas'] > 0
+
+    async def barrer(self):
+        # Libera reservas vencidas por lotes hasta que no quede ninguna
+        query = "/* reservas.barrer */ EXEC LiberarReservas @Lote = %s;"
+        total = 0
+        while True:
+            async with self._bd.transaccion() as tx:
+                fila = await tx.fetch_one(query, (self.lote,))
+            total += fila['Liberadas']
+            if fila['Liberadas'] < self.lote:
+                break
+        if total:
+            self._al_cambiar_stock()
+        return total
+
+    async def vigilar(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await self.barrer()
+            except Exception as e:
+                logger.error(f"No se pudieron liberar las reservas vencidas: {e}")
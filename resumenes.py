@@ -0,0 +1,84 @@
+import os
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se compara el resumen con la tabla Ventas (segundos)
+SALES_RECONCILE_INTERVAL = float(os.getenv('SALES_RECONCILE_INTERVAL', '3600'))
+
+# Descuenta un pedido de los resúmenes; debe ejecutarse antes de borrarlo de Pedidos y Ventas.
+# Recibe el PedidoID dos veces: (pedido_id, pedido_id)
+QUERY_DESCONTAR_PEDIDO = """
+/* resumen.descontar_pedido */
+UPDATE r
+SET TotalVendido = r.TotalVendido - v.Cantidad,
+    TotalCompra = r.TotalCompra - v.TotalCompra
+FROM ResumenVentasProducto r
+JOIN (
+    SELECT NombreProducto, SUM(Cantidad) AS Cantidad, SUM(TotalCompra) AS TotalCompra
+    FROM Ventas
+    WHERE PedidoID = %s
+    GROUP BY NombreProducto
+) v ON r.NombreProducto = v.NombreProducto;
+
+UPDATE r
+SET Pedidos = r.Pedidos - 1,
+    Unidades = r.Unidades - p.Cantidad,
+    Total = r.Total - ISNULL((SELECT SUM(v.TotalCompra) FROM Ventas v WHERE v.PedidoID = p.PedidoID), 0)
+FROM ResumenPedidosDia r
+JOIN Pedidos p ON r.Fecha = CAST(p.FechaCompra AS DATE) AND r.ProductoID = ISNULL(p.ProductoID, 0)
+WHERE p.PedidoID = %s;
+"""
+
+
+class ResumenVentas:
+    """Totales de ventas por producto leídos de ResumenVentasProducto.
+
+    La tabla la mantienen ``RegistrarPedido`` y las cancelaciones, así que
+    las consultas recorren una fila por producto en lugar de todo el
+    historial de Ventas. ``reconciliar()`` corrige cualquier desvío (por
+    ejemplo, ventas modificadas a mano) recalculando desde Ventas; también
+    reconcilia ResumenPedidosDia, el resumen diario que usan las gráficas.
+    """
+
+    def __init__(self, bd, intervalo=SALES_RECONCILE_INTERVAL):
+        self._bd = bd
+        self.intervalo = intervalo
+
+    async def ganancia_total(self):
+        query = "/* resumen.ganancia_total */ SELECT ISNULL(SUM(TotalCompra), 0) AS GananciaTotal FROM ResumenVentasProducto;"
+        fila = await self._bd.fetch_one(query, coalescer=True)
+        return fila['GananciaTotal']
+
+    async def mas_solicitados(self):
+        query = """
+        /* resumen.mas_solicitados */
+        SELECT NombreProducto, TotalVendido
+        FROM ResumenVentasProducto
+        WHERE TotalVendido > 0
+        ORDER BY TotalVendido DESC;
+        """
+        # Lectura compartida entre peticiones simultáneas (ver BaseDatos)
+        return await self._bd.fetch(query, coalescer=True)
+
+    async def reconciliar(self):
+        # El procedimiento modifica el resumen: se ejecuta en transacción para confirmarlo
+        async with self._bd.transaccion() as tx:
+            ventas = await tx.fetch_one("/* resumen.reconciliar_ventas */ EXEC ReconciliarResumenVentas;")
+            dias = await tx.fetch_one("/* resumen.reconciliar_dias */ EXEC ReconciliarResumenPedidosDia;")
+        return sum(fila['FilasCorregidas'] for fila in (ventas, dias) if fila)
+
+    async def vigilar(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                corregidas = await self.reconciliar()
+                if corregidas:
+                    logger.info(f"Resumen de ventas reconciliado: {corregidas} filas corregidas")
+            except Exception as e:
+                logger.error(f"No se pudo reconciliar el resumen de ventas: {e}")
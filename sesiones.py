@@ -0,0 +1,162 @@
+import os
+import time
+import secrets
+import logging
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+from cache import CacheLRU
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuración de sesiones
+SESSION_SECRET = os.getenv('SESSION_SECRET')
+SESSION_MAX_AGE = int(os.getenv('SESSION_MAX_AGE', '86400'))  # Vigencia del token en segundos
+SESSION_CACHE_TTL = int(os.getenv('SESSION_CACHE_TTL', '300'))  # Tiempo máximo en caché sin volver a validar
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', '10000'))
+COOKIE_SESION = "sesion"
+
+if not SESSION_SECRET:
+    # Sin un secreto compartido cada worker firmaría con una clave distinta
+    logger.warning("SESSION_SECRET no está definido: se usará una clave temporal (solo válida para un proceso)")
+    SESSION_SECRET = secrets.token_urlsafe(32)
+
+
+# En la caché, marca de un token válido cuya sesión ya se cerró o se revocó
+_CERRADA = object()
+
+
+class Sesion(NamedTuple):
+    token_id: str
+    tipo_usuario: str
+    nombre_usuario: str
+    cliente_id: Optional[int] = None
+    administrador_id: Optional[int] = None
+
+
+class AlmacenSesiones:
+    """Sesiones con token firmado, caché LRU en memoria y escritura en SesionesClientes.
+
+    El token lleva los datos de la sesión firmados, así que cualquier worker
+    puede validarlo sin estado compartido. Una petición con el token en caché
+    no toca la base de datos; en un fallo de caché se verifica la firma y
+    que la sesión no se haya cerrado: en SesionesClientes para clientes y
+    en SesionesRevocadas para las demás (administradores). Las sesiones
+    cerradas también quedan en caché, para que un cliente que sigue
+    enviando el token viejo no consulte la base de datos en cada petición.
+    Un cierre de sesión en otro worker se ve aquí como máximo tras
+    ``SESSION_CACHE_TTL`` segundos.
+    """
+
+    def __init__(self, bd, secreto=SESSION_SECRET, max_edad=SESSION_MAX_AGE,
+                 cache_ttl=SESSION_CACHE_TTL, cache_tamano=SESSION_CACHE_SIZE):
+        self._bd = bd
+        self._firmador = URLSafeTimedSerializer(secreto, salt="sesion")
+        self.max_edad = max_edad
+        self._cache = CacheLRU(cache_tamano, cache_ttl)
+
+    def crear(self, tipo_usuario, nombre_usuario, cliente_id=None, administrador_id=None):
+        # Emite el token y lo deja en caché; la fila en SesionesClientes se escribe con registrar()
+        sesion = Sesion(secrets.token_urlsafe(16), tipo_usuario, nombre_usuario, cliente_id, administrador_id)
+        token = self._firmador.dumps(list(sesion))
+        self._cache.set(token, sesion, self.max_edad)
+        return token, sesion
+
+    async def registrar(self, sesion, ip=None):
+        if sesion.cliente_id is None:
+            return
+        query = """
+        /* sesiones.registrar */
+        INSERT INTO SesionesClientes (ClienteID, FechaInicio, IP, Token)
+        VALUES (%s, GETDATE(), %s, %s);
+        """
+        try:
+            await self._bd.execute(query, (sesion.cliente_id, ip, sesion.token_id))
+        except Exception as e:
+            # La sesión sigue siendo válida por su firma aunque falle el registro
+            logger.error(f"No se pudo registrar la sesión del cliente {sesion.cliente_id}: {e}")
+
+    async def obtener(self, token):
+        if not token:
+            return None
+        sesion = self._cache.get(token)
+        if sesion is not None:
+            return None if sesion is _CERRADA else sesion
+
+        try:
+            datos, emitido = self._firmador.loads(token, max_age=self.max_edad, return_timestamp=True)
+            sesion = Sesion(*datos)
+        except (BadSignature, TypeError):
+            return None
+
+        if sesion.cliente_id is not None:
+            # Sin fila todavía (se registra tras la respuesta del login) la sesión se considera abierta
+            query = "/* sesiones.verificar_cierre */ SELECT FechaCierre FROM SesionesClientes WHERE Token = %s;"
+            fila = await self._bd.fetch_one(query, (sesion.token_id,))
+            cerrada = fila is not None and fila['FechaCierre'] is not None
+        else:
+            query = "/* sesiones.verificar_revocacion */ SELECT 1 AS Revocada FROM SesionesRevocadas WHERE Token = %s;"
+            cerrada = await self._bd.fetch_one(query, (sesion.token_id,)) is not None
+
+        # Un cierre no se deshace: también se guarda hasta que el token venza
+        restante = self.max_edad - (time.time() - emitido.timestamp())
+        self._cache.set(token, _CERRADA if cerrada else sesion, max(restante, 0))
+        return None if cerrada else sesion
+
+    async def cerrar(self, token):
+        sesion = self._cache.pop(token)
+        if sesion is _CERRADA:
+            return None
+        sesion = sesion or await self.obtener(token)
+        self._cache.pop(token)
+        if sesion is not None and sesion.cliente_id is not None:
+            query = """
+            /* sesiones.cerrar */
+            UPDATE SesionesClientes
+            SET FechaCierre = GETDATE()
+            WHERE Token = %s AND FechaCierre IS NULL;
+            """
+            await self._bd.execute(query, (sesion.token_id,))
+        elif sesion is not None:
+            # Sin fila en SesionesClientes: se revoca por token_id hasta que el token venza solo
+            query = """
+            /* sesiones.revocar */
+            DELETE FROM SesionesRevocadas WHERE Expira < GETDATE();
+            IF NOT EXISTS (SELECT 1 FROM SesionesRevocadas WHERE Token = %s)
+                INSERT INTO SesionesRevocadas (Token, Expira)
+                VALUES (%s, DATEADD(SECOND, %s, GETDATE()));
+            """
+            await self._bd.execute(query, (sesion.token_id, sesion.token_id, self.max_edad))
+        if sesion is not None:
+            self._cache.set(token, _CERRADA, self.max_edad)
+        return sesion
+
+
+def token_de_peticion(request):
+    # Se acepta la cookie de sesión o una cabecera "Authorization: Bearer <token>"
+    autorizacion = request.headers.get("authorization")
+    if autorizacion and autorizacion[:7].lower() == "bearer ":
+        return autorizacion[7:].strip()
+    return request.cookies.get(COOKIE_SESION)
+
+
+def token_de_scope(scope):
+    # Igual que token_de_peticion, leyendo las cabeceras ASGI sin construir un Request
+    cookies = None
+    for nombre, valor in scope["headers"]:
+        if nombre == b"authorization":
+            if valor[:7].lower() == b"bearer ":
+                return valor[7:].strip().decode("latin-1")
+        elif nombre == b"cookie":
+            cookies = valor
+    if cookies is None:
+        return None
+    for cookie in cookies.decode("latin-1").split(";"):
+        nombre, _, valor = cookie.partition("=")
+        if nombre.strip() == COOKIE_SESION:
+            return valor.strip().strip('"') or None
+    return None
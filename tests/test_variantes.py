@@ -0,0 +1,26 @@
+import asyncio
+
+from PIL import Image
+
+from variantes import ServicioVariantes
+
+
+def test_generar_dos_veces_no_repite_anchos(tmp_path):
+    carpeta = tmp_path / "variantes"
+    carpeta.mkdir()
+    Image.new("RGB", (800, 600), "red").save(tmp_path / "abc.png")
+    servicio = ServicioVariantes(carpeta=str(carpeta), anchos=[160, 480], formatos=["webp"], workers=1)
+
+    async def generar_dos_veces():
+        await servicio.generar("abc.png")
+        await servicio.generar("abc.png")
+
+    try:
+        asyncio.run(generar_dos_veces())
+    finally:
+        servicio.cerrar()
+
+    srcset = servicio.srcset("abc.png")["webp"]
+    entradas = [entrada.split()[-1] for entrada in srcset.split(", ")]
+    assert entradas == ["160w", "480w"]
+    assert servicio.tiene_variantes("abc.png")
@@ -0,0 +1,182 @@
+import os
+import re
+import time
+import asyncio
+import tempfile
+import multiprocessing
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+from PIL import Image, ImageOps, features
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuración de las variantes de imagen
+# Anchos máximos de cada variante: miniatura, tarjeta del catálogo y detalle
+IMAGE_VARIANT_WIDTHS = [int(ancho) for ancho in os.getenv('IMAGE_VARIANT_WIDTHS', '160,480,1200').split(',')]
+IMAGE_VARIANT_FORMATS = os.getenv('IMAGE_VARIANT_FORMATS', 'avif,webp').split(',')  # En orden de preferencia
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', '2'))
+IMAGE_VARIANT_BACKFILL = os.getenv('IMAGE_VARIANT_BACKFILL', 'true').lower() == 'true'  # Generar al arrancar las que falten
+CARPETA_VARIANTES = os.path.join("imgs", "variantes")
+
+# Calidad de codificación por formato
+CALIDAD = {"webp": 80, "avif": 55}
+_PATRON_VARIANTE = re.compile(r"^(?P<base>.+)-(?P<ancho>\d+)w\.(?P<formato>[a-z0-9]+)$")
+_REVISAR_FALTANTES = 30  # Segundos antes de volver a buscar en disco las variantes de una imagen sin ellas
+
+
+def formatos_disponibles(formatos=IMAGE_VARIANT_FORMATS):
+    # AVIF solo si Pillow se compiló con soporte
+    return [formato for formato in formatos if formato in CALIDAD and features.check(formato)]
+
+
+# Esta función corre dentro de los procesos del pool
+def _generar(ruta_original, carpeta, anchos, formatos):
+    base = os.path.splitext(os.path.basename(ruta_original))[0]
+    generadas = []
+    with Image.open(ruta_original) as imagen:
+        imagen = ImageOps.exif_transpose(imagen)
+        if imagen.mode not in ("RGB", "RGBA"):
+            imagen = imagen.convert("RGBA" if "transparency" in imagen.info or imagen.mode in ("LA", "PA") else "RGB")
+        # Nunca se amplía: si la original es más chica, los anchos repetidos se generan una vez
+        for ancho in sorted({min(ancho, imagen.width) for ancho in anchos}):
+            alto = max(1, round(imagen.height * ancho / imagen.width))
+            reducida = imagen if ancho == imagen.width else imagen.resize((ancho, alto), Image.LANCZOS)
+            for formato in formatos:
+                nombre = f"{base}-{ancho}w.{formato}"
+                descriptor, temporal = tempfile.mkstemp(dir=carpeta, prefix=".variante-")
+                try:
+                    with os.fdopen(descriptor, "wb") as destino:
+                        reducida.save(destino, format=formato.upper(), quality=CALIDAD[formato])
+                    os.replace(temporal, os.path.join(carpeta, nombre))
+                except BaseException:
+                    os.unlink(temporal)
+                    raise
+                generadas.append(nombre)
+    return generadas
+
+
+class ServicioVariantes:
+    """Versiones reducidas (WebP/AVIF) de las imágenes de productos, en un pool de procesos.
+
+    Las variantes se guardan en ``imgs/variantes`` como
+    ``<original>-<ancho>w.<formato>``, así que el nombre basta para armar
+    un srcset. ``srcset(imagen)`` responde solo desde un índice en memoria;
+    si una imagen no tiene variantes, cada pocos segundos se vuelve a mirar
+    el disco en un hilo aparte (por si otro worker ya las generó) y lo que
+    aparezca se usa desde la siguiente llamada.
+    """
+
+    def __init__(self, carpeta=CARPETA_VARIANTES, anchos=IMAGE_VARIANT_WIDTHS,
+                 formatos=None, workers=IMAGE_VARIANT_WORKERS):
+        self.carpeta = carpeta
+        self.anchos = anchos
+        self.formatos = formatos_disponibles() if formatos is None else formatos
+        self.workers = workers
+        self._ejecutor = None
+        self._indice = {}  # imagen original -> {formato: {ancho: nombre}}
+        self._faltantes = {}  # imagen original -> time.monotonic() de la última búsqueda sin éxito
+        self._en_curso = {}
+        self._revisiones = {}  # imagen original -> tarea que busca sus variantes en disco
+        self._indice_cargado = False
+
+    def iniciar(self):
+        os.makedirs(self.carpeta, exist_ok=True)
+        if self._ejecutor is None:
+            # 'spawn' evita heredar los hilos del proceso principal (pool de base de datos)
+            self._ejecutor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        if not self._indice_cargado:
+            self._cargar_indice(os.listdir(self.carpeta))
+            self._indice_cargado = True
+
+    def cerrar(self):
+        if self._ejecutor is not None:
+            self._ejecutor.shutdown(wait=True, cancel_futures=True)
+            self._ejecutor = None
+
+    def _cargar_indice(self, nombres):
+        for nombre in nombres:
+            coincidencia = _PATRON_VARIANTE.match(nombre)
+            if coincidencia is None or coincidencia["formato"] not in self.formatos:
+                continue
+            imagen = coincidencia["base"]
+            por_formato = self._indice.setdefault(imagen, {})
+            # Por ancho: volver a generar la misma imagen reemplaza la entrada en lugar de repetirla
+            por_formato.setdefault(coincidencia["formato"], {})[int(coincidencia["ancho"])] = nombre
+            self._faltantes.pop(imagen, None)
+
+    def tiene_variantes(self, imagen):
+        return os.path.splitext(imagen)[0] in self._indice
+
+    def srcset(self, imagen):
+        """{formato: "url 160w, url 480w, ..."} de una imagen original, o None si aún no tiene variantes."""
+        if not imagen:
+            return None
+        base = os.path.splitext(imagen)[0]
+        por_formato = self._indice.get(base)
+        if por_formato is None:
+            revisada = self._faltantes.get(base)
+            if revisada is not None and time.monotonic() - revisada < _REVISAR_FALTANTES:
+                return None
+            self._faltantes[base] = time.monotonic()
+            # Se llama desde la reconstrucción del catálogo: nada de listar el disco en el event loop
+            if base not in self._revisiones:
+                tarea = asyncio.get_running_loop().create_task(self._revisar(base))
+                self._revisiones[base] = tarea
+                tarea.add_done_callback(lambda _, base=base: self._revisiones.pop(base, None))
+            return None
+        return {
+            formato: ", ".join(f"/{self.carpeta.replace(os.sep, '/')}/{nombre} {ancho}w" for ancho, nombre in sorted(anchos.items()))
+            for formato, anchos in sorted(por_formato.items(), key=lambda item: self.formatos.index(item[0]))
+        }
+
+    async def _revisar(self, base):
+        prefijo = base + "-"
+        try:
+            nombres = await asyncio.to_thread(os.listdir, self.carpeta)
+        except FileNotFoundError:
+            return
+        self._cargar_indice(nombre for nombre in nombres if nombre.startswith(prefijo))
+
+    async def generar(self, imagen):
+        """Genera las variantes de ``imgs/<imagen>`` y devuelve sus nombres."""
+        # Una sola generación por imagen aunque se pida varias veces a la vez
+        if imagen in self._en_curso:
+            return await asyncio.shield(self._en_curso[imagen])
+        self.iniciar()
+        loop = asyncio.get_running_loop()
+        ruta = os.path.join(os.path.dirname(self.carpeta), imagen)
+        tarea = loop.run_in_executor(self._ejecutor, _generar, ruta, self.carpeta, self.anchos, self.formatos)
+        self._en_curso[imagen] = tarea
+        try:
+            generadas = await tarea
+        except BrokenProcessPool:
+            # Un proceso murió: recrear el pool en la próxima llamada
+            self._ejecutor = None
+            raise
+        finally:
+            del self._en_curso[imagen]
+        self._cargar_indice(generadas)
+        return generadas
+
+    async def rellenar(self, imagenes):
+        # Genera, de una en una, las variantes de imágenes subidas antes de existir este servicio
+        generadas = 0
+        for imagen in imagenes:
+            if self.tiene_variantes(imagen) or imagen in self._en_curso:
+                continue
+            try:
+                await self.generar(imagen)
+                generadas += 1
+            except Exception as e:
+                logger.error(f"No se pudieron generar las variantes de {imagen}: {e}")
+        return generadas
+
+
+variantes = ServicioVariantes()